@@ -0,0 +1,211 @@
+"""
+Generador de carga para collector.py.
+
+Levanta el servidor de recolección en un proceso aparte (o usa uno ya corriendo con
+--external) y simula muchas sesiones del navegador a la vez: cada una abre su
+conexión keep-alive, crea la sesión, envía sus ensayos uno por uno (los de una sesión
+compilada de SESSION, con respuestas al azar) con una pausa entre ensayos y la
+cierra. Una fracción de los envíos se repite, como un reintento del navegador.
+
+Reporta la latencia de POST /trials (p50/p99/max, incluye la espera del lote en
+disco), el rendimiento, los lotes escritos y el tiempo de CPU del servidor, y
+verifica cada archivo: columnas de RESULTS, un ensayo por fila y ninguno repetido.
+
+Uso:
+    python bench_collector.py --sessions 300 --think 0.05
+    python bench_collector.py --external --port 8080 --verify --datapath data
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+
+from taskdata import LoadDefinitions, ReadSession
+from taskschedule import CompileSchedule, SessionBlocks
+
+async def Request(reader, writer, method, path, payload=None):
+    """Una solicitud HTTP/1.1 sobre una conexión abierta; devuelve (status, JSON)"""
+    body = b"" if payload is None else json.dumps(payload).encode("utf-8")
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        header = await reader.readline()
+        if header in (b"\r\n", b""):
+            break
+        key, _, value = header.decode("latin-1").partition(":")
+        if key.strip().lower() == "content-length":
+            length = int(value)
+    data = await reader.readexactly(length) if length else b""
+    return status, json.loads(data) if data else None
+
+def SessionRows(schedule, participant, rng):
+    """Filas de RESULTS de una sesión compilada, con respuestas y tiempos al azar"""
+    rows = []
+    for i in range(schedule["stimulus"].size):
+        choice = int(rng.integers(0, 2))
+        rt = float(rng.uniform(300, 1500))
+        rows.append({
+            "id": participant,
+            "phase": int(schedule["phase"][i]),
+            "block": int(schedule["block"][i]),
+            "trial": int(schedule["trial"][i]),
+            "pairs": str(schedule["pair_names"][schedule["pairs"][i]]),
+            "stimulus": str(schedule["cues"][schedule["stimulus"][i]]),
+            "responses": choice,
+            "rts": round(rt),
+            "reward": int(schedule["rewards"][i, choice]),
+            "confidence": int(rng.integers(0, 10)),
+            "rts_raw": round(rt, 1),
+            "steps": [round(float(s), 3) for s in np.sort(rng.uniform(0, rt, size=rng.integers(0, 4)))],
+        })
+    return rows
+
+async def RunSession(host, port, participant, rows, think, retry, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        status, reply = await Request(reader, writer, "POST", "/session", {"id": participant})
+        if status != 200:
+            raise RuntimeError(f"/session: {status} {reply}")
+        session = reply["session"]
+        for row in rows:
+            await asyncio.sleep(random.expovariate(1 / think) if think > 0 else 0)
+            for attempt in range(2 if random.random() < retry else 1):
+                t0 = time.perf_counter()
+                status, reply = await Request(reader, writer, "POST", "/trials", {"session": session, "rows": [row]})
+                latencies.append(time.perf_counter() - t0)
+                if status != 200:
+                    raise RuntimeError(f"/trials: {status} {reply}")
+        status, reply = await Request(reader, writer, "POST", "/end", {"session": session})
+        return session, reply["rows"]
+    finally:
+        writer.close()
+
+async def WaitPort(host, port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.05)
+
+async def Status(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        return (await Request(reader, writer, "GET", "/status"))[1]
+    finally:
+        writer.close()
+
+def Verify(datapath, sessions, columns, expected):
+    """Errores de los archivos escritos (vacío si todo está bien)"""
+    errors = []
+    for session, reported in sessions:
+        data = ReadSession(os.path.join(datapath, f"{session}.csv"))
+        if list(data) != columns:
+            errors.append(f"{session}: columns do not match RESULTS")
+            continue
+        keys = list(zip(data["phase"], data["block"], data["trial"]))
+        if len(keys) != expected or reported != expected:
+            errors.append(f"{session}: {len(keys)} rows on disk, {reported} reported, {expected} expected")
+        if len(set(keys)) != len(keys):
+            errors.append(f"{session}: {len(keys) - len(set(keys))} repeated trials")
+    return errors
+
+async def Bench(args):
+    definitions = LoadDefinitions()
+    columns = list(definitions["RESULTS"])
+    session = definitions["SESSION"]
+    rng = np.random.default_rng(args.seed)
+    random.seed(args.seed)
+
+    server, temporary = None, args.datapath is None and not args.external
+    if temporary:
+        args.datapath = tempfile.mkdtemp(prefix="bench_collector_")
+    elif args.datapath is None and args.verify:
+        raise SystemExit("--verify needs --datapath (the collector's)")
+    elif not args.external and os.path.isdir(args.datapath) and os.listdir(args.datapath):
+        raise SystemExit(f"{args.datapath} is not empty; use an empty or new directory")
+    if not args.external:
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "collector.py")
+        server = await asyncio.create_subprocess_exec(
+            sys.executable, script, "--host", args.host, "--port", str(args.port), "--datapath", args.datapath,
+            "--batch", str(args.batch), "--interval", str(args.interval), stdout=asyncio.subprocess.DEVNULL)
+    try:
+        await WaitPort(args.host, args.port)
+        before = await Status(args.host, args.port)
+        plans = []
+        for i in range(args.sessions):
+            schedule = CompileSchedule(definitions["STIMULUS"], session["items"], SessionBlocks(session),
+                                       seed=int(rng.integers(2**32)))
+            plans.append(SessionRows(schedule, f"WEB{i:04d}", rng)[:args.trials or None])
+        expected = len(plans[0])
+        print(f"{args.sessions} sessions x {expected} trials, think {args.think * 1000:.0f} ms, "
+              f"{args.retry:.0%} retried")
+
+        latencies = []
+        t0 = time.perf_counter()
+        sessions = await asyncio.gather(*(RunSession(args.host, args.port, rows[0]["id"], rows, args.think,
+                                                     args.retry, latencies) for rows in plans))
+        wall = time.perf_counter() - t0
+        after = await Status(args.host, args.port)
+    finally:
+        if server is not None:
+            server.terminate()
+            await server.wait()
+
+    ms = np.array(latencies) * 1000
+    rows = after["rows"] - before["rows"]
+    batches = after["batches"] - before["batches"]
+    cpu = after["cpu_s"] - before["cpu_s"]
+    print(f"  /trials   p50 {np.percentile(ms, 50):6.1f} ms  p99 {np.percentile(ms, 99):6.1f} ms  "
+          f"max {ms.max():6.1f} ms  ({ms.size} requests)")
+    print(f"  {rows} rows in {wall:.1f} s ({rows / wall:.0f} rows/s, {ms.size / wall:.0f} req/s), "
+          f"{after['duplicates'] - before['duplicates']} duplicates dropped")
+    print(f"  {batches} batches (mean {rows / max(batches, 1):.0f} rows, max {after['max_batch']}), "
+          f"{after['write_s'] - before['write_s']:.2f} s writing")
+    print(f"  server CPU {cpu:.1f} s ({cpu / wall:.0%} of one core)")
+
+    errors = Verify(args.datapath, sessions, columns, expected) if not args.external or args.verify else []
+    for error in errors[:10]:
+        print(f"✗ {error}")
+    print("✓ All session files verified" if not errors else f"✗ {len(errors)} session files with errors")
+    if temporary and not args.keep:
+        shutil.rmtree(args.datapath)
+    elif not args.external:
+        print(f"  Session files kept in {args.datapath}")
+    return not errors
+
+def main():
+    parser = argparse.ArgumentParser(description="Generador de carga para el servidor de recolección")
+    parser.add_argument("--sessions", type=int, default=300, help="Sesiones simultáneas")
+    parser.add_argument("--trials", type=int, default=0, help="Ensayos por sesión (0: la sesión completa)")
+    parser.add_argument("--think", type=float, default=0.05, help="Pausa media entre ensayos (s)")
+    parser.add_argument("--retry", type=float, default=0.02, help="Fracción de envíos repetidos")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--datapath", default=None,
+                        help="Directorio vacío para las sesiones (por defecto uno temporal que se borra al terminar)")
+    parser.add_argument("--keep", action="store_true", help="No borrar el directorio temporal")
+    parser.add_argument("--batch", type=int, default=256)
+    parser.add_argument("--interval", type=float, default=0.2)
+    parser.add_argument("--external", action="store_true", help="Usar un collector.py ya corriendo")
+    parser.add_argument("--verify", action="store_true", help="Verificar archivos también con --external")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    if not asyncio.run(Bench(args)):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,319 @@
+"""
+Benchmark de latencia de marcadores sin el equipo del laboratorio.
+
+Envía la secuencia de MARKERS de una sesión completa (la misma que produce RunTask
+con la sesión compilada) a través de send_trigger_unified y del despachador del
+script principal, con sustitutos locales de cada sistema:
+
+    EEG         stream LSL real leído por un StreamInlet en un hilo (loopback)
+    Eyetracker  servidor HTTP local que imita /api/event y /api/status de la
+                realtime API de Pupil Labs, con latencia configurable y un corte
+                opcional de la conexión; el envío usa Device real
+    Shimmer     puntero sin efecto que solo registra el momento del clic
+
+Reporta el costo de levantar cada marcador (lo que paga el ciclo de frames), la
+latencia de entrega por sistema (p50/p99/max) y el desfase entre sistemas por código.
+La latencia de cada sistema se mide en su propio reloj (LSL, Unix, perf_counter)
+respecto del timestamp tomado al levantar el marcador. Corre sin pantalla.
+
+Uso:
+    python bench_markers.py --interval 0.02 --pupil-latency 5 --out bench.csv
+    python bench_markers.py --sinks Eyetracker --pupil-outage 2 3
+"""
+import argparse
+import asyncio
+import contextlib
+import csv
+import json
+import os
+import threading
+import time
+import numpy as np
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from taskdata import ImportTask
+from taskschedule import CompileSchedule, SessionBlocks
+
+SINKS = ("EEG", "Eyetracker", "Shimmer")
+
+def SessionMarkers(task, schedule):
+    """
+    Secuencia (código, posición Shimmer o None) de una sesión completa, en el orden
+    en que la levantan RunTask, LoadStimulus, MainLoopTask y PauseTask, con los
+    bloques compilados de SESSION.
+    """
+    M = task.MARKERS
+    task.SCHEDULE.update(schedule)
+    markers = [(M["EXPERIMENT_START"], None)]
+    for entry in task.CompilePlan():
+        markers.append(entry["start"])
+        for row in entry["rows"]:
+            reward = schedule["rewards"][row, schedule["choice_init"][row]]
+            confidence = M["CONFIDENCE_0"] + int(schedule["confidence_init"][row])
+            markers += [(M["STIM_START"], None), (M["STIM_RESPONSE"], None),
+                        (M["CONFIDENCE_START"], None), (confidence, None),
+                        (M["FEEDBACK_CORRECT"] if reward else M["FEEDBACK_INCORRECT"], None)]
+        markers.append(entry["end_marker"])
+    markers.append((M["EXPERIMENT_END"], None))
+    return markers
+
+class FakePupil:
+    """Servidor HTTP mínimo con las rutas /api/event y /api/status de la realtime API"""
+    STATUS = [
+        {"model": "Phone", "data": {"battery_level": 100, "battery_state": "OK", "device_id": "fake",
+                                    "device_name": "FakePupil", "ip": "127.0.0.1", "memory": 0,
+                                    "memory_state": "OK", "time_echo_port": None}},
+        {"model": "Recording", "data": {"action": "START", "id": "fake", "message": "", "rec_duration_ns": 0}},
+    ]
+
+    def __init__(self, latency=0.0, jitter=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = np.random.default_rng(seed)
+        self.received = []   # (nombre, timestamp del evento, llegada) en ns Unix
+        self.server = None
+        self.port = 0
+        self.writers = set()
+
+    async def Start(self):
+        self.server = await asyncio.start_server(self.Handle, "127.0.0.1", self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def Stop(self):
+        self.server.close()
+        for writer in list(self.writers):
+            writer.close()
+        await self.server.wait_closed()
+
+    async def Outage(self, start, duration):
+        """Corta el servidor y las conexiones abiertas durante duration s, desde start s"""
+        await asyncio.sleep(start)
+        await self.Stop()
+        await asyncio.sleep(duration)
+        await self.Start()
+
+    async def Handle(self, reader, writer):
+        self.writers.add(writer)
+        try:
+            while True:
+                request = await reader.readline()
+                if not request:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode().partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                arrival = time.time_ns()
+                method, path = request.decode().split()[:2]
+                if method == "POST" and path == "/api/event":
+                    event = json.loads(body)
+                    timestamp = event.get("timestamp", arrival)
+                    self.received.append((event["name"], timestamp, arrival))
+                    status, payload = "200 OK", {"message": "Event sent",
+                                                 "result": {"recording_id": None, "timestamp": timestamp}}
+                elif method == "GET" and path == "/api/status":
+                    status, payload = "200 OK", {"message": "Success", "result": self.STATUS}
+                else:
+                    status, payload = "404 Not Found", {"message": f"{path} not available", "result": None}
+                delay = self.latency + self.jitter * self.rng.standard_normal()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                content = json.dumps(payload).encode()
+                writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(content)}\r\nConnection: keep-alive\r\n\r\n".encode() + content)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+class InletReader(threading.Thread):
+    """Consumidor LSL del TriggerStream en un hilo: (código, timestamp, llegada) en reloj LSL"""
+    def __init__(self, pylsl, timeout=5.0):
+        super().__init__(daemon=True)
+        self.pylsl = pylsl
+        streams = pylsl.resolve_byprop("name", "TriggerStream", timeout=timeout)
+        if not streams:
+            raise RuntimeError("TriggerStream not found")
+        self.inlet = pylsl.StreamInlet(streams[0])
+        self.inlet.open_stream(timeout=timeout)
+        self.received = []
+        self.stop = threading.Event()
+
+    def run(self):
+        while not self.stop.is_set():
+            sample, timestamp = self.inlet.pull_sample(timeout=0.1)
+            if sample is not None:
+                self.received.append((sample[0], timestamp, self.pylsl.local_clock()))
+
+class NullPointer:
+    """Sustituto de pyautogui: no mueve el mouse, solo registra el clic (perf_counter)"""
+    def __init__(self):
+        self.clicks = []
+
+    def position(self):
+        return (0, 0)
+
+    def moveTo(self, x, y, duration=0.0):
+        pass
+
+    def click(self):
+        self.clicks.append(time.perf_counter())
+
+def Percentiles(values):
+    values = np.asarray(values, dtype=float)
+    if values.size == 0:
+        return (np.nan, np.nan, np.nan)
+    return (np.percentile(values, 50), np.percentile(values, 99), values.max())
+
+async def RunBenchmark(task, markers, interval=0.02, pupil_latency=0.0, pupil_jitter=0.0,
+                       sinks=SINKS, seed=None, pupil_outage=None):
+    """
+    Conecta los sustitutos habilitados, levanta la secuencia de marcadores con el
+    intervalo dado y devuelve (raised, latencies): raised es una lista de
+    (seq, código, Now(), costo en s) y latencies[sink] un arreglo de latencias en s por
+    marcador (NaN si ese sistema no lo recibe). pupil_outage: (inicio, duración) en s
+    de un corte del servidor Pupil.
+    """
+    for sink in SINKS:
+        task.BACKENDS[sink]["enabled"] = sink in sinks
+
+    inlet = None
+    if await task.StartupStep("EEG (LSL)", task.CreateOutlet):
+        inlet = InletReader(task.pylsl)
+        inlet.start()
+
+    pupil = None
+    if task.LoadBackend("Eyetracker"):
+        pupil = FakePupil(pupil_latency, pupil_jitter, seed)
+        await pupil.Start()
+        task.pupil_device = task.realtime_api.Device("127.0.0.1", pupil.port)
+        if pupil_outage is not None:
+            outage = asyncio.create_task(pupil.Outage(*pupil_outage))
+
+    pointer = None
+    if "Shimmer" in sinks:
+        pointer = NullPointer()
+        task.pyautogui = pointer
+        task.SHIMMER_ENABLED = True
+    else:
+        task.SHIMMER_ENABLED = False
+
+    task.StartDispatcher()
+    raised = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for code, shimmer_position in markers:
+            t0 = time.perf_counter()
+            await task.send_trigger_unified(code, include_shimmer=shimmer_position is not None,
+                                            shimmer_position=shimmer_position)
+            cost = time.perf_counter() - t0
+            raised.append(task.DISPATCHER["last"] + (cost,))
+            await asyncio.sleep(interval)
+        if task.PUPIL["reconnect"] is not None:
+            # Dar tiempo a reconectar y reenviar lo retenido durante el corte
+            await asyncio.wait([task.PUPIL["reconnect"]], timeout=30.0)
+        await task.StopDispatcher(timeout=30.0)
+
+    n = len(markers)
+    latencies = {sink: np.full(n, np.nan) for sink in SINKS}
+    if inlet is not None:
+        deadline = time.perf_counter() + 5.0
+        while len(inlet.received) < n and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+        inlet.stop.set()
+        inlet.join()
+        # LSL y Pupil reciben todos los marcadores en orden (colas FIFO)
+        for i, (code, timestamp, arrival) in enumerate(inlet.received[:n]):
+            latencies["EEG"][i] = arrival - timestamp
+    if pupil is not None:
+        if pupil_outage is not None:
+            await outage
+        await task.pupil_device.close()
+        await pupil.Stop()
+        for i, (name, timestamp, arrival) in enumerate(pupil.received[:n]):
+            latencies["Eyetracker"][i] = (arrival - timestamp) / 1e9
+    if pointer is not None:
+        # Shimmer solo recibe los marcadores con posición, también en orden
+        clicked = [i for i, (code, position) in enumerate(markers) if position is not None]
+        for i, click in zip(clicked, pointer.clicks):
+            latencies["Shimmer"][i] = click - raised[i][2]
+    return raised, latencies
+
+def Report(task, markers, raised, latencies):
+    names = {code: name for name, code in task.MARKERS.items()}
+    cost = [r[3] for r in raised]
+    print(f"\n{'stage':<12} {'n':>6} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9} {'errors':>7}")
+    p50, p99, peak = Percentiles(cost)
+    print(f"{'raise':<12} {len(cost):>6} {p50 * 1e3:>9.3f} {p99 * 1e3:>9.3f} {peak * 1e3:>9.3f} {'-':>7}")
+    for sink in SINKS:
+        values = latencies[sink][~np.isnan(latencies[sink])]
+        if values.size == 0:
+            error = task.BACKENDS[sink]["error"] or "disabled"
+            print(f"{sink:<12} {'-':>6}  {error}")
+            continue
+        p50, p99, peak = Percentiles(values)
+        errors = task.DISPATCHER["errors"].get(sink, 0)
+        print(f"{sink:<12} {values.size:>6} {p50 * 1e3:>9.3f} {p99 * 1e3:>9.3f} {peak * 1e3:>9.3f} {errors:>7}")
+
+    P = task.PUPIL
+    if P["failures"]:
+        print(f"\nPupil outages: {P['failures']}, reconnect attempts: {P['attempts']}, "
+              f"replayed: {P['replayed']}, dropped: {P['dropped']}, unsent: {len(P['buffer'])}, "
+              f"offline: {P['downtime']:.2f} s")
+
+    # Desfase entre sistemas: diferencia entre la entrega más tardía y la más temprana
+    table = np.column_stack([latencies[sink] for sink in SINKS])
+    received = (~np.isnan(table)).sum(axis=1)
+    skew = np.where(received >= 2, np.nanmax(table, axis=1) - np.nanmin(table, axis=1), np.nan)
+    codes = np.array([code for code, _ in markers])
+    if np.isnan(skew).all():
+        return
+    print(f"\n{'code':>4} {'marker':<20} {'n':>5} {'skew p50':>9} {'p99':>9} {'max ms':>9}")
+    for code in sorted(set(codes.tolist())):
+        values = skew[(codes == code) & ~np.isnan(skew)]
+        if values.size == 0:
+            continue
+        p50, p99, peak = Percentiles(values)
+        print(f"{code:>4} {names.get(code, '?'):<20} {values.size:>5} {p50 * 1e3:>9.3f} {p99 * 1e3:>9.3f} {peak * 1e3:>9.3f}")
+
+def SaveBenchmark(path, markers, raised, latencies):
+    with open(path, "w", newline="") as file:
+        w = csv.writer(file, delimiter=';')
+        w.writerow(["seq", "code", "shimmer_position", "raise_us"] + [f"{sink}_ms" for sink in SINKS])
+        for (code, position), (seq, _, _, cost), *values in zip(markers, raised, *(latencies[s] for s in SINKS)):
+            w.writerow([seq, code, position or "", f"{cost * 1e6:.1f}"] +
+                       ["" if np.isnan(v) else f"{v * 1e3:.3f}" for v in values])
+
+def main():
+    parser = argparse.ArgumentParser(description="Latencia de marcadores con sustitutos locales de EEG/ET/Shimmer")
+    parser.add_argument("--interval", type=float, default=0.02, help="Segundos entre marcadores")
+    parser.add_argument("--pupil-latency", type=float, default=0.0, help="Latencia del servidor Pupil (ms)")
+    parser.add_argument("--pupil-jitter", type=float, default=0.0, help="Desviación de la latencia Pupil (ms)")
+    parser.add_argument("--pupil-outage", type=float, nargs=2, metavar=("START", "DURATION"), default=None,
+                        help="Cortar el servidor Pupil durante DURATION s a partir de START s")
+    parser.add_argument("--sinks", nargs="+", choices=SINKS, default=list(SINKS))
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--out", default=None, help="CSV con la latencia de cada marcador")
+    args = parser.parse_args()
+
+    task = ImportTask()
+    schedule = CompileSchedule(task.STIMULUS, task.SESSION["items"], SessionBlocks(task.SESSION), args.seed)
+    markers = SessionMarkers(task, schedule)
+    print(f"Sending {len(markers)} markers every {args.interval * 1e3:.0f} ms "
+          f"to {', '.join(args.sinks)}...")
+    raised, latencies = asyncio.run(RunBenchmark(task, markers, args.interval, args.pupil_latency / 1e3,
+                                                 args.pupil_jitter / 1e3, args.sinks, args.seed, args.pupil_outage))
+    Report(task, markers, raised, latencies)
+    if args.out:
+        SaveBenchmark(args.out, markers, raised, latencies)
+        print(f"\nSaved {args.out}")
+
+if __name__ == '__main__':
+    main()
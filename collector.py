@@ -0,0 +1,372 @@
+"""
+Servidor de recolección para la versión web de la tarea (text.js).
+
+Un único proceso de asyncio recibe por HTTP los ensayos de muchas sesiones del
+navegador a la vez y los escribe en <id>_data_<timestamp>.csv con las mismas
+columnas, separador y orden que SaveOutputs, así los análisis (taskdata,
+study_index, fit_models) leen las sesiones web igual que las del laboratorio.
+
+Las filas no se escriben al llegar: se acumulan por sesión y un escritor las vuelca
+en lotes (cada --interval segundos o al juntar --batch filas), agrupadas por archivo,
+fuera del loop (en un hilo) para no frenar la recepción. Cada POST /trials responde
+recién cuando su lote quedó escrito, así una respuesta 200 significa que los ensayos
+están en disco. Los ensayos repetidos (mismo phase, block y trial, p. ej. un
+reintento del navegador) se descartan.
+
+Protocolo (JSON sobre HTTP/1.1 con keep-alive; CORS abierto para el navegador):
+
+    POST /session  {"id": "P01"}                                 -> {"session": "P01_data_<timestamp>"}
+    POST /trials   {"session": ..., "rows": [{columna: valor}]}  -> {"written": n, "duplicates": m}
+    POST /end      {"session": ...}                              -> {"rows": total}
+    GET  /status                                                 -> contadores del servidor
+
+Las columnas de cada fila son las de RESULTS (phase, block y trial obligatorias; id
+se completa con el de la sesión); las listas (steps, conf_steps) se unen con ",".
+
+Uso:
+    python collector.py --port 8080 --datapath data
+"""
+import argparse
+import asyncio
+import contextlib
+import csv
+import json
+import os
+import re
+import signal
+import time
+from datetime import datetime
+
+from taskdata import LoadDefinitions, ReadSession
+
+MAX_BODY = 1 << 20        # bytes por solicitud
+KEEPALIVE_S = 60.0        # Conexión sin solicitudes por más de esto: se cierra
+IDLE_S = 600.0            # Sesión sin ensayos por más de esto: se cierra su archivo
+ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+SESSION_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}_data_[0-9-]+")
+KEYS = ("phase", "block", "trial")
+
+REASONS = {200: "OK", 204: "No Content", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+CORS = ("Access-Control-Allow-Origin: *\r\n"
+        "Access-Control-Allow-Methods: GET, POST, OPTIONS\r\n"
+        "Access-Control-Allow-Headers: Content-Type\r\n")
+
+def Response(status, payload=None, keep_alive=True):
+    body = b"" if payload is None else json.dumps(payload).encode("utf-8")
+    head = (f"HTTP/1.1 {status} {REASONS[status]}\r\n{CORS}"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode("latin-1") + body
+
+def FormatValue(value):
+    """Valor de una celda como lo escribe SaveOutputs (listas unidas con ",")"""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, list):
+        return ",".join(str(v) for v in value)
+    return value
+
+class Collector:
+    def __init__(self, datapath, columns, batch=256, interval=0.2, fsync=False):
+        self.datapath = datapath
+        self.columns = list(columns)
+        self.batch = batch
+        self.interval = interval
+        self.fsync = fsync
+        self.sessions = {}      # nombre -> {"id", "file", "writer", "keys", "rows", "last"}
+        self.pending = {}       # nombre -> (clave, fila) que esperan el próximo lote
+        self.closing = set()    # Sesiones a cerrar después del próximo lote
+        self.pending_rows = 0
+        self.done = None        # Future que se resuelve al escribir el lote en curso
+        self.wake = asyncio.Event()
+        self.full = asyncio.Event()
+        self.stopping = False
+        self.handlers = set()   # Tareas de las conexiones abiertas
+        self.stats = {"connections": 0, "requests": 0, "errors": 0, "sessions": 0, "rows": 0,
+                      "duplicates": 0, "batches": 0, "write_s": 0.0, "max_batch": 0}
+        self.started = time.perf_counter()
+        self.cpu = time.process_time()
+
+    # SESIONES
+
+    def NewSession(self, participant):
+        if not isinstance(participant, str) or not ID_PATTERN.fullmatch(participant):
+            raise ValueError("id must be 1-64 letters, digits, '_' or '-'")
+        stamp = datetime.now().strftime('%Y-%m-%d-%H-%M-%S')
+        name, n = f"{participant}_data_{stamp}", 1
+        while name in self.sessions or os.path.exists(os.path.join(self.datapath, name + ".csv")):
+            name, n = f"{participant}_data_{stamp}-{n}", n + 1
+        self.sessions[name] = {"id": participant, "file": None, "writer": None, "keys": set(),
+                               "rows": 0, "last": time.monotonic()}
+        self.stats["sessions"] += 1
+        return name
+
+    async def GetSession(self, name):
+        """Sesión activa, o una anterior al reinicio del servidor que sigue en disco"""
+        if name in self.sessions:
+            return self.sessions[name]
+        if not isinstance(name, str) or not SESSION_PATTERN.fullmatch(name):
+            raise KeyError(name)
+        path = os.path.join(self.datapath, f"{name}.csv")
+        if not os.path.exists(path):
+            raise KeyError(name)
+        columns = await asyncio.to_thread(ReadSession, path)
+        if list(columns) != self.columns:
+            raise ValueError(f"{name}.csv columns do not match RESULTS")
+        keys = {tuple(int(columns[key][i]) for key in KEYS) for i in range(len(columns["trial"]))}
+        session = {"id": columns["id"][0] if columns["id"] else name.split("_data_")[0], "file": None,
+                   "writer": None, "keys": keys, "rows": len(keys), "last": time.monotonic()}
+        return self.sessions.setdefault(name, session)
+
+    def ParseRow(self, session, row):
+        """Fila JSON a lista en el orden de RESULTS; (phase, block, trial) para descartar repetidos"""
+        if not isinstance(row, dict):
+            raise ValueError("each row must be an object")
+        unknown = set(row) - set(self.columns)
+        if unknown:
+            raise ValueError(f"unknown columns: {', '.join(sorted(unknown))}")
+        try:
+            key = tuple(int(row[k]) for k in KEYS)
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"rows need integer {', '.join(KEYS)}")
+        if row.setdefault("id", session["id"]) != session["id"]:
+            raise ValueError(f"row id {row['id']!r} does not match session id {session['id']!r}")
+        return key, [FormatValue(row.get(column)) for column in self.columns]
+
+    async def AddTrials(self, name, rows):
+        session = await self.GetSession(name)
+        if not isinstance(rows, list):
+            raise ValueError("rows must be a list")
+        parsed = [self.ParseRow(session, row) for row in rows]   # Todo o nada
+        accepted = []
+        for key, values in parsed:
+            if key in session["keys"]:
+                continue
+            session["keys"].add(key)
+            accepted.append((key, values))
+        session["last"] = time.monotonic()
+        duplicates = len(parsed) - len(accepted)
+        self.stats["duplicates"] += duplicates
+        if accepted:
+            session["rows"] += len(accepted)
+            await self.Enqueue(name, accepted)
+        return {"written": len(accepted), "duplicates": duplicates}
+
+    async def EndSession(self, name):
+        session = await self.GetSession(name)
+        self.closing.add(name)
+        await self.Enqueue(name, [])
+        return {"rows": session["rows"]}
+
+    # ESCRITURA POR LOTES
+
+    async def Enqueue(self, name, rows):
+        """Agrega filas al lote en curso y espera a que ese lote quede escrito"""
+        if self.done is None:
+            self.done = asyncio.get_running_loop().create_future()
+        done = self.done
+        self.pending.setdefault(name, []).extend(rows)
+        self.pending_rows += len(rows)
+        self.wake.set()
+        if self.pending_rows >= self.batch:
+            self.full.set()
+        await asyncio.shield(done)
+
+    def Commit(self, groups, closing):
+        """Escribe un lote, agrupado por archivo (corre en un hilo)"""
+        for name, rows in groups.items():
+            session = self.sessions[name]
+            if session["file"] is None:
+                session["file"] = open(os.path.join(self.datapath, f"{name}.csv"), 'a', newline="")
+                session["writer"] = csv.writer(session["file"], delimiter=';')
+                if session["file"].tell() == 0:
+                    session["writer"].writerow(self.columns)
+            session["writer"].writerows(values for key, values in rows)
+            session["file"].flush()
+            if self.fsync:
+                os.fsync(session["file"].fileno())
+        for name in closing:
+            session = self.sessions[name]
+            if session["file"] is not None:
+                session["file"].close()
+                session["file"], session["writer"] = None, None
+
+    async def Writer(self):
+        """
+        Vuelca el lote en curso cada interval segundos o al llegar a batch filas. Al
+        detener el servidor escribe lo pendiente sin esperar y termina.
+        """
+        while True:
+            if not self.stopping:
+                await self.wake.wait()
+            if not self.stopping:
+                try:
+                    await asyncio.wait_for(self.full.wait(), timeout=self.interval)
+                except asyncio.TimeoutError:
+                    pass
+            if self.stopping and not self.pending and not self.closing:
+                return
+            groups, done, closing = self.pending, self.done, self.closing
+            self.pending, self.done, self.closing, self.pending_rows = {}, None, set(), 0
+            self.wake.clear()
+            self.full.clear()
+            closing |= {name for name, s in self.sessions.items()
+                        if time.monotonic() - s["last"] > IDLE_S and name not in groups}
+            rows = sum(len(r) for r in groups.values())
+            t0 = time.perf_counter()
+            try:
+                await asyncio.to_thread(self.Commit, groups, closing)
+            except Exception as e:
+                print(f"✗ Batch of {rows} rows failed: {e}")
+                self.stats["errors"] += 1
+                for name, rows in groups.items():   # Un reintento del navegador no es un repetido
+                    self.sessions[name]["keys"] -= {key for key, values in rows}
+                    self.sessions[name]["rows"] -= len(rows)
+                if done is not None:
+                    done.set_exception(e)
+                continue
+            self.stats["write_s"] += time.perf_counter() - t0
+            self.stats["batches"] += 1
+            self.stats["rows"] += rows
+            self.stats["max_batch"] = max(self.stats["max_batch"], rows)
+            for name in closing:
+                if name not in self.pending:   # Si llegaron filas mientras tanto, se reabre
+                    self.sessions.pop(name, None)
+            if done is not None:
+                done.set_result(None)
+
+    async def Shutdown(self, server, writer):
+        """
+        Detiene el servidor: deja de aceptar conexiones, espera a que el escritor
+        vuelque el último lote (sin cancelar una escritura en curso), cancela las
+        conexiones que siguen abiertas y cierra los archivos.
+        """
+        server.close()
+        self.stopping = True
+        self.wake.set()
+        self.full.set()
+        await writer
+        for task in self.handlers:
+            task.cancel()
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+        self.CloseAll()
+
+    def CloseAll(self):
+        """Escribe lo pendiente y cierra todos los archivos (al detener el servidor)"""
+        if self.pending:
+            self.Commit(self.pending, set())
+            self.stats["rows"] += self.pending_rows
+            self.pending, self.pending_rows = {}, 0
+        for session in self.sessions.values():
+            if session["file"] is not None:
+                session["file"].close()
+        self.sessions.clear()
+
+    def Status(self):
+        wall = time.perf_counter() - self.started
+        return dict(self.stats, open=len(self.sessions), pending=self.pending_rows,
+                    uptime_s=wall, cpu_s=time.process_time() - self.cpu)
+
+    # HTTP
+
+    async def Route(self, method, target, body):
+        path = target.split("?", 1)[0]
+        if method == "OPTIONS":
+            return 204, None
+        if method == "GET" and path == "/status":
+            return 200, self.Status()
+        if method != "POST" or path not in ("/session", "/trials", "/end"):
+            return (405 if path in ("/session", "/trials", "/end", "/status") else 404), {"error": f"{method} {path}"}
+        try:
+            payload = json.loads(body or b"{}")
+            if not isinstance(payload, dict):
+                raise ValueError("body must be a JSON object")
+            if path == "/session":
+                return 200, {"session": self.NewSession(payload.get("id"))}
+            if path == "/trials":
+                return 200, await self.AddTrials(payload.get("session"), payload.get("rows"))
+            return 200, await self.EndSession(payload.get("session"))
+        except KeyError as e:
+            return 404, {"error": f"unknown session {e.args[0]!r}"}
+        except (ValueError, TypeError) as e:
+            return 400, {"error": str(e)}
+        except OSError as e:
+            return 500, {"error": f"could not write: {e}"}
+
+    async def Handle(self, reader, writer):
+        """Una conexión: solicitudes HTTP/1.1 en serie mientras siga abierta"""
+        self.stats["connections"] += 1
+        task = asyncio.current_task()
+        self.handlers.add(task)
+        try:
+            while True:
+                line = await asyncio.wait_for(reader.readline(), timeout=KEEPALIVE_S)
+                if not line:
+                    break
+                method, target, version = line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = header.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY:
+                    writer.write(Response(413, {"error": f"body over {MAX_BODY} bytes"}, keep_alive=False))
+                    await writer.drain()
+                    break
+                body = await reader.readexactly(length) if length else b""
+                self.stats["requests"] += 1
+                status, payload = await self.Route(method, target, body)
+                if status >= 400:
+                    self.stats["errors"] += 1
+                writer.write(Response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            pass   # Cierre del servidor (Shutdown); terminar sin propagar la cancelación
+        finally:
+            self.handlers.discard(task)
+            writer.close()
+
+async def Serve(args):
+    columns = LoadDefinitions()["RESULTS"]
+    os.makedirs(args.datapath, exist_ok=True)
+    collector = Collector(args.datapath, columns, args.batch, args.interval, args.fsync)
+    server = await asyncio.start_server(collector.Handle, args.host, args.port, backlog=1024)
+    writer = asyncio.create_task(collector.Writer())
+    stop = asyncio.Event()
+    with contextlib.suppress(NotImplementedError):   # Windows: Ctrl+C cancela Serve
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            asyncio.get_running_loop().add_signal_handler(signum, stop.set)
+    print(f"✓ Collecting into {args.datapath} on http://{args.host}:{args.port}", flush=True)
+    try:
+        await stop.wait()
+    finally:
+        await collector.Shutdown(server, writer)
+        print(f"✓ Collector stopped: {collector.stats['sessions']} sessions, {collector.stats['rows']} rows")
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de recolección de ensayos de la versión web")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--datapath", default=os.path.join(os.path.abspath(os.curdir), "data"))
+    parser.add_argument("--batch", type=int, default=256, help="Filas que disparan la escritura del lote")
+    parser.add_argument("--interval", type=float, default=0.2, help="Espera máxima de un lote (s)")
+    parser.add_argument("--fsync", action="store_true", help="fsync de cada archivo en cada lote")
+    args = parser.parse_args()
+    try:
+        asyncio.run(Serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
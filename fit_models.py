@@ -0,0 +1,170 @@
+"""
+Ajuste por participante de un modelo de Q-learning con softmax (tasa de aprendizaje
+alpha y temperatura inversa beta) sobre todas las sesiones del directorio de datos.
+
+Cada archivo se ajusta en un proceso del pool. La verosimilitud se evalúa para una
+grilla completa de parámetros a la vez (vectorizada) y el mejor punto se refina con
+scipy.optimize. Los resultados se guardan en un cache indexado por el hash del
+archivo, de modo que al repetir solo se ajustan sesiones nuevas o modificadas.
+
+Uso:
+    python fit_models.py --datapath data --workers 4 --out fits.csv
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from taskdata import FindSessions, ReadSession, ToArray
+from sessionstore import OpenSession, ReadHeader, Categories, Missing
+
+CACHE_FILE = "fits_cache.json"
+MODEL_VERSION = 1   # Cambiar si se modifica el modelo para invalidar el cache
+
+ALPHA_GRID = np.linspace(0.01, 1.0, 50)
+BETA_GRID = np.logspace(-1, 1.5, 50)
+
+def FileHash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def CountRows(path):
+    """Filas de datos de un CSV de sesión (líneas sin el encabezado)"""
+    lines = 0
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            lines += chunk.count(b"\n")
+    return max(lines - 1, 0)
+
+def CurrentColumns(path):
+    """
+    Archivo .col de la sesión si está al día con el CSV. El .col se escribe al
+    terminar cada bloque y al salir; tras una caída o al retomar a mitad de bloque
+    tiene menos filas que el CSV (que se escribe en cada ensayo) y se ignora.
+    """
+    binary = path[:-len(".csv")] + ".col"
+    if not os.path.exists(binary):
+        return None
+    return binary if ReadHeader(binary)[0]["rows"] == CountRows(path) else None
+
+def SessionArrays(columns):
+    """Códigos de estímulo, elecciones y recompensas de los ensayos completos, en orden"""
+    stimulus = columns["stimulus"]
+    choices = ToArray(columns["responses"], int)
+    rewards = ToArray(columns["reward"], int)
+    complete = (choices >= 0) & (rewards >= 0)
+    cues = sorted(set(stimulus))
+    codes = np.array([cues.index(s) for s in stimulus], dtype=np.intp)
+    return codes[complete], choices[complete], rewards[complete], len(cues)
+
+def ColumnArrays(path):
+    """Como SessionArrays, desde el archivo binario .col de la sesión (sin parsear texto)"""
+    columns, header = OpenSession(path)
+    complete = ((columns["responses"] != Missing(columns["responses"].dtype)) &
+                (columns["reward"] != Missing(columns["reward"].dtype)) & (columns["stimulus"] >= 0))
+    return (columns["stimulus"][complete].astype(np.intp), columns["responses"][complete].astype(np.intp),
+            columns["reward"][complete].astype(np.float64), len(Categories(header, "stimulus")))
+
+def NegLogLik(alpha, beta, stimulus, choices, rewards, n_cues):
+    """
+    -log verosimilitud para G conjuntos de parámetros a la vez (alpha, beta de forma
+    (G,)). Recorre los ensayos una vez, con todas las operaciones vectorizadas en G.
+    """
+    G = alpha.size
+    Q = np.full((G, n_cues, 2), 0.5)
+    nll = np.zeros(G)
+    for cue, choice, reward in zip(stimulus, choices, rewards):
+        q = Q[:, cue]
+        dq = beta * (q[:, 1 - choice] - q[:, choice])
+        nll += np.logaddexp(0.0, dq)   # -log softmax de la opción elegida
+        Q[:, cue, choice] += alpha * (reward - Q[:, cue, choice])
+    return nll
+
+def FitSession(path):
+    """Ajusta alpha y beta de una sesión: grilla vectorizada y refinamiento local"""
+    from scipy.optimize import minimize
+
+    binary = CurrentColumns(path)
+    if binary is not None:
+        stimulus, choices, rewards, n_cues = ColumnArrays(binary)
+        participant = ReadHeader(binary)[0]["meta"].get("id", "")
+    else:
+        columns = ReadSession(path)
+        stimulus, choices, rewards, n_cues = SessionArrays(columns)
+        participant = columns["id"][0] if columns["id"] else ""
+    result = {"file": os.path.basename(path), "id": participant, "n_trials": int(stimulus.size)}
+    if stimulus.size == 0:
+        return result
+
+    alpha, beta = np.meshgrid(ALPHA_GRID, BETA_GRID, indexing="ij")
+    nll = NegLogLik(alpha.ravel(), beta.ravel(), stimulus, choices, rewards, n_cues)
+    best = int(np.argmin(nll))
+    x0 = [alpha.ravel()[best], beta.ravel()[best]]
+
+    def objective(x):
+        return NegLogLik(np.array([x[0]]), np.array([x[1]]), stimulus, choices, rewards, n_cues)[0]
+
+    fit = minimize(objective, x0, method="L-BFGS-B", bounds=[(1e-3, 1.0), (1e-3, 50.0)])
+    x, fun = (fit.x, fit.fun) if fit.fun <= nll[best] else (x0, nll[best])
+    result.update({
+        "alpha": float(x[0]),
+        "beta": float(x[1]),
+        "nll": float(fun),
+        "bic": float(2 * fun + 2 * np.log(stimulus.size)),
+    })
+    return result
+
+def LoadCache(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        cache = json.load(file)
+    return cache if cache.get("version") == MODEL_VERSION else {}
+
+def SaveCache(path, cache):
+    cache["version"] = MODEL_VERSION
+    with open(path + ".tmp", "w") as file:
+        json.dump(cache, file, indent=1)
+    os.replace(path + ".tmp", path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Ajuste de Q-learning por participante")
+    parser.add_argument("--datapath", default=os.path.join(os.path.abspath(os.curdir), "data"))
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--out", default="fits.csv")
+    args = parser.parse_args()
+
+    files = FindSessions(args.datapath)
+    cache_path = os.path.join(args.datapath, CACHE_FILE)
+    cache = LoadCache(cache_path)
+    fits = cache.setdefault("fits", {})
+
+    hashes = {path: FileHash(path) for path in files}
+    pending = [path for path in files if hashes[path] not in fits]
+    print(f"{len(files)} sessions found, {len(files) - len(pending)} cached, {len(pending)} to fit")
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            for path, result in zip(pending, pool.map(FitSession, pending)):
+                fits[hashes[path]] = result
+                print(f"  {result['file']}: alpha={result.get('alpha', float('nan')):.3f} "
+                      f"beta={result.get('beta', float('nan')):.3f} ({result['n_trials']} trials)")
+        SaveCache(cache_path, cache)
+
+    header = ["file", "id", "n_trials", "alpha", "beta", "nll", "bic"]
+    with open(args.out, "w", newline="") as file:
+        w = csv.writer(file, delimiter=';')
+        w.writerow(header)
+        for path in files:
+            result = fits[hashes[path]]
+            w.writerow([result.get(key, "") for key in header])
+    print(f"Saved {args.out}")
+
+if __name__ == '__main__':
+    main()
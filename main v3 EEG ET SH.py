@@ -1,17 +1,30 @@
+import time
+STARTUP_T0 = time.perf_counter()
 import pygame
+import numpy as np
 from datetime import datetime
 import os
 import sys
 import csv
-import random
+import argparse
+import importlib
+import json
+import socket
 from itertools import zip_longest
-from scipy.stats import bernoulli
-from collections import OrderedDict
+from collections import OrderedDict, deque
 import asyncio
-import pyautogui
-from pylsl import StreamInfo, StreamOutlet
-from pupil_labs.realtime_api import Device, Network, StatusUpdateNotifier
-from pupil_labs.realtime_api.models import Recording
+from taskschedule import CompileSchedule, SaveSchedule, LoadSchedule, BlockRows, SessionBlocks, ValidateSession
+from taskdata import ReadSession, FitClockDrift
+from sessionstore import SaveSession, COLUMNS
+
+# Los módulos de cada sistema de marcadores se importan solo si está habilitado (LoadBackend)
+pyautogui = None
+pylsl = None
+realtime_api = None
+time_echo = None
+
+# Tiempos de importación para el reporte de inicio (módulo -> segundos)
+IMPORTS = OrderedDict([("pygame, numpy, stdlib", time.perf_counter() - STARTUP_T0)])
 
 # MARCADORES 
 MARKERS = {
@@ -44,6 +57,7 @@ MARKERS = {
     'BLOCK_END_PHASE2': 203,    # Fin de bloque en fase 2
     
     # Otros eventos
+    'EXPERIMENT_RESUME': 253,   # Sesión retomada desde un checkpoint
     'EXPERIMENT_START': 254,    # Inicio del experimento
     'EXPERIMENT_END': 255,      # Fin del experimento
 }
@@ -85,9 +99,28 @@ CONFIG = {
     "starter" : 0,
     "quit" : 0,
     "stimulus" : [],
-    "pairs" : []
+    "pairs" : [],
+    "JOURNAL_BATCH" : 1,        # Ensayos escritos antes de hacer flush al disco
+    "JOURNAL_FSYNC" : "block",  # "never", "batch" (cada flush) o "block" (fin de bloque)
+    "SURFACE_CACHE_SIZE" : 64,  # Máximo de textos pre-renderizados en memoria
+    "DIRTY_RECTS" : True,       # Redibujar solo el cursor en elección/confianza (False: flip completo)
+    "VSYNC" : True,             # Presentar sincronizado con el refresco del monitor
+    "SEED" : None,              # Semilla de la sesión (None: aleatoria, queda guardada)
+    "IMPORTTIME" : False,       # Mostrar el reporte de tiempos de importación al iniciar
+    "RESUME" : None,            # ID del participante cuya sesión se retoma (--resume)
+    "BEHAVIOR_STREAM" : False,  # Segundo stream LSL con pantalla, cursor y ensayo en cada flip
+    "SYNC_INTERVAL" : 10.0,     # Segundos entre estimaciones de offset de reloj durante las pausas
+    "SYNC_ECHOES" : 20,         # Mediciones Time Echo por estimación con Pupil Labs
+    "PUPIL_TIMEOUT" : 1.0,      # Segundos máximos por envío a Pupil Labs antes de darlo por caído
+    "PUPIL_BUFFER" : 1024,      # Eventos Pupil retenidos mientras no hay conexión (se descartan los más viejos)
+    "PUPIL_BACKOFF" : (0.5, 30.0),  # Espera inicial y máxima entre reintentos de conexión (s)
+    "METRICS_PORT" : 9871,      # Puerto UDP local de las métricas en vivo para monitor.py (None: no publicar)
+    "METRICS_EWMA" : 0.1,       # Peso del último ensayo en los promedios móviles de RT
 }
 
+# Pasos de la rueda guardados por pantalla de respuesta (los demás quedan solo en WHEELLOG)
+STEPS_SIZE = 2 ** 10
+
 CACHE = {
     "id" : None,
     "response" : None,
@@ -98,6 +131,13 @@ CACHE = {
     "trial" : 0,
     "position" : None,
     "continue" : True,
+    "poll_ns" : None,            # Último sondeo de eventos (perf_counter_ns)
+    "response_ns" : None,        # Sondeo en que se detectó el clic de respuesta
+    "response_event_ns" : None,  # Tiempo estimado del clic (EventTime)
+    "steps" : np.zeros(STEPS_SIZE, dtype=np.int64),  # Tiempos de cada paso de la rueda
+    "nsteps" : 0,                # Pasos guardados en "steps"
+    "row" : None,                # Fila del ensayo actual en SCHEDULE
+    "start_row" : 0,             # Primera fila de SCHEDULE a presentar (> 0 al retomar)
 }
 
 RESULTS = OrderedDict([
@@ -111,8 +151,103 @@ RESULTS = OrderedDict([
     ("rts", []), 
     ("reward", []), 
     ("confidence", []), 
+    # Columnas de tiempos agregadas al final: las diez anteriores mantienen el formato
+    # original (orden y valores), pero el archivo ya no es idéntico byte a byte al de
+    # versiones anteriores; los lectores deben elegir columnas por nombre o posición
+    ("rts_raw", []),             # ms desde el flip de onset hasta el sondeo del clic
+    ("rts_corrected", []),       # ms desde el flip de onset hasta el clic según EventTime (± medio sondeo)
+    ("steps", []),               # ms de cada paso de la rueda en la elección
+    ("conf_rts_raw", []),
+    ("conf_rts_corrected", []),
+    ("conf_steps", []),
 ])
 
+# Estado del programador de frames
+FRAME = {
+    "rate" : 60.0,       # Frecuencia de refresco medida (Hz)
+    "period" : 1 / 60,   # Duración de un frame (s)
+    "vsync" : False,     # True si flip() queda bloqueado por el refresco
+    "last_flip" : None,
+    "last_flip_ns" : None,
+    "deadline" : None,   # Próximo flip cuando no hay vsync
+    "screens" : [],      # Registro de pantallas: tipo, onset, offset, frames
+    "screen" : "other",  # Tipo de pantalla presentada actualmente
+}
+
+# Tipos de pantalla registrados en FRAMELOG
+SCREEN_CODES = {
+    "other" : 0,
+    "fixation" : 1,
+    "choice" : 2,
+    "confidence" : 3,
+    "feedback" : 4,
+    "empty" : 5,
+    "instructions" : 6,
+    "pause" : 7,
+}
+
+# Buffer circular preasignado con el tiempo de cada flip
+FRAMELOG_SIZE = 2 ** 16
+FRAMELOG = {
+    "time" : np.zeros(FRAMELOG_SIZE, dtype=np.float64),
+    "screen" : np.zeros(FRAMELOG_SIZE, dtype=np.int8),
+    "partial" : np.zeros(FRAMELOG_SIZE, dtype=np.bool_),  # display.update(rects) en vez de flip
+    "count" : 0,
+    "file" : None,
+}
+
+# Buffer circular preasignado con cada evento del ratón en elección y confianza
+WHEELLOG_SIZE = 2 ** 14
+WHEELLOG = {
+    "time" : np.zeros(WHEELLOG_SIZE, dtype=np.int64),    # NowNs estimado del evento
+    "onset" : np.zeros(WHEELLOG_SIZE, dtype=np.int64),   # NowNs del flip de onset de la pantalla
+    "row" : np.zeros(WHEELLOG_SIZE, dtype=np.int16),     # Fila del ensayo en SCHEDULE
+    "screen" : np.zeros(WHEELLOG_SIZE, dtype=np.int8),
+    "button" : np.zeros(WHEELLOG_SIZE, dtype=np.int8),   # 4: arriba, 5: abajo, 2: clic central
+    "before" : np.zeros(WHEELLOG_SIZE, dtype=np.int8),   # Posición del cursor antes del evento
+    "after" : np.zeros(WHEELLOG_SIZE, dtype=np.int8),    # Posición después del evento
+    "count" : 0,
+    "flushed" : 0,
+    "file" : None,
+}
+
+# Muestras del stream LSL de conducta: una por flip, enviadas en chunks de BEHAVIOR_CHUNK
+BEHAVIOR_CHUNK = 32   # ~0.5 s a 60 Hz
+BEHAVIOR_CHANNELS = ["screen", "position", "phase", "block", "trial"]
+BEHAVIOR = {
+    "samples" : np.zeros((BEHAVIOR_CHUNK, len(BEHAVIOR_CHANNELS)), dtype=np.int32),
+    "time" : np.zeros(BEHAVIOR_CHUNK, dtype=np.float64),   # Now() de cada flip
+    "count" : 0,
+}
+
+# Servicio de sincronización de relojes (tabla <id>_sync_<timestamp>.csv)
+SYNC = {
+    "task" : None,
+    "file" : None,
+    "rows" : 0,
+}
+
+# Métricas en vivo, actualizadas en O(1) al completar cada ensayo y publicadas por UDP
+METRICS = {
+    "socket" : None,
+    "seq" : 0,
+    "trials" : 0,
+    "accuracy" : {},          # "fase:cue" -> [mejor opción elegida, ensayos con mejor opción, ensayos, recompensas]
+    "rt_ewma" : None,         # ms
+    "conf_rt_ewma" : None,    # ms
+    "confidence" : [0] * 10,  # Histograma de la confianza
+    "streak" : 0,             # Elecciones seguidas de la misma opción
+    "last_response" : None,
+}
+
+# Estado del journal (escritura incremental de RESULTS)
+JOURNAL = {
+    "file" : None,
+    "writer" : None,
+    "rows" : 0,
+    "pending" : 0,
+}
+
 STIMULUS = {
     "AB": ['むふ', [0.50, 0.50],[0.20, 0.20]],
     "CD": ['るょ', [0.50, 0.50], [0.80, 0.80]],
@@ -120,6 +255,49 @@ STIMULUS = {
     "GH": ['ゆぎ', [0.20, 0.80],[0.80, 0.20]]
 }
 
+# Definición de la sesión, validada y compilada antes de la primera pantalla.
+# items: composición de cada bloque (repeticiones, par de estímulos).
+# blocks: en orden, cada uno con su fase, la pantalla al terminar ("break",
+# "midbreak" o "quit"), los marcadores de inicio y fin y la casilla de Shimmer que
+# se marca junto con ellos (None: sin Shimmer).
+SESSION = {
+    "items": [
+        (8, ["AB", "EF"]),
+        (8, ["CD", "GH"]),
+        (2, ["AB", "GH"]),
+        (2, ["CD", "EF"]),
+    ],
+    "blocks": [
+        {"phase": 1, "block": 1, "end": "break",
+         "start_marker": "BLOCK_START_PHASE1", "start_shimmer": "PHASE1_START",
+         "end_marker": "BLOCK_END_PHASE1", "end_shimmer": None},
+        {"phase": 1, "block": 2, "end": "midbreak",
+         "start_marker": "BLOCK_START_PHASE1", "start_shimmer": None,
+         "end_marker": "BLOCK_END_PHASE1", "end_shimmer": "PHASE1_END"},
+        {"phase": 1, "block": 3, "end": "midbreak",
+         "start_marker": "BLOCK_START_PHASE1", "start_shimmer": None,
+         "end_marker": "BLOCK_END_PHASE1", "end_shimmer": "PHASE1_END"},
+        {"phase": 2, "block": 1, "end": "break",
+         "start_marker": "BLOCK_START_PHASE2", "start_shimmer": "PHASE2_START",
+         "end_marker": "BLOCK_END_PHASE2", "end_shimmer": None},
+        {"phase": 2, "block": 2, "end": "break",
+         "start_marker": "BLOCK_START_PHASE2", "start_shimmer": None,
+         "end_marker": "BLOCK_END_PHASE2", "end_shimmer": None},
+        {"phase": 2, "block": 3, "end": "quit",
+         "start_marker": "BLOCK_START_PHASE2", "start_shimmer": None,
+         "end_marker": "BLOCK_END_PHASE2", "end_shimmer": "PHASE2_END"},
+    ],
+}
+
+# Texto de la pantalla al terminar un bloque según su tipo
+PAUSE_TEXT = {"break": "pause", "midbreak": "midbreak", "quit": "quit"}
+
+# Bloques de SESSION resueltos contra SCHEDULE (CompilePlan)
+PLAN = []
+
+# Sesión compilada en InitTask (ver taskschedule.CompileSchedule)
+SCHEDULE = {}
+
 INSTRUCTIONS = [
     """A continuación aparecerán una serie de pares de símbolos,
 uno a la derecha y otro a la izquierda de la pantalla.
@@ -157,45 +335,298 @@ Recuerde: Use la RUEDA DEL RATÓN para navegar
 y PRESIÓNELA para confirmar."""
 ]
 
+# TEXTOS DE PANTALLA
+SCREEN_TEXT = {
+    "welcome" : "BIENVENIDO\n\nPresione [ENTER] para continuar",
+    "pause" : "PAUSA\n\nTome un breve momento para descansar.\n\nPresione [ENTER] para continuar",
+    "midbreak" : "¡LLEVAS MÁS DE LA MITAD COMPLETADA!\n\nTome un breve momento para descansar.\n\nPresione [ENTER] para continuar",
+    "quit" : "El experimento ha finalizado.\n\nMuchas gracias por participar.\n\nPresione [Q] para salir",
+    "choice_instruct" : "Gire la rueda del ratón para mover - Presione la rueda para confirmar",
+    "confidence_title" : "Confianza en su respuesta",
+    "confidence_instruct" : "Gire la rueda para ajustar - Presione la rueda para confirmar",
+    "confidence_ticks" : "   ".join(["|", "|", "|", "|", "|", "|", "|", "|", "|", "|"]),
+    "confidence_labs" : "    ".join(["0", "1", "2", "3", "4", "5", "6", "7", "8", "9"]),
+    "nav_first" : "Siguiente [→]",
+    "nav_last" : "Anterior [←]                    Comenzar [Enter]",
+    "nav_middle" : "Anterior [←]                    Siguiente [→]",
+}
+
+# Cache LRU de textos pre-renderizados: clave -> (superficie recortada, desplazamiento)
+SURFACES = OrderedDict()
+
 # VARIABLES DE CONEXIÓN 
 outlet = None  # Para LSL (EEG)
+behavior_outlet = None  # Stream LSL de conducta (opcional)
 pupil_device = None  # Para Pupil Labs
 SHIMMER_ENABLED = True  # Shimmer siempre habilitado si pyautogui funciona
 
+# Conexión con Pupil Labs: eventos pendientes de confirmar y estadísticas de cortes
+PUPIL = {
+    "online" : True,         # False desde un envío fallido hasta reconectar
+    "buffer" : deque(),      # (seq, trigger, lsl_time, unix_ns) aún no confirmados
+    "reconnect" : None,      # Tarea de reconexión en curso
+    "down_since" : None,     # Now() del primer envío fallido del corte actual
+    "back_ns" : None,        # time_ns() de la última reconexión (lo anterior es reenvío)
+    "failures" : 0,          # Cortes detectados
+    "attempts" : 0,          # Intentos de reconexión
+    "reconnects" : 0,
+    "replayed" : 0,          # Eventos enviados tras un corte con su timestamp original
+    "dropped" : 0,           # Eventos descartados por buffer lleno
+    "downtime" : 0.0,
+    "outages" : [],          # {"start", "end", "buffered"} por corte (Now())
+}
+
+# Sistemas de marcadores: nombre -> módulos a importar (alias global: módulo)
+BACKENDS = {
+    "EEG" : {"enabled": True, "modules": {"pylsl": "pylsl"}, "error": None},
+    "Eyetracker" : {"enabled": True, "modules": {"realtime_api": "pupil_labs.realtime_api",
+                                                 "time_echo": "pupil_labs.realtime_api.time_echo"}, "error": None},
+    "Shimmer" : {"enabled": True, "modules": {"pyautogui": "pyautogui"}, "error": None},
+}
+
+def LoadBackend(name):
+    """
+    Importa los módulos de un sistema de marcadores solo si está habilitado.
+    Un error de importación deshabilita ese sistema en vez de detener la tarea.
+    """
+    backend = BACKENDS[name]
+    if not backend["enabled"]:
+        return False
+    for alias, module in backend["modules"].items():
+        if globals()[alias] is not None:
+            continue
+        t0 = time.perf_counter()
+        try:
+            globals()[alias] = importlib.import_module(module)
+        except Exception as e:
+            backend["enabled"] = False
+            backend["error"] = f"{type(e).__name__}: {e}"
+            return False
+        IMPORTS[module] = time.perf_counter() - t0
+    return True
+
+def PrintImportReport():
+    """Reporte de tiempos de importación al estilo de -X importtime"""
+    print("import time: cumulative [us] | module")
+    for module, seconds in IMPORTS.items():
+        print(f"import time: {seconds * 1e6:>16.0f} | {module}")
+
 # FUNCIONES DE CONEXIÓN Y ENVÍO DE MARCADORES
 
+# Despachador de marcadores: una cola por sistema, consumida en segundo plano
+DISPATCHER = {
+    "queues" : {},   # "EEG", "Eyetracker", "Shimmer", "Behavior" -> asyncio.Queue
+    "tasks" : [],
+    "seq" : 0,       # Número de secuencia del último marcador
+    "sent" : {},
+    "errors" : {},
+    "last" : None,   # (seq, trigger, Now()) del último marcador levantado
+}
+
 async def send_trigger_unified(trigger, include_shimmer=False, shimmer_position=None):
     """
-    Envía triggers simultáneamente a los sistemas conectados.
-    Usando el mismo formato que funciona en el script de videos.
+    Encola el trigger para los sistemas conectados y retorna de inmediato.
+    El timestamp se toma al levantar el marcador (reloj LSL y reloj Unix),
+    así el envío por red o el clic de Shimmer no retrasan el ciclo de frames.
     """
-    print(f"\n→ Sending marker {trigger}")
-    
-    # 1. Enviar a EEG vía LSL
-    if outlet:
+    lsl_time = LSLClock()
+    unix_ns = time.time_ns()
+    DISPATCHER["seq"] += 1
+    DISPATCHER["last"] = (DISPATCHER["seq"], trigger, Now())
+    marker = (DISPATCHER["seq"], trigger, lsl_time, unix_ns)
+    queues = DISPATCHER["queues"]
+
+    # 1. EEG vía LSL
+    if outlet and "EEG" in queues:
+        queues["EEG"].put_nowait(marker)
+
+    # 2. Pupil Labs
+    if pupil_device and "Eyetracker" in queues:
+        queues["Eyetracker"].put_nowait(marker)
+
+    # 3. Shimmer si es necesario
+    if include_shimmer and shimmer_position and SHIMMER_ENABLED and "Shimmer" in queues:
+        queues["Shimmer"].put_nowait(marker + (shimmer_position,))
+
+async def LSLSink(queue):
+    """Envía los marcadores a EEG con el timestamp LSL del momento en que se levantaron"""
+    while True:
+        seq, trigger, lsl_time, unix_ns = await queue.get()
         try:
-            outlet.push_sample([trigger])
-            print(f'  [EEG] Trigger {trigger} sent')
+            outlet.push_sample([trigger], lsl_time)
+            DISPATCHER["sent"]["EEG"] += 1
         except Exception as e:
+            DISPATCHER["errors"]["EEG"] += 1
             print(f'  [EEG] Error: {e}')
-    
-    # 2. Enviar a Pupil Labs
-    if pupil_device:
+        finally:
+            queue.task_done()
+
+async def PupilSink(queue):
+    """
+    Envía los marcadores a Pupil Labs como eventos con timestamp Unix explícito.
+    Cada marcador pasa por PUPIL["buffer"] y sale de él solo cuando el dispositivo lo
+    confirma; sin conexión se acumula sin esperar el timeout. None solo vacía el buffer.
+    """
+    while True:
+        marker = await queue.get()
+        try:
+            if marker is not None:
+                if len(PUPIL["buffer"]) >= CONFIG["PUPIL_BUFFER"]:
+                    PUPIL["buffer"].popleft()
+                    PUPIL["dropped"] += 1
+                PUPIL["buffer"].append(marker)
+            await DrainPupil()
+        finally:
+            queue.task_done()
+
+async def DrainPupil():
+    """Envía los eventos pendientes en orden; al primer error pasa a reconectar"""
+    while PUPIL["online"] and PUPIL["buffer"]:
+        seq, trigger, lsl_time, unix_ns = PUPIL["buffer"][0]
         try:
-            await pupil_device.send_event(str(trigger))
-            print(f'  [Eyetracker] Event {trigger} sent')
+            await asyncio.wait_for(pupil_device.send_event(str(trigger), event_timestamp_unix_ns=unix_ns),
+                                   CONFIG["PUPIL_TIMEOUT"])
         except Exception as e:
-            print(f'  [Eyetracker] Error: {e}')
-    
-    # 3. Enviar a Shimmer si es necesario
-    if include_shimmer and shimmer_position and SHIMMER_ENABLED:
+            DISPATCHER["errors"]["Eyetracker"] += 1
+            print(f'  [Eyetracker] Error: {type(e).__name__}: {e} - buffering events and reconnecting')
+            PupilOffline()
+            return
+        PUPIL["buffer"].popleft()
+        DISPATCHER["sent"]["Eyetracker"] += 1
+        if PUPIL["back_ns"] is not None and unix_ns < PUPIL["back_ns"]:
+            PUPIL["replayed"] += 1
+
+def PupilOffline():
+    PUPIL["online"] = False
+    PUPIL["failures"] += 1
+    PUPIL["down_since"] = Now()
+    PUPIL["reconnect"] = asyncio.create_task(ReconnectPupil())
+    DISPATCHER["tasks"].append(PUPIL["reconnect"])
+
+async def ReconnectPupil():
+    """
+    Reintenta la conexión con espera exponencial (PUPIL_BACKOFF). Un intento es
+    exitoso si el dispositivo responde su estado; si la grabación se detuvo se reinicia.
+    Al volver, el buffer se reenvía desde PupilSink con los timestamps originales.
+    """
+    global pupil_device
+    delay, limit = CONFIG["PUPIL_BACKOFF"]
+    address, port = pupil_device.address, pupil_device.port
+    while True:
+        await asyncio.sleep(delay)
+        PUPIL["attempts"] += 1
+        device = realtime_api.Device(address, port)
+        try:
+            status = await asyncio.wait_for(device.get_status(), CONFIG["PUPIL_TIMEOUT"])
+            if status.recording is None or status.recording.action != "START":
+                recording_id = await asyncio.wait_for(device.recording_start(), CONFIG["PUPIL_TIMEOUT"])
+                print(f'  [Eyetracker] Recording restarted: {recording_id}')
+            break
+        except Exception as e:
+            await device.close()
+            print(f'  [Eyetracker] Reconnect attempt {PUPIL["attempts"]} failed ({type(e).__name__}), retrying in {delay:.1f} s')
+            delay = min(delay * 2, limit)
+
+    old, pupil_device = pupil_device, device
+    try:
+        await old.close()
+    except Exception:
+        pass
+    end = Now()
+    PUPIL["downtime"] += end - PUPIL["down_since"]
+    PUPIL["outages"].append({"start": PUPIL["down_since"], "end": end, "buffered": len(PUPIL["buffer"])})
+    PUPIL["reconnects"] += 1
+    PUPIL["back_ns"] = time.time_ns()
+    PUPIL["online"] = True
+    PUPIL["reconnect"] = None
+    print(f'  [Eyetracker] Reconnected after {end - PUPIL["down_since"]:.1f} s, replaying {len(PUPIL["buffer"])} events')
+    if "Eyetracker" in DISPATCHER["queues"]:
+        DISPATCHER["queues"]["Eyetracker"].put_nowait(None)
+
+def WritePupilStats():
+    """Estadísticas de envío, cortes y reconexiones de Pupil Labs (<id>_pupil_<timestamp>.json)"""
+    if pupil_device is None:
+        return
+    stats = {key: PUPIL[key] for key in ("failures", "attempts", "reconnects", "replayed", "dropped", "outages")}
+    stats.update({"sent": DISPATCHER["sent"].get("Eyetracker", 0), "unsent": len(PUPIL["buffer"]),
+                  "downtime_s": PUPIL["downtime"] + (Now() - PUPIL["down_since"] if not PUPIL["online"] else 0.0),
+                  "online": PUPIL["online"]})
+    path = os.path.join(CONFIG["DATAPATH"], CONFIG["FILE"].replace("_data_", "_pupil_")[:-len(".csv")] + ".json")
+    with open(path + ".tmp", "w") as file:
+        json.dump(stats, file, indent=1)
+    os.replace(path + ".tmp", path)
+    lost = stats["dropped"] + stats["unsent"]
+    print(f'{"✓" if lost == 0 else "✗"} Pupil Labs: {stats["sent"]} events sent ({stats["replayed"]} replayed), '
+          f'{lost} lost, {stats["failures"]} outages, {stats["downtime_s"]:.1f} s offline')
+
+def ShimmerClick(shimmer_position):
+    position = SHIMMER_POSITIONS[shimmer_position]
+    pyautogui.moveTo(position[0], position[1], duration=0.1)
+    pyautogui.click()
+    return position
+
+async def ShimmerSink(queue):
+    """Marca Shimmer con un clic; pyautogui bloquea, por eso corre en un hilo"""
+    while True:
+        seq, trigger, lsl_time, unix_ns, shimmer_position = await queue.get()
         try:
-            position = SHIMMER_POSITIONS[shimmer_position]
-            pyautogui.moveTo(position[0], position[1], duration=0.1)
-            pyautogui.click()
-            print(f'  [Shimmer] Marker sent at {shimmer_position}: {position}')
+            await asyncio.to_thread(ShimmerClick, shimmer_position)
+            DISPATCHER["sent"]["Shimmer"] += 1
         except Exception as e:
+            DISPATCHER["errors"]["Shimmer"] += 1
             print(f'  [Shimmer] Error: {e}')
+        finally:
+            queue.task_done()
+
+async def BehaviorSink(queue):
+    """
+    Envía los chunks de conducta con push_chunk. Cada muestra lleva el tiempo de su
+    flip convertido al reloj LSL, el mismo de los marcadores de TriggerStream.
+    """
+    while True:
+        samples, times = await queue.get()
+        try:
+            offset = LSLClock() - Now()
+            behavior_outlet.push_chunk(samples, (times + offset).tolist())
+            DISPATCHER["sent"]["Behavior"] += len(times)
+        except Exception as e:
+            DISPATCHER["errors"]["Behavior"] += 1
+            print(f'  [Behavior] Error: {e}')
+        finally:
+            queue.task_done()
+
+def StartDispatcher():
+    """Crea una cola y una tarea consumidora por sistema"""
+    for sink, worker in (("EEG", LSLSink), ("Eyetracker", PupilSink), ("Shimmer", ShimmerSink),
+                         ("Behavior", BehaviorSink)):
+        if sink in DISPATCHER["queues"]:
+            continue
+        queue = asyncio.Queue()
+        DISPATCHER["queues"][sink] = queue
+        DISPATCHER["sent"][sink] = 0
+        DISPATCHER["errors"][sink] = 0
+        DISPATCHER["tasks"].append(asyncio.create_task(worker(queue)))
+
+async def StopDispatcher(timeout=5.0):
+    """
+    Espera a que se vacíen las colas, detiene las tareas consumidoras y resume lo
+    enviado por cada sistema (los envíos no se imprimen uno a uno, solo los errores)
+    """
+    try:
+        await asyncio.wait_for(asyncio.gather(*(q.join() for q in DISPATCHER["queues"].values())), timeout)
+    except asyncio.TimeoutError:
+        print('  [Markers] Timeout flushing marker queues')
+    units = {"Behavior": "samples"}
+    sinks = [f'{sink} {sent} {units.get(sink, "markers")}' +
+             (f' ({DISPATCHER["errors"][sink]} errors)' if DISPATCHER["errors"][sink] else "")
+             for sink, sent in DISPATCHER["sent"].items() if sent or DISPATCHER["errors"][sink]]
+    if sinks:
+        errors = sum(DISPATCHER["errors"].values())
+        print(f'{"✓" if errors == 0 else "✗"} Sent: ' + ", ".join(sinks))
+    for task in DISPATCHER["tasks"]:
+        task.cancel()
+    DISPATCHER["tasks"] = []
+    DISPATCHER["queues"] = {}
 
 # FUNCIONES DEL EXPERIMENTO 
 
@@ -216,12 +647,291 @@ def TextObject(text, font, width, height, color):
         paragraphSurface.blit(currentTextline, currentPosition)
     return paragraphSurface
 
+def TextKargs(font, color, height=None):
+    """Argumentos de TextObject para una fuente y color de CONFIG"""
+    return {"font": CONFIG[font], "width": CONFIG["WIDTH"],
+            "height": CONFIG["HEIGHT"] if height is None else height, "color": CONFIG[color]}
+
+def CachedTextObject(text, font, width, height, color):
+    """
+    TextObject con cache LRU. Guarda solo el área con texto (recortada) y su
+    desplazamiento dentro del párrafo, para no mantener superficies de pantalla completa.
+    """
+    key = (text, font, width, height, color)
+    entry = SURFACES.get(key)
+    if entry is not None:
+        SURFACES.move_to_end(key)
+        return entry
+    paragraphSurface = TextObject(text, font, width, height, color)
+    bounds = paragraphSurface.get_bounding_rect()
+    surface = paragraphSurface.subsurface(bounds).copy()
+    if pygame.display.get_surface() is not None:
+        surface = surface.convert()
+    surface.set_colorkey((255, 255, 255))
+    entry = (surface, bounds.topleft)
+    SURFACES[key] = entry
+    while len(SURFACES) > CONFIG["SURFACE_CACHE_SIZE"]:
+        SURFACES.popitem(last=False)
+    return entry
+
+def BlitText(entry, position):
+    """Dibuja un texto de CachedTextObject en la posición que tendría el párrafo completo"""
+    surface, (dx, dy) = entry
+    return CONFIG["SCR"].blit(surface, (position[0] + dx, position[1] + dy))
+
+def TextRect(entry, position):
+    """Rectángulo de pantalla que ocupa un texto de CachedTextObject"""
+    surface, (dx, dy) = entry
+    return pygame.Rect((position[0] + dx, position[1] + dy), surface.get_size())
+
+def WarmSurfaceCache():
+    """
+    Pre-renderiza todos los textos y estímulos antes de iniciar el experimento. El
+    cache crece si hace falta para que ninguno se descarte durante la sesión.
+    """
+    t0 = time.perf_counter()
+    limit = CONFIG["SURFACE_CACHE_SIZE"]
+    CONFIG["SURFACE_CACHE_SIZE"] = float("inf")
+    for cue in STIMULUS.values():
+        STIM = cue[0][0] + "   " + cue[0][1]
+        CachedTextObject(STIM, **TextKargs("StimFont", "BLACK"))
+        CachedTextObject(STIM, **TextKargs("Stim2Font", "BLACK"))
+    CachedTextObject("+", **TextKargs("FixFont", "BLACK"))
+    CachedTextObject("+", **TextKargs("TitleFont", "BLACK"))
+    CachedTextObject("▼", **TextKargs("MarkFont", "BLUE"))
+    CachedTextObject(SCREEN_TEXT["confidence_title"], **TextKargs("TitleFont", "BLACK"))
+    CachedTextObject(SCREEN_TEXT["confidence_ticks"], **TextKargs("TicksFont", "BLACK"))
+    CachedTextObject(SCREEN_TEXT["confidence_labs"], **TextKargs("LabsFont", "BLACK"))
+    CachedTextObject(SCREEN_TEXT["choice_instruct"], **TextKargs("NavigationFont", "BLUE", 50))
+    CachedTextObject(SCREEN_TEXT["confidence_instruct"], **TextKargs("NavigationFont", "BLUE", 50))
+    CachedTextObject("CORRECTO", **TextKargs("FeedbackFont", "GREEN"))
+    CachedTextObject("INCORRECTO", **TextKargs("FeedbackFont", "RED"))
+    for page in INSTRUCTIONS:
+        CachedTextObject(page, **TextKargs("InstructionFont", "BLACK", CONFIG["HEIGHT"] - 100))
+    for nav in ("nav_first", "nav_last", "nav_middle"):
+        CachedTextObject(SCREEN_TEXT[nav], **TextKargs("NavigationFont", "BLUE", 50))
+    for screen in ["welcome"] + [PAUSE_TEXT[entry["end"]] for entry in PLAN]:
+        CachedTextObject(SCREEN_TEXT[screen], **TextKargs("Font", "BLACK"))
+    if len(SURFACES) > limit:
+        print(f'  Surface cache raised from {limit} to {len(SURFACES)}')
+    CONFIG["SURFACE_CACHE_SIZE"] = max(limit, len(SURFACES))
+    print(f'✓ {len(SURFACES)} surfaces pre-rendered in {(time.perf_counter() - t0) * 1000:.0f} ms')
+
 def SaveOutputs(filename, resultsdict):
     with open(os.path.join(CONFIG["DATAPATH"], filename), 'w', newline="") as file:
         w = csv.writer(file, delimiter=';')
         w.writerow(resultsdict.keys())
         w.writerows(zip_longest(*resultsdict.values()))
 
+def OpenJournal(filename, resultsdict, append=False):
+    """
+    Crea el archivo de datos y escribe el encabezado; luego solo se agregan filas.
+    Con append se reescribe el archivo con las filas ya cargadas en resultsdict
+    (descarta un ensayo incompleto) y se continúa agregando a continuación.
+    """
+    path = os.path.join(CONFIG["DATAPATH"], filename)
+    if append:
+        SaveOutputs(filename + ".tmp", resultsdict)
+        os.replace(path + ".tmp", path)
+        JOURNAL["file"] = open(path, 'a', newline="")
+        JOURNAL["writer"] = csv.writer(JOURNAL["file"], delimiter=';')
+        JOURNAL["rows"] = min(len(values) for values in resultsdict.values())
+    else:
+        JOURNAL["file"] = open(path, 'w', newline="")
+        JOURNAL["writer"] = csv.writer(JOURNAL["file"], delimiter=';')
+        JOURNAL["writer"].writerow(resultsdict.keys())
+        JOURNAL["rows"] = 0
+    FlushJournal(sync=CONFIG["JOURNAL_FSYNC"] != "never")
+
+def AppendJournal(resultsdict):
+    """Escribe solo las filas completas de RESULTS que aún no están en disco"""
+    if JOURNAL["file"] is None:
+        return
+    start = JOURNAL["rows"]
+    stop = min(len(values) for values in resultsdict.values())
+    if stop <= start:
+        return
+    JOURNAL["writer"].writerows(zip_longest(*(values[start:stop] for values in resultsdict.values())))
+    JOURNAL["rows"] = stop
+    JOURNAL["pending"] += stop - start
+    if JOURNAL["pending"] >= CONFIG["JOURNAL_BATCH"]:
+        FlushJournal(sync=CONFIG["JOURNAL_FSYNC"] == "batch")
+
+def FlushJournal(sync=False):
+    """Vacía el buffer del journal y opcionalmente fuerza fsync"""
+    if JOURNAL["file"] is None:
+        return
+    JOURNAL["file"].flush()
+    if sync:
+        os.fsync(JOURNAL["file"].fileno())
+    JOURNAL["pending"] = 0
+
+def CloseJournal(filename, resultsdict):
+    """Cierra el journal y reconstruye el CSV final de forma atómica"""
+    if JOURNAL["file"] is None:
+        return
+    FlushJournal(sync=CONFIG["JOURNAL_FSYNC"] != "never")
+    JOURNAL["file"].close()
+    JOURNAL["file"] = None
+    JOURNAL["writer"] = None
+    # Incluye filas incompletas (p. ej. salida a mitad de un ensayo), igual que SaveOutputs
+    SaveOutputs(filename + ".tmp", resultsdict)
+    os.replace(os.path.join(CONFIG["DATAPATH"], filename + ".tmp"),
+               os.path.join(CONFIG["DATAPATH"], filename))
+
+def SaveColumns():
+    """Copia binaria por columnas de RESULTS junto al CSV (<id>_data_<timestamp>.col)"""
+    categories = {}
+    if SCHEDULE:
+        categories = {"stimulus": SCHEDULE["cues"].tolist(), "pairs": SCHEDULE["pair_names"].tolist()}
+    meta = {"id": CACHE["id"], "csv": CONFIG["FILE"], "seed": str(SCHEDULE.get("seed", ""))}
+    SaveSession(os.path.join(CONFIG["DATAPATH"], CONFIG["FILE"].replace(".csv", ".col")), RESULTS, categories, meta)
+
+def ScheduleFile():
+    return CONFIG["FILE"].replace("_data_", "_schedule_").replace(".csv", ".npz")
+
+def CheckpointPath(participant):
+    return os.path.join(CONFIG["DATAPATH"], f"{participant}_checkpoint.json")
+
+def ReadCheckpoint(participant):
+    """Checkpoint de la última sesión del participante (None si no hay)"""
+    if not os.path.exists(CheckpointPath(participant)):
+        return None
+    with open(CheckpointPath(participant)) as file:
+        return json.load(file)
+
+def WriteCheckpoint(complete=False):
+    """
+    Estado mínimo para retomar la sesión en el ensayo siguiente: archivos de la sesión,
+    filas ya escritas, posición en SCHEDULE y número de secuencia de marcadores.
+    complete marca una sesión terminada, que ya no se puede retomar.
+    Se escribe completo en un archivo temporal y se reemplaza de forma atómica.
+    """
+    state = {
+        "file" : CONFIG["FILE"],
+        "schedule" : ScheduleFile(),
+        "seed" : str(SCHEDULE["seed"]),
+        "rows" : JOURNAL["rows"],
+        "seq" : DISPATCHER["seq"],
+        "cache" : {key: None if CACHE[key] is None else int(CACHE[key]) if key != "id" else CACHE[key]
+                   for key in ("id", "phase", "block", "trial", "row", "choice", "position")},
+        "saved" : datetime.now().isoformat(timespec="seconds"),
+        "complete" : complete,
+    }
+    path = CheckpointPath(CACHE["id"])
+    with open(path + ".tmp", "w") as file:
+        json.dump(state, file)
+        if CONFIG["JOURNAL_FSYNC"] == "batch":
+            file.flush()
+            os.fsync(file.fileno())
+    os.replace(path + ".tmp", path)
+
+def ParseColumn(key, values):
+    """Valores de una columna del CSV con el tipo de RESULTS (el de sessionstore.COLUMNS)"""
+    kind = COLUMNS.get(key, "category")
+    if kind in ("category", "ragged"):
+        return list(values)
+    if np.dtype(kind).kind == "f":
+        return [float(v) if v != "" else "" for v in values]
+    return [int(v) for v in values]
+
+def CheckNewSession(participant):
+    """Evita empezar una sesión nueva que reemplazaría el checkpoint de una sin terminar"""
+    state = ReadCheckpoint(participant)
+    if state is not None and not state.get("complete"):
+        raise ValueError(f"{participant} has an unfinished session ({state['file']}); "
+                         f"use --resume {participant} or move its checkpoint")
+
+def ResumeSession(participant):
+    """
+    Carga el checkpoint del participante, su sesión compilada y los ensayos completos
+    del CSV, y reabre el journal para continuar en el mismo archivo.
+    """
+    state = ReadCheckpoint(participant)
+    if state is None:
+        raise ValueError(f"{participant} has no checkpoint in {CONFIG['DATAPATH']}")
+    if state.get("complete"):
+        raise ValueError(f"{state['file']} is already complete, there is nothing to resume")
+    CONFIG["FILE"] = state["file"]
+    SCHEDULE.update(LoadSchedule(os.path.join(CONFIG["DATAPATH"], state["schedule"])))
+
+    # El CSV manda: un ensayo está completo cuando ya tiene su recompensa
+    columns = ReadSession(os.path.join(CONFIG["DATAPATH"], CONFIG["FILE"]))
+    if list(columns) != list(RESULTS):
+        raise ValueError(f"{CONFIG['FILE']} columns do not match RESULTS")
+    rows = 0
+    while rows < len(columns["reward"]) and columns["reward"][rows] != "":
+        rows += 1
+    if rows > 0:
+        last = (int(columns["phase"][rows - 1]), int(columns["block"][rows - 1]), int(columns["trial"][rows - 1]))
+        expected = tuple(int(SCHEDULE[key][rows - 1]) for key in ("phase", "block", "trial"))
+        if last != expected:
+            raise ValueError(f"{CONFIG['FILE']} does not follow its schedule (row {rows}: {last} != {expected})")
+    for key, values in RESULTS.items():
+        values.extend(ParseColumn(key, columns[key][:rows]))
+
+    for i in range(rows):
+        UpdateMetrics(i)
+
+    CACHE.update(state["cache"])
+    CACHE["start_row"] = rows
+    DISPATCHER["seq"] = state["seq"]
+    OpenJournal(CONFIG["FILE"], RESULTS, append=True)
+    return rows, state
+# MÉTRICAS EN VIVO
+
+def BestOption(cue, phase):
+    """Opción con mayor probabilidad de recompensa del par en la fase (None si son iguales)"""
+    probs = STIMULUS[cue][phase]
+    return None if probs[0] == probs[1] else int(probs[1] > probs[0])
+
+def UpdateMetrics(i):
+    """Incorpora la fila i de RESULTS a las métricas en vivo (costo constante por ensayo)"""
+    phase, cue, choice = int(RESULTS["phase"][i]), RESULTS["stimulus"][i], int(RESULTS["responses"][i])
+    entry = METRICS["accuracy"].setdefault(f"{phase}:{cue}", [0, 0, 0, 0])
+    best = BestOption(cue, phase)
+    entry[0] += int(best is not None and choice == best)
+    entry[1] += int(best is not None)
+    entry[2] += 1
+    entry[3] += int(RESULTS["reward"][i])
+    weight = CONFIG["METRICS_EWMA"]
+    # Ambos desde el flip de onset (columnas corregidas)
+    for key, column in (("rt_ewma", "rts_corrected"), ("conf_rt_ewma", "conf_rts_corrected")):
+        value = float(RESULTS[column][i])
+        METRICS[key] = value if METRICS[key] is None else METRICS[key] + weight * (value - METRICS[key])
+    METRICS["confidence"][int(RESULTS["confidence"][i])] += 1
+    METRICS["streak"] = METRICS["streak"] + 1 if choice == METRICS["last_response"] else 1
+    METRICS["last_response"] = choice
+    METRICS["trials"] += 1
+
+def OpenMetrics():
+    """Socket UDP sin conexión: publicar no bloquea aunque monitor.py no esté corriendo"""
+    if CONFIG["METRICS_PORT"]:
+        METRICS["socket"] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        METRICS["socket"].setblocking(False)
+
+def PublishMetrics():
+    """Envía el estado actual de las métricas y de los sistemas de marcadores a monitor.py"""
+    if METRICS["socket"] is None:
+        return
+    METRICS["seq"] += 1
+    message = {
+        "seq": METRICS["seq"], "time": time.time(), "id": CACHE["id"], "phase": CACHE["phase"],
+        "block": CACHE["block"], "trial": CACHE["trial"], "trials": METRICS["trials"],
+        "total": int(SCHEDULE["stimulus"].size) if SCHEDULE else None,
+        "accuracy": METRICS["accuracy"], "rt_ewma": METRICS["rt_ewma"], "conf_rt_ewma": METRICS["conf_rt_ewma"],
+        "confidence": METRICS["confidence"], "streak": METRICS["streak"],
+        "sinks": {sink: {"sent": DISPATCHER["sent"].get(sink, 0), "errors": DISPATCHER["errors"].get(sink, 0),
+                         "queued": queue.qsize()} for sink, queue in DISPATCHER["queues"].items()},
+        "connected": {"EEG": outlet is not None, "Eyetracker": pupil_device is not None, "Shimmer": SHIMMER_ENABLED},
+        "pupil": {"online": PUPIL["online"], "buffered": len(PUPIL["buffer"]), "failures": PUPIL["failures"],
+                  "dropped": PUPIL["dropped"]},
+    }
+    try:
+        METRICS["socket"].sendto(json.dumps(message).encode(), ("127.0.0.1", CONFIG["METRICS_PORT"]))
+    except OSError:
+        pass
+
 def QuitEvent():
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
@@ -255,23 +965,14 @@ def DrawInstructions():
     current_page = 0
     total_pages = len(INSTRUCTIONS)
     
-    textkargs = {
-        "font": CONFIG["InstructionFont"],
-        "width": CONFIG["WIDTH"],
-        "height": CONFIG["HEIGHT"] - 100,
-        "color": CONFIG["BLACK"]
-    }
-    
-    navkargs = {
-        "font": CONFIG["NavigationFont"],
-        "width": CONFIG["WIDTH"],
-        "height": 50,
-        "color": CONFIG["BLUE"]
-    }
+    textkargs = TextKargs("InstructionFont", "BLACK", CONFIG["HEIGHT"] - 100)
+    navkargs = TextKargs("NavigationFont", "BLUE", 50)
     
     CENTERX, CENTERY = CONFIG["RECT"].centerx, CONFIG["RECT"].centery
     X, Y = CENTERX - (CONFIG["WIDTH"] // 2), CENTERY - (CONFIG["HEIGHT"] // 2)
     
+    SetScreen("instructions")
+    record = None
     while True:
         CONFIG["SCR"].fill(CONFIG["GRAY"])
         
@@ -280,20 +981,20 @@ def DrawInstructions():
         title_x = CENTERX - title_surface.get_width() // 2
         CONFIG["SCR"].blit(title_surface, (title_x, 50))
         
-        instruction_text = TextObject(INSTRUCTIONS[current_page], **textkargs)
-        CONFIG["SCR"].blit(instruction_text, (X, Y - 30))
+        instruction_text = CachedTextObject(INSTRUCTIONS[current_page], **textkargs)
+        BlitText(instruction_text, (X, Y - 30))
         
         if current_page == 0:
-            nav_text = "Siguiente [→]"
+            nav_text = SCREEN_TEXT["nav_first"]
         elif current_page == total_pages - 1:
-            nav_text = "Anterior [←]                    Comenzar [Enter]"
+            nav_text = SCREEN_TEXT["nav_last"]
         else:
-            nav_text = "Anterior [←]                    Siguiente [→]"
+            nav_text = SCREEN_TEXT["nav_middle"]
         
-        nav_surface = TextObject(nav_text, **navkargs)
-        CONFIG["SCR"].blit(nav_surface, (X, CONFIG["RECT"].bottom - 100))
+        nav_surface = CachedTextObject(nav_text, **navkargs)
+        BlitText(nav_surface, (X, CONFIG["RECT"].bottom - 100))
         
-        pygame.display.flip()
+        record = FlipScreen(record, "instructions")
         
         action = InstructionNavigationEvent()
         if action == "PREV" and current_page > 0:
@@ -304,29 +1005,34 @@ def DrawInstructions():
             break
 
 def StartTask():
-    textkargs = {"font": CONFIG["Font"], "width": CONFIG["WIDTH"], "height": CONFIG["HEIGHT"], "color": CONFIG["BLACK"]}
-    TEXT = "BIENVENIDO\n\nPresione [ENTER] para continuar"
+    textkargs = TextKargs("Font", "BLACK")
+    TEXT = SCREEN_TEXT["welcome"]
     CONFIG["starter"] = 0
     CONFIG["SCR"].fill(CONFIG["GRAY"])
-    TextStart = TextObject(TEXT, **textkargs)
+    TextStart = CachedTextObject(TEXT, **textkargs)
     X, Y = CONFIG["RECT"].centerx - (CONFIG["WIDTH"] // 2), CONFIG["RECT"].centery - (CONFIG["HEIGHT"] // 2)
 
-    t0 = pygame.time.get_ticks()
+    SetScreen("pause")
+    t0 = Ticks()
     MIN_TIME_RESPONSE = 500
+    record = None
     while CONFIG["starter"] != 1:
-        if (pygame.time.get_ticks() - t0) > MIN_TIME_RESPONSE:
+        if (Ticks() - t0) > MIN_TIME_RESPONSE:
             StartEvent()
         else:
             pygame.event.clear()
 
-        CONFIG["SCR"].blit(TextStart, (X, Y))
-        pygame.display.flip()
+        BlitText(TextStart, (X, Y))
+        record = FlipScreen(record, "pause")
 
 def GetFeedback(cue):
+    """Recompensa pre-sorteada en SCHEDULE para la opción elegida en este ensayo"""
     choice = CACHE['choice']
-    phase = CACHE['phase']
-    reward_prob = STIMULUS[cue][phase][choice]
-    reward = bernoulli.rvs(reward_prob, size=1)[0]
+    row = CACHE['row']
+    scheduled = str(SCHEDULE["cues"][SCHEDULE["stimulus"][row]])
+    if scheduled != cue:
+        raise ValueError(f"schedule row {row} is {scheduled}, screen shows {cue}")
+    reward = int(SCHEDULE["rewards"][row, choice])
     return reward
 
 def GetPosition(LAST_POS, KEYPRESS, KEYLIMIT):
@@ -345,123 +1051,527 @@ def GetPosition(LAST_POS, KEYPRESS, KEYLIMIT):
         CUR_POS = LAST_POS
     return CUR_POS
 
-def DrawEmpty(duration):
-    CONFIG["SCR"].fill(CONFIG["GRAY"])
-    STARTTIME = pygame.time.get_ticks() / 1000
-    while (pygame.time.get_ticks() / 1000) - STARTTIME < duration:
+def Now():
+    """Reloj de alta resolución usado para todos los tiempos de presentación (s)"""
+    return time.perf_counter()
+
+def NowNs():
+    """El mismo reloj que Now() en nanosegundos enteros (tiempos de respuesta)"""
+    return time.perf_counter_ns()
+
+def Ticks():
+    """Milisegundos desde pygame.init(), para los tiempos mínimos de respuesta"""
+    return pygame.time.get_ticks()
+
+def LSLClock():
+    """Reloj LSL de los marcadores (s); sin pylsl se usa Now()"""
+    return pylsl.local_clock() if pylsl is not None else Now()
+
+def MeasureRefreshRate(nframes=60):
+    """Mide el intervalo entre flips; si no hay vsync efectivo se usa CONFIG["FPS"]"""
+    pygame.display.flip()
+    times = []
+    for _ in range(nframes):
         pygame.display.flip()
+        times.append(Now())
+    intervals = sorted(b - a for a, b in zip(times, times[1:]))
+    median = intervals[len(intervals) // 2]
+    # Con vsync cada flip espera al refresco; bajo ~4 ms el flip no está sincronizado
+    FRAME["vsync"] = median > 0.004
+    FRAME["period"] = median if FRAME["vsync"] else 1 / CONFIG["FPS"]
+    FRAME["rate"] = 1 / FRAME["period"]
+    FRAME["last_flip"] = None
+    FRAME["deadline"] = None
+    print(f'✓ Refresh rate: {FRAME["rate"]:.2f} Hz ({"vsync" if FRAME["vsync"] else "timer-paced"})')
+
+def Frames(duration):
+    """Convierte una duración en segundos a frames a la frecuencia medida"""
+    return max(1, round(duration * FRAME["rate"]))
+
+def TimedFlip(rects=None):
+    """Único punto de presentación: hace flip (o update de rects) y registra el tiempo en FRAMELOG"""
+    if rects is None:
+        pygame.display.flip()
+    else:
+        pygame.display.update(rects)
+    FRAME["last_flip_ns"] = NowNs()
+    flip_time = Now()
+    i = FRAMELOG["count"] % FRAMELOG_SIZE
+    FRAMELOG["time"][i] = flip_time
+    FRAMELOG["screen"][i] = SCREEN_CODES[FRAME["screen"]]
+    FRAMELOG["partial"][i] = rects is not None
+    FRAMELOG["count"] += 1
+    FRAME["last_flip"] = flip_time
+    if behavior_outlet is not None:
+        SampleBehavior(flip_time)
+    return flip_time
+
+def SampleBehavior(flip_time):
+    """Agrega la muestra de conducta de este flip; al llenar un chunk lo encola"""
+    i = BEHAVIOR["count"]
+    screen = FRAME["screen"]
+    sample = BEHAVIOR["samples"][i]
+    sample[0] = SCREEN_CODES[screen]
+    position = CACHE["position"]
+    sample[1] = position if screen in ("choice", "confidence") and position is not None else -1
+    sample[2] = CACHE["phase"]
+    sample[3] = CACHE["block"]
+    sample[4] = CACHE["trial"]
+    BEHAVIOR["time"][i] = flip_time
+    BEHAVIOR["count"] = i + 1
+    if BEHAVIOR["count"] == BEHAVIOR_CHUNK:
+        FlushBehavior()
+
+def FlushBehavior():
+    """Encola una copia de las muestras acumuladas (push_chunk ocurre fuera del ciclo de frames)"""
+    n = BEHAVIOR["count"]
+    BEHAVIOR["count"] = 0
+    if n and "Behavior" in DISPATCHER["queues"]:
+        DISPATCHER["queues"]["Behavior"].put_nowait((BEHAVIOR["samples"][:n].copy(), BEHAVIOR["time"][:n].copy()))
+
+async def Flip():
+    """Presenta el frame y devuelve el tiempo del flip; cede el control al loop async"""
+    if not FRAME["vsync"] and FRAME["deadline"] is not None:
+        delay = FRAME["deadline"] - Now()
+        if delay > 0:
+            await asyncio.sleep(delay)
+    flip_time = TimedFlip()
+    # Sin vsync se avanza una grilla fija de frames; si hubo atraso se reinicia
+    if FRAME["deadline"] is None or flip_time - FRAME["deadline"] > FRAME["period"]:
+        FRAME["deadline"] = flip_time
+    FRAME["deadline"] += FRAME["period"]
+    await asyncio.sleep(0)
+    return flip_time
+
+def OpenScreen(screen, onset, marker=False):
+    """
+    Registra el onset de una pantalla; su offset es el onset de la pantalla siguiente.
+    marker: la pantalla levantó un marcador justo antes de su flip (se registra su desfase)
+    """
+    CloseScreen(onset)
+    record = {"screen": screen, "phase": CACHE["phase"], "block": CACHE["block"],
+              "trial": CACHE["trial"], "onset": onset, "offset": None, "frames": None,
+              "first": FRAMELOG["count"] - 1, "marker": DISPATCHER["last"] if marker else None,
+              "onset_ns": FRAME["last_flip_ns"]}
+    FRAME["screens"].append(record)
+    return record
+
+def CloseScreen(offset):
+    """Cierra la pantalla registrada que sigue abierta"""
+    if FRAME["screens"] and FRAME["screens"][-1]["offset"] is None:
+        FRAME["screens"][-1]["offset"] = offset
+
+def FlipScreen(record, screen, marker=False):
+    """
+    Flip de las pantallas con ciclo propio (instrucciones, inicio, pausas): abre su
+    registro en el primer flip y cuenta los flips. Devuelve el registro.
+    """
+    flip_time = TimedFlip()
+    if record is None:
+        record = OpenScreen(screen, flip_time, marker)
+        record["frames"] = 0
+    record["frames"] += 1
+    return record
+
+def SetScreen(screen):
+    """Define el tipo de pantalla que se registra en los próximos flips"""
+    FRAME["screen"] = screen
+
+def WriteTimingSummary(final=False):
+    """
+    Escribe un resumen de tiempos por pantalla (junto al CSV de datos) para las
+    pantallas ya cerradas; la pantalla aún visible queda para el siguiente resumen.
+    """
+    records = FRAME["screens"] if final else [r for r in FRAME["screens"] if r["offset"] is not None]
+    if not records:
+        return
+    if FRAMELOG["count"] - records[0]["first"] > FRAMELOG_SIZE:
+        print('  [Timing] Frame log overflow, oldest flips were overwritten')
+    if FRAMELOG["file"] is None:
+        # En modo append: una sesión retomada continúa el mismo resumen
+        path = os.path.join(CONFIG["DATAPATH"], CONFIG["FILE"].replace("_data_", "_timing_"))
+        FRAMELOG["file"] = open(path, 'a', newline="")
+    if FRAMELOG["file"].tell() == 0:
+        csv.writer(FRAMELOG["file"], delimiter=';').writerow(
+            ["phase", "block", "trial", "screen", "onset", "offset", "duration_ms", "frames",
+             "flips", "mean_ifi_ms", "max_ifi_ms", "dropped", "marker", "marker_lag_ms"])
+    w = csv.writer(FRAMELOG["file"], delimiter=';')
+    period = FRAME["period"]
+    for n, record in enumerate(records):
+        screens = FRAME["screens"]
+        last = screens[n + 1]["first"] if n + 1 < len(screens) else FRAMELOG["count"]
+        index = np.arange(record["first"], last) % FRAMELOG_SIZE
+        ifi = np.diff(FRAMELOG["time"][index])
+        # Solo los flips completos consecutivos permiten contar frames perdidos
+        full = ~(FRAMELOG["partial"][index][1:] | FRAMELOG["partial"][index][:-1])
+        dropped = int(np.maximum(np.rint(ifi[full] / period) - 1, 0).sum())
+        duration = (record["offset"] - record["onset"]) * 1000 if record["offset"] is not None else ""
+        marker, lag = "", ""
+        if record["marker"] is not None:
+            marker = record["marker"][1]
+            lag = round((record["onset"] - record["marker"][2]) * 1000, 3)
+        w.writerow([record["phase"], record["block"], record["trial"], record["screen"],
+                    record["onset"], record["offset"] if record["offset"] is not None else "",
+                    round(duration, 3) if duration != "" else "", record["frames"], len(index),
+                    round(ifi.mean() * 1000, 3) if ifi.size else "",
+                    round(ifi.max() * 1000, 3) if ifi.size else "", dropped, marker, lag])
+    FRAMELOG["file"].flush()
+    FRAME["screens"] = [] if final else FRAME["screens"][len(records):]
+    if final:
+        FRAMELOG["file"].close()
+        FRAMELOG["file"] = None
+
+# SINCRONIZACIÓN DE RELOJES
+
+def LocalClockOffsets(n=20):
+    """
+    Offsets (ms) de Now() y del reloj Unix respecto al reloj LSL: de n lecturas
+    LSL-reloj-LSL se usa la más corta, con la mitad de su duración como incertidumbre.
+    """
+    offsets = {}
+    for name, clock in (("now", Now), ("unix", lambda: time.time_ns() / 1e9)):
+        best = None
+        for _ in range(n):
+            before = LSLClock()
+            value = clock()
+            after = LSLClock()
+            if best is None or after - before < best[1]:
+                best = (value - (before + after) / 2, after - before)
+        offsets[name] = (best[0] * 1000, best[1] * 500)
+    return offsets
+
+async def PupilClockOffset():
+    """
+    Offset (ms) del reloj de Pupil Labs respecto al reloj LSL con el protocolo Time
+    Echo, medido directamente contra LSLClock(). None si no hay dispositivo, está
+    desconectado o no lo soporta; cada consulta espera a lo sumo PUPIL_TIMEOUT.
+    """
+    if pupil_device is None or time_echo is None or not PUPIL["online"]:
+        return None
+    status = await asyncio.wait_for(pupil_device.get_status(), CONFIG["PUPIL_TIMEOUT"])
+    port = status.phone.time_echo_port
+    if port is None:
+        return None
+    estimator = time_echo.TimeOffsetEstimator(pupil_device.address, port)
+    estimates = await asyncio.wait_for(
+        estimator.estimate(CONFIG["SYNC_ECHOES"], time_fn_ms=lambda: int(LSLClock() * 1000)), CONFIG["PUPIL_TIMEOUT"])
+    if estimates is None:
+        return None
+    # Time Echo da LSL - Pupil; la tabla usa reloj - LSL como los demás
+    offset = estimates.time_offset_ms
+    return (-offset.median, offset.std, estimates.roundtrip_duration_ms.mean, len(offset.measurements))
+
+async def SyncSample(context):
+    """Agrega una fila a la tabla de sincronización: offsets de cada reloj en un instante LSL"""
+    lsl_time = LSLClock()
+    local = LocalClockOffsets()
+    try:
+        pupil = await PupilClockOffset()
+    except Exception as e:
+        print(f'  [Sync] Pupil Labs time echo failed ({type(e).__name__}): {e}')
+        pupil = None
+    if SYNC["file"] is None:
+        # En modo append: una sesión retomada continúa la misma tabla
+        path = os.path.join(CONFIG["DATAPATH"], CONFIG["FILE"].replace("_data_", "_sync_"))
+        SYNC["file"] = open(path, 'a', newline="")
+    w = csv.writer(SYNC["file"], delimiter=';')
+    if SYNC["file"].tell() == 0:
+        w.writerow(["context", "phase", "block", "lsl_time", "now_offset_ms", "now_error_ms",
+                    "unix_offset_ms", "unix_error_ms", "pupil_offset_ms", "pupil_std_ms", "pupil_rtt_ms", "pupil_n"])
+    pupil_columns = [round(pupil[0], 3), round(pupil[1], 3), round(pupil[2], 3), pupil[3]] if pupil else ["", "", "", ""]
+    w.writerow([context, CACHE["phase"], CACHE["block"], round(lsl_time, 6),
+                round(local["now"][0], 4), round(local["now"][1], 4),
+                round(local["unix"][0], 4), round(local["unix"][1], 4)] + pupil_columns)
+    SYNC["file"].flush()
+    SYNC["rows"] += 1
+
+async def SyncService(context):
+    """Estima los offsets cada SYNC_INTERVAL segundos mientras dura la pausa"""
+    while True:
+        await SyncSample(context)
+        await asyncio.sleep(CONFIG["SYNC_INTERVAL"])
+
+def StartSync(context):
+    if CONFIG["FILE"] and SYNC["task"] is None:
+        SYNC["task"] = asyncio.create_task(SyncService(context))
+
+async def StopSync():
+    task, SYNC["task"] = SYNC["task"], None
+    if task is not None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+def WriteSyncFit():
+    """
+    Ajusta la deriva lineal de cada reloj sobre toda la tabla (incluidas las filas
+    previas a retomar) y la guarda en <id>_sync_<timestamp>.json para mapear tiempos.
+    """
+    if SYNC["file"] is None:
+        return
+    SYNC["file"].close()
+    SYNC["file"] = None
+    path = os.path.join(CONFIG["DATAPATH"], CONFIG["FILE"].replace("_data_", "_sync_"))
+    fits = FitClockDrift(path)
+    with open(path[:-len(".csv")] + ".json.tmp", "w") as file:
+        json.dump(fits, file, indent=1)
+    os.replace(path[:-len(".csv")] + ".json.tmp", path[:-len(".csv")] + ".json")
+    for clock, fit in fits.items():
+        print(f'✓ Clock {clock}: offset {fit["offset_ms"]:.3f} ms, drift {fit["drift_ppm"]:.2f} ppm, '
+              f'residual {fit["residual_ms"]:.3f} ms ({fit["n"]} estimates)')
+
+async def PresentScreen(screen, nframes, marker=False):
+    """Mantiene el contenido actual de la pantalla durante nframes refrescos"""
+    SetScreen(screen)
+    record = OpenScreen(screen, await Flip(), marker)
+    for _ in range(nframes - 1):
+        await Flip()
+    record["frames"] = nframes
+    return record
+
+async def DrawEmpty(duration):
+    CONFIG["SCR"].fill(CONFIG["GRAY"])
+    return await PresentScreen("empty", Frames(duration))
 
-def DrawFix():
+async def DrawFix():
     DURATION = 1.0
-    textkargs = {"font": CONFIG["FixFont"], "width": CONFIG["WIDTH"], "height": CONFIG["HEIGHT"], "color": CONFIG["BLACK"]}
+    textkargs = TextKargs("FixFont", "BLACK")
     CENTERX, CENTERY = CONFIG["RECT"].centerx, CONFIG["RECT"].centery
     X, Y = CENTERX - (CONFIG["WIDTH"] // 2), CENTERY - (CONFIG["HEIGHT"] // 2)
 
-    TextFix = TextObject("+", **textkargs)
+    TextFix = CachedTextObject("+", **textkargs)
     CONFIG["SCR"].fill(CONFIG["GRAY"])
+    BlitText(TextFix, (X, Y))
+    return await PresentScreen("fixation", Frames(DURATION))
 
-    STARTTIME = pygame.time.get_ticks() / 1000
-    while (pygame.time.get_ticks() / 1000) - STARTTIME < DURATION:
-        CONFIG["SCR"].blit(TextFix, (X, Y))
-        pygame.display.flip()
+def EventTime(event, previous_poll_ns, poll_ns):
+    """
+    Tiempo estimado del evento en perf_counter_ns: el punto medio entre el sondeo
+    anterior y el que lo detectó, con incertidumbre de ± medio intervalo de sondeo
+    (~1 ms en SliderLoop). Los eventos de pygame 2.6 no traen timestamp, así que este
+    es el caso usual; si el evento trae el timestamp de SDL (ms, misma base que
+    pygame.time.get_ticks) se usa ese.
+    """
+    ticks = getattr(event, "timestamp", None)
+    if ticks is not None:
+        return poll_ns - (Ticks() - ticks) * 1_000_000
+    return (previous_poll_ns + poll_ns) // 2
 
 def ScrollSliderEvent(KEYLIMIT):
+    poll_ns = NowNs()
+    previous_poll_ns = CACHE["poll_ns"] if CACHE["poll_ns"] is not None else poll_ns
+    CACHE["poll_ns"] = poll_ns
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
             pygame.quit()
             sys.exit()
         elif event.type == pygame.MOUSEBUTTONDOWN:
+            before = CACHE["position"]
+            event_ns = EventTime(event, previous_poll_ns, poll_ns)
             if event.button == 4:  # SCROLL UP
                 CACHE["continue"] = True
                 CACHE["position"] = GetPosition(CACHE["position"], "LEFT", KEYLIMIT)
+                LogStep(event_ns)
             elif event.button == 5:  # SCROLL DOWN
                 CACHE["continue"] = True
                 CACHE["position"] = GetPosition(CACHE["position"], "RIGHT", KEYLIMIT)
+                LogStep(event_ns)
             elif event.button == 2:  # SCROLL BUTTON CLICK
                 CACHE["continue"] = False
+                CACHE["response_ns"] = poll_ns
+                CACHE["response_event_ns"] = event_ns
             else:
                 CACHE["continue"] = True
+            LogWheel(event_ns, event.button, before, CACHE["position"])
+
+def LogStep(event_ns):
+    """Guarda el tiempo de un paso de la rueda en CACHE["steps"] (arreglo preasignado)"""
+    n = CACHE["nsteps"]
+    if n < STEPS_SIZE:
+        CACHE["steps"][n] = event_ns
+        CACHE["nsteps"] = n + 1
+
+def LogWheel(event_ns, button, before, after):
+    """Registra un evento del ratón en WHEELLOG (solo asignaciones en arreglos preasignados)"""
+    i = WHEELLOG["count"] % WHEELLOG_SIZE
+    WHEELLOG["time"][i] = event_ns
+    WHEELLOG["onset"][i] = FRAME["screens"][-1]["onset_ns"]
+    WHEELLOG["row"][i] = CACHE["row"]
+    WHEELLOG["screen"][i] = SCREEN_CODES[FRAME["screen"]]
+    WHEELLOG["button"][i] = button
+    WHEELLOG["before"][i] = before
+    WHEELLOG["after"][i] = after
+    WHEELLOG["count"] += 1
+
+def FlushWheelLog(final=False):
+    """
+    Agrega a <id>_wheel_<timestamp>.csv los eventos del ratón aún no guardados, con
+    la fila de SCHEDULE, fase, bloque y ensayo para unirlos con RESULTS.
+    """
+    start, stop = WHEELLOG["flushed"], WHEELLOG["count"]
+    if stop - start > WHEELLOG_SIZE:
+        print('  [Wheel] Event log overflow, oldest events were overwritten')
+        start = stop - WHEELLOG_SIZE
+    if WHEELLOG["file"] is None:
+        path = os.path.join(CONFIG["DATAPATH"], CONFIG["FILE"].replace("_data_", "_wheel_"))
+        WHEELLOG["file"] = open(path, 'a', newline="")
+    w = csv.writer(WHEELLOG["file"], delimiter=';')
+    if WHEELLOG["file"].tell() == 0:
+        w.writerow(["row", "phase", "block", "trial", "screen", "button", "before", "after", "time_ms", "time_ns"])
+    index = np.arange(start, stop) % WHEELLOG_SIZE
+    rows = WHEELLOG["row"][index]
+    names = np.array(list(SCREEN_CODES))[WHEELLOG["screen"][index]]
+    time_ms = np.round((WHEELLOG["time"][index] - WHEELLOG["onset"][index]) / 1e6, 3)
+    w.writerows(zip(rows.tolist(), SCHEDULE["phase"][rows].tolist(), SCHEDULE["block"][rows].tolist(),
+                    SCHEDULE["trial"][rows].tolist(), names.tolist(), WHEELLOG["button"][index].tolist(),
+                    WHEELLOG["before"][index].tolist(), WHEELLOG["after"][index].tolist(),
+                    time_ms.tolist(), WHEELLOG["time"][index].tolist()))
+    WHEELLOG["file"].flush()
+    WHEELLOG["flushed"] = stop
+    if final:
+        WHEELLOG["file"].close()
+        WHEELLOG["file"] = None
+
+async def SliderLoop(screen, KEYLIMIT, t0, DrawFrame, CursorRects):
+    """
+    Ciclo de respuesta con la rueda del ratón. DrawFrame dibuja la pantalla completa
+    y CursorRects(position) devuelve las áreas que cambian con el cursor.
+    Con CONFIG["DIRTY_RECTS"] la capa estática se dibuja una sola vez y luego, solo
+    cuando cambia CACHE["position"], se redibujan y actualizan esas áreas.
+    """
+    MIN_TIME_RESPONSE = 300
+    SetScreen(screen)
+    DrawFrame()
+    record = OpenScreen(screen, await Flip(), marker=True)
+    CACHE["poll_ns"] = record["onset_ns"]
+    CACHE["response_ns"] = CACHE["response_event_ns"] = None
+    CACHE["nsteps"] = 0
+    frames = 1
+    drawn, dirty = CACHE["position"], CursorRects(CACHE["position"])
+    while CACHE["continue"]:
+        if (Ticks() - t0) > MIN_TIME_RESPONSE:
+            ScrollSliderEvent(KEYLIMIT)
+        else:
+            pygame.event.clear()
+            CACHE["poll_ns"] = NowNs()
+
+        if not CONFIG["DIRTY_RECTS"]:
+            DrawFrame()
+            await Flip()
+            frames += 1
+            continue
+
+        if CACHE["position"] != drawn:
+            current = CursorRects(CACHE["position"])
+            rects = dirty + current
+            # Redibujar la pantalla recortada a las áreas del cursor anterior y el nuevo
+            for rect in rects:
+                CONFIG["SCR"].set_clip(rect)
+                DrawFrame()
+            CONFIG["SCR"].set_clip(None)
+            TimedFlip(rects)
+            frames += 1
+            drawn, dirty = CACHE["position"], current
+        await asyncio.sleep(0.001)  # Permitir procesamiento async
+    record["frames"] = frames
+    return record
+
+def ResponseTimes(record):
+    """
+    RT bruto (hasta el sondeo que detectó el clic) y corregido (hasta EventTime del
+    clic), en ms, y pasos de la rueda, todo relativo al flip de onset
+    """
+    onset_ns = record["onset_ns"]
+    rt_raw = round((CACHE["response_ns"] - onset_ns) / 1e6, 3)
+    rt_corrected = round((CACHE["response_event_ns"] - onset_ns) / 1e6, 3)
+    steps = ",".join(f"{step:.3f}" for step in ((CACHE["steps"][:CACHE["nsteps"]] - onset_ns) / 1e6).tolist())
+    return rt_raw, rt_corrected, steps
 
 # FUNCIONES ASYNC DEL EXPERIMENTO (PUPIL EYETRACKER)
 
-async def InitTask():
-    """Inicialización async del experimento - ORDEN CORREGIDO"""
-    global pupil_device, outlet
-    
-    print("\n" + "="*50)
-    print("INITIALIZING DEVICE CONNECTIONS")
-    print("="*50)
-    
-    # PASO 1:
-    # 1. Inicializar LSL (EEG) - USANDO LA CONFIGURACIÓN QUE FUNCIONA
-    print("\n1. Creating LSL stream for EEG (EMOTIV)...")
-    info = StreamInfo(name="TriggerStream",
+# Estado de cada paso de inicialización: nombre -> (ok, segundos, detalle)
+STARTUP = OrderedDict()
+
+async def StartupStep(name, step):
+    """Ejecuta un paso de inicialización (corutina o función) y registra estado y duración"""
+    t0 = time.perf_counter()
+    try:
+        ok, detail = (await step) if asyncio.iscoroutine(step) else step()
+    except Exception as e:
+        ok, detail = False, f"{type(e).__name__}: {e}"
+    STARTUP[name] = (ok, time.perf_counter() - t0, detail)
+    return ok
+
+def CreateOutlet():
+    """1. Stream LSL de marcadores para EEG (EMOTIV) - CONFIGURACIÓN QUE FUNCIONA"""
+    global outlet
+    if not LoadBackend("EEG"):
+        return False, BACKENDS["EEG"]["error"] or "disabled"
+    info = pylsl.StreamInfo(name="TriggerStream",
                       type="Markers",
                       channel_count=1,
                       channel_format="int32", 
                       source_id="TaskNotebook") 
-    outlet = StreamOutlet(info)
-    print('✓ LSL stream created successfully')
-    print('  Please connect to EMOTIV application now...')
-    input("  Press ENTER when EMOTIV is connected...")
-    
-    # 2. Conectar con Pupil Labs
-    print("\n2. Connecting to Eyetracker (Pupil Labs)...")
-    print("   Searching for device (10 seconds)...")
-    
-    async with Network() as network:
+    outlet = pylsl.StreamOutlet(info)
+    if CONFIG["BEHAVIOR_STREAM"]:
+        CreateBehaviorOutlet()
+        return True, "TriggerStream + BehaviorStream"
+    return True, "TriggerStream"
+
+def CreateBehaviorOutlet():
+    """Stream LSL de conducta, una muestra por flip (tasa irregular: sin flips si nada cambia)"""
+    global behavior_outlet
+    info = pylsl.StreamInfo(name="BehaviorStream",
+                      type="Behavior",
+                      channel_count=len(BEHAVIOR_CHANNELS),
+                      nominal_srate=pylsl.IRREGULAR_RATE,
+                      channel_format="int32",
+                      source_id="TaskNotebookBehavior")
+    channels = info.desc().append_child("channels")
+    for label in BEHAVIOR_CHANNELS:
+        channels.append_child("channel").append_child_value("label", label)
+    behavior_outlet = pylsl.StreamOutlet(info, chunk_size=BEHAVIOR_CHUNK)
+
+async def ConnectPupil():
+    """2. Búsqueda de Pupil Labs (hasta 10 s) e inicio de grabación"""
+    global pupil_device
+    if not await asyncio.to_thread(LoadBackend, "Eyetracker"):
+        return False, BACKENDS["Eyetracker"]["error"] or "disabled"
+    async with realtime_api.Network() as network:
         dev_info = await network.wait_for_new_device(timeout_seconds=10)
     
     if dev_info is None:
-        print("✗ No Pupil Labs device found. Continuing without eye-tracking...")
         pupil_device = None
-    else:
-        pupil_device = Device.from_discovered_device(dev_info)
-        await pupil_device.__aenter__()
-        # Iniciar grabación
-        recording_id = await pupil_device.recording_start()
-        print(f"✓ Pupil Labs connected (Recording ID: {recording_id})")
-    
-    # 3. Verificar Shimmer
-    print("\n3. Checking Shimmer markers...")
+        return False, "no device found, continuing without eye-tracking"
+    # El dispositivo queda en pupil_device solo con la grabación iniciada
+    device = realtime_api.Device.from_discovered_device(dev_info)
+    try:
+        await device.__aenter__()
+        recording_id = await device.recording_start()
+    except Exception as e:
+        try:
+            await device.__aexit__(None, None, None)
+        except Exception:
+            pass
+        pupil_device = None
+        return False, f"recording could not start ({type(e).__name__}: {e})"
+    pupil_device = device
+    return True, f"recording {recording_id}"
+
+def ProbeShimmer():
+    """3. Verificar que pyautogui puede mover el mouse para los marcadores Shimmer"""
+    global SHIMMER_ENABLED
+    if not LoadBackend("Shimmer"):
+        SHIMMER_ENABLED = False
+        return False, BACKENDS["Shimmer"]["error"] or "disabled"
     try:
         current_pos = pyautogui.position()
-        print(f'✓ Shimmer markers ready (mouse at {current_pos})')
-    except:
-        print('✗ Shimmer markers disabled')
-        global SHIMMER_ENABLED
+    except Exception as e:
         SHIMMER_ENABLED = False
-    
-    print("\n" + "="*50)
-    print("DEVICE INITIALIZATION COMPLETE")
-    print(f"EEG (LSL): ✓ Connected")
-    print(f"Eyetracker: {'✓ Connected' if pupil_device else '✗ Disabled'}")
-    print(f"Shimmer: {'✓ Ready' if SHIMMER_ENABLED else '✗ Disabled'}")
-    print("="*50 + "\n")
-    
-    #  PASO 2: PEDIR ID
-    id_subject = input("Please enter participant ID: ")
-    CACHE["id"] = id_subject
-    CONFIG["FILE"] = str(id_subject) + "_data_" + datetime.now().strftime('%Y-%m-%d-%H-%M-%S') + '.csv'
-    CONFIG["PATH"] = os.path.abspath(os.curdir)
-    CONFIG["DATAPATH"] = os.path.join(CONFIG["PATH"], "data")
+        return False, f"disabled ({e})"
+    return True, f"mouse at {tuple(current_pos)}"
 
-    if not os.path.exists(CONFIG["DATAPATH"]):
-        os.makedirs(CONFIG["DATAPATH"])
-    
-    input("Press ENTER to start the experiment...")
-    
-    # Inicializar pygame
-    pygame.init()
-    infoObject = pygame.display.Info()
-    CONFIG["SIZE"] = (infoObject.current_w, infoObject.current_h)
-    CONFIG["SCR"] = pygame.display.set_mode(CONFIG["SIZE"], pygame.FULLSCREEN)
-    pygame.mouse.set_visible(True)
-    pygame.display.flip()
-    clock = pygame.time.Clock()
-    clock.tick(CONFIG["FPS"])
-
-    # Configurar fuentes
+def LoadFonts():
+    """Carga de fuentes (la búsqueda de fuentes del sistema es lenta)"""
     CONFIG["Font"] = pygame.font.SysFont("Arial", 30)
     CONFIG["FixFont"] = pygame.font.SysFont("Arial", 30)
     CONFIG["TitleFont"] = pygame.font.SysFont("Arial", 30)
@@ -473,10 +1583,104 @@ async def InitTask():
     CONFIG["NavigationFont"] = pygame.font.SysFont("Arial", 24)
     CONFIG["StimFont"] = pygame.font.Font("umeboshi.ttf", 100)
     CONFIG["Stim2Font"] = pygame.font.Font("umeboshi.ttf", 60)
+    return True, "11 fonts"
+
+def InitDisplay():
+    """Ventana a pantalla completa; debe ejecutarse en el hilo principal"""
+    pygame.init()
+    infoObject = pygame.display.Info()
+    CONFIG["SIZE"] = (infoObject.current_w, infoObject.current_h)
+    CONFIG["SCR"] = None
+    if CONFIG["VSYNC"]:
+        try:
+            # vsync solo está disponible con SCALED/OPENGL en pygame 2
+            CONFIG["SCR"] = pygame.display.set_mode(CONFIG["SIZE"], pygame.FULLSCREEN | pygame.SCALED, vsync=1)
+        except pygame.error as e:
+            print(f'✗ VSync not available ({e}), using timer-paced frames')
+    if CONFIG["SCR"] is None:
+        CONFIG["SCR"] = pygame.display.set_mode(CONFIG["SIZE"], pygame.FULLSCREEN)
+    pygame.mouse.set_visible(True)
+    MeasureRefreshRate()
 
     CONFIG["RECT"] = CONFIG["SCR"].get_rect()
     CONFIG["WIDTH"] = CONFIG["SIZE"][0] - (CONFIG["SIZE"][0] // 10)
     CONFIG["HEIGHT"] = CONFIG["SIZE"][1] - (CONFIG["SIZE"][1] // 10)
+    return True, f"{CONFIG['SIZE'][0]}x{CONFIG['SIZE'][1]} @ {FRAME['rate']:.1f} Hz"
+
+def PrintStartupTable():
+    print("\n" + "="*50)
+    print("DEVICE INITIALIZATION COMPLETE")
+    print("="*50)
+    order = ["EEG (LSL)", "Eyetracker", "Shimmer", "Fonts", "Display"]
+    for name in sorted(STARTUP, key=lambda n: order.index(n) if n in order else len(order)):
+        ok, seconds, detail = STARTUP[name]
+        print(f"{name:<12} {'✓' if ok else '✗'} {seconds:6.2f} s  {detail}")
+    print("="*50 + "\n")
+
+async def InitTask():
+    """
+    Inicialización async del experimento. LSL, Pupil Labs, Shimmer y las fuentes se
+    preparan en paralelo mientras el operador confirma EMOTIV e ingresa el ID.
+    """
+    print("\n" + "="*50)
+    print("INITIALIZING DEVICE CONNECTIONS")
+    CheckSession()
+    StartDispatcher()
+    OpenMetrics()
+    print("="*50)
+    print("Starting LSL, Pupil Labs discovery, Shimmer probe and font loading...")
+
+    pygame.font.init()
+    steps = {
+        "EEG (LSL)": asyncio.create_task(StartupStep("EEG (LSL)", asyncio.to_thread(CreateOutlet))),
+        "Eyetracker": asyncio.create_task(StartupStep("Eyetracker", ConnectPupil())),
+        "Shimmer": asyncio.create_task(StartupStep("Shimmer", asyncio.to_thread(ProbeShimmer))),
+        "Fonts": asyncio.create_task(StartupStep("Fonts", asyncio.to_thread(LoadFonts))),
+    }
+
+    # El stream LSL debe existir antes de conectar EMOTIV
+    await steps["EEG (LSL)"]
+    if outlet is not None:
+        print('  Please connect to EMOTIV application now...')
+        await asyncio.to_thread(input, "  Press ENTER when EMOTIV is connected...")
+    
+    CONFIG["PATH"] = os.path.abspath(os.curdir)
+    CONFIG["DATAPATH"] = os.path.join(CONFIG["PATH"], "data")
+    if not os.path.exists(CONFIG["DATAPATH"]):
+        os.makedirs(CONFIG["DATAPATH"])
+
+    if CONFIG["RESUME"] is not None:
+        # Retomar: mismo archivo, misma sesión compilada, desde el primer ensayo incompleto
+        rows, state = ResumeSession(CONFIG["RESUME"])
+        print(f'✓ Resuming {CONFIG["FILE"]} at trial {rows + 1}/{SCHEDULE["stimulus"].size} '
+              f'(checkpoint {state["saved"]}, seed {SCHEDULE["seed"]})')
+    else:
+        #  PEDIR ID (mientras continúa la búsqueda de Pupil Labs)
+        id_subject = await asyncio.to_thread(input, "Please enter participant ID: ")
+        CheckNewSession(id_subject)
+        CACHE["id"] = id_subject
+        CONFIG["FILE"] = str(id_subject) + "_data_" + datetime.now().strftime('%Y-%m-%d-%H-%M-%S') + '.csv'
+        OpenJournal(CONFIG["FILE"], RESULTS)
+
+        # Compilar la sesión completa (orden, posiciones iniciales y recompensas)
+        SCHEDULE.update(CompileSchedule(STIMULUS, SESSION["items"], SessionBlocks(SESSION), seed=CONFIG["SEED"]))
+        SaveSchedule(os.path.join(CONFIG["DATAPATH"], ScheduleFile()), SCHEDULE)
+        WriteCheckpoint()
+        print(f'✓ Session schedule compiled ({SCHEDULE["stimulus"].size} trials, seed {SCHEDULE["seed"]})')
+    
+    await asyncio.to_thread(input, "Press ENTER to start the experiment...")
+    
+    # Inicializar pygame (hilo principal) mientras terminan los demás pasos
+    await StartupStep("Display", InitDisplay)
+    await asyncio.gather(*steps.values())
+    PrintStartupTable()
+    if CONFIG["IMPORTTIME"]:
+        PrintImportReport()
+
+    for required in ("Display", "Fonts"):
+        if not STARTUP[required][0]:
+            print(f"✗ {required} initialization failed, cannot run the task")
+            await ExitTask()
 
 async def ExitTask():
     """Cierre async del experimento"""
@@ -484,6 +1688,23 @@ async def ExitTask():
     
     # Enviar marcador de fin
     await send_trigger_unified(MARKERS['EXPERIMENT_END'])
+    if CONFIG["FILE"]:
+        await SyncSample("end")
+    FlushBehavior()
+    await StopDispatcher()
+    
+    # Reconstruir el CSV final a partir de RESULTS
+    CloseJournal(CONFIG["FILE"], RESULTS)
+    if CONFIG["FILE"]:
+        # Sesión terminada: el checkpoint ya no permite retomarla ni la bloquea
+        if "stimulus" in SCHEDULE and len(RESULTS["reward"]) == SCHEDULE["stimulus"].size:
+            WriteCheckpoint(complete=True)
+        SaveColumns()
+        FlushWheelLog(final=True)
+        CloseScreen(Now())   # La última pantalla sigue visible hasta aquí
+        WriteTimingSummary(final=True)
+        WriteSyncFit()
+        WritePupilStats()
     
     # Cerrar conexión con Pupil Labs si está activa
     if pupil_device:
@@ -497,124 +1718,101 @@ async def ExitTask():
     pygame.quit()
     sys.exit()
 
-async def LoadStimulus(phase, block):
-    """Carga de estímulos con marcadores async"""
-    CACHE['phase'] = phase
-    CACHE['block'] = block
-    
-    # Enviar marcador de inicio de bloque
-    if phase == 1:
-        if block == 1:
-            await send_trigger_unified(MARKERS['BLOCK_START_PHASE1'], 
-                                     include_shimmer=True, 
-                                     shimmer_position='PHASE1_START')
-        else:
-            await send_trigger_unified(MARKERS['BLOCK_START_PHASE1'])
-    else:
-        if block == 1:
-            await send_trigger_unified(MARKERS['BLOCK_START_PHASE2'], 
-                                     include_shimmer=True, 
-                                     shimmer_position='PHASE2_START')
-        else:
-            await send_trigger_unified(MARKERS['BLOCK_START_PHASE2'])
-
-    items = []
-    for i in range(8):
-        items += [['AB', "EF"], ["CD", "GH"]]
-    for i in range(2):
-        items += [["AB", "GH"], ["CD", "EF"]]
-
-    random.shuffle(items)
-    pairs = [[''.join(s), ''.join(s)] for s in items]
-    items = flatten(items)
-    pairs = flatten(pairs)
-
-    CONFIG["stimulus"] = items
-    CONFIG["pairs"] = pairs
-
-async def BreakTask():
-    """Pausa async entre bloques"""
-    textkargs = {"font": CONFIG["Font"], "width": CONFIG["WIDTH"], "height": CONFIG["HEIGHT"], "color": CONFIG["BLACK"]}
-    TEXT = "PAUSA\n\nTome un breve momento para descansar.\n\nPresione [ENTER] para continuar"
-    CONFIG["starter"] = 0
-    CONFIG["SCR"].fill(CONFIG["GRAY"])
-    TextStart = TextObject(TEXT, **textkargs)
-    X, Y = CONFIG["RECT"].centerx - (CONFIG["WIDTH"] // 2), CONFIG["RECT"].centery - (CONFIG["HEIGHT"] // 2)
-    
-    # Enviar marcador de fin de bloque
-    phase = CACHE['phase']
-    if phase == 1:
-        await send_trigger_unified(MARKERS['BLOCK_END_PHASE1'])
-    else:
-        await send_trigger_unified(MARKERS['BLOCK_END_PHASE2'])
-    
-    t0 = pygame.time.get_ticks()
-    MIN_TIME_RESPONSE = 500
-    while CONFIG["starter"] != 1:
-        if (pygame.time.get_ticks() - t0) > MIN_TIME_RESPONSE:
-            StartEvent()
-        else:
-            pygame.event.clear()
-        CONFIG["SCR"].blit(TextStart, (X, Y))
-        pygame.display.flip()
-        await asyncio.sleep(0.01) 
-
-async def MidBreakTask():
-    """Pausa async a mitad del experimento"""
-    textkargs = {"font": CONFIG["Font"], "width": CONFIG["WIDTH"], "height": CONFIG["HEIGHT"], "color": CONFIG["BLACK"]}
-    TEXT = "¡LLEVAS MÁS DE LA MITAD COMPLETADA!\n\nTome un breve momento para descansar.\n\nPresione [ENTER] para continuar"
-    CONFIG["starter"] = 0
-    CONFIG["SCR"].fill(CONFIG["GRAY"])
-    TextStart = TextObject(TEXT, **textkargs)
-    X, Y = CONFIG["RECT"].centerx - (CONFIG["WIDTH"] // 2), CONFIG["RECT"].centery - (CONFIG["HEIGHT"] // 2)
-    
-    # Enviar marcador de fin de fase 1
-    await send_trigger_unified(MARKERS['BLOCK_END_PHASE1'], 
-                             include_shimmer=True, 
-                             shimmer_position='PHASE1_END')
-    
-    t0 = pygame.time.get_ticks()
-    MIN_TIME_RESPONSE = 500
-    while CONFIG["starter"] != 1:
-        if (pygame.time.get_ticks() - t0) > MIN_TIME_RESPONSE:
-            StartEvent()
-        else:
-            pygame.event.clear()
-        CONFIG["SCR"].blit(TextStart, (X, Y))
-        pygame.display.flip()
-        await asyncio.sleep(0.01)
+def CheckSession():
+    """Valida SESSION contra STIMULUS, MARKERS y SHIMMER_POSITIONS antes de conectar nada"""
+    errors = ValidateSession(SESSION, STIMULUS, MARKERS, SHIMMER_POSITIONS)
+    if errors:
+        raise ValueError("Invalid SESSION:\n  " + "\n  ".join(errors))
 
-async def QuitTask():
-    """Pantalla final async"""
-    textkargs = {"font": CONFIG["Font"], "width": CONFIG["WIDTH"], "height": CONFIG["HEIGHT"], "color": CONFIG["BLACK"]}
-    TEXT = "El experimento ha finalizado.\n\nMuchas gracias por participar.\n\nPresione [Q] para salir"
-    CONFIG["quit"] = 0
+def CompilePlan():
+    """
+    Resuelve cada bloque de SESSION una sola vez, antes de la primera pantalla: filas
+    de SCHEDULE, listas de estímulos y pares y códigos de marcador. Entre bloques solo
+    se cambian referencias.
+    """
+    PLAN.clear()
+    for spec in SESSION["blocks"]:
+        rows = BlockRows(SCHEDULE, spec["phase"], spec["block"])
+        if rows.size == 0:
+            raise ValueError(f'Block {spec["phase"]}.{spec["block"]} has no trials in the session schedule')
+        PLAN.append({
+            "phase": spec["phase"],
+            "block": spec["block"],
+            "rows": rows,
+            "stimulus": [str(c) for c in SCHEDULE["cues"][SCHEDULE["stimulus"][rows]]],
+            "pairs": [str(p) for p in SCHEDULE["pair_names"][SCHEDULE["pairs"][rows]]],
+            "start": (MARKERS[spec["start_marker"]], spec["start_shimmer"]),
+            "end": spec["end"],
+            "end_marker": (MARKERS[spec["end_marker"]], spec["end_shimmer"]),
+        })
+    return PLAN
+
+async def LoadStimulus(entry, marker=True):
+    """Inicio de un bloque de PLAN con su marcador (sin marcador al retomar a mitad de bloque)"""
+    CACHE['phase'] = entry["phase"]
+    CACHE['block'] = entry["block"]
+    if marker:
+        code, shimmer = entry["start"]
+        await send_trigger_unified(code, include_shimmer=shimmer is not None, shimmer_position=shimmer)
+    SCHEDULE["rows"] = entry["rows"]
+    CONFIG["stimulus"] = entry["stimulus"]
+    CONFIG["pairs"] = entry["pairs"]
+
+def SaveBlock():
+    """Fin de bloque: asegurar que el bloque completo esté en disco"""
+    FlushJournal(sync=CONFIG["JOURNAL_FSYNC"] != "never")
+    SaveColumns()
+    FlushWheelLog()
+    WriteTimingSummary()
+    PublishMetrics()
+
+async def PauseTask(entry):
+    """
+    Pantalla al terminar un bloque: pausa ("break", "midbreak") o pantalla final
+    ("quit"). Envía el marcador de fin del bloque y escribe sus datos con la pantalla
+    ya presentada; durante las pausas estima los offsets de reloj en segundo plano.
+    """
+    end = entry["end"]
+    flag = "quit" if end == "quit" else "starter"
+    textkargs = TextKargs("Font", "BLACK")
+    TEXT = SCREEN_TEXT[PAUSE_TEXT[end]]
+    CONFIG[flag] = 0
     CONFIG["SCR"].fill(CONFIG["GRAY"])
-    TextQuit = TextObject(TEXT, **textkargs)
+    TextPause = CachedTextObject(TEXT, **textkargs)
     X, Y = CONFIG["RECT"].centerx - (CONFIG["WIDTH"] // 2), CONFIG["RECT"].centery - (CONFIG["HEIGHT"] // 2)
     
-    # Enviar marcador de fin de fase 2
-    await send_trigger_unified(MARKERS['BLOCK_END_PHASE2'], 
-                             include_shimmer=True, 
-                             shimmer_position='PHASE2_END')
+    # Enviar marcador de fin de bloque
+    code, shimmer = entry["end_marker"]
+    await send_trigger_unified(code, include_shimmer=shimmer is not None, shimmer_position=shimmer)
     
-    t0 = pygame.time.get_ticks()
+    if end != "quit":
+        StartSync(end)
+    SetScreen("pause")
+    t0 = Ticks()
     MIN_TIME_RESPONSE = 500
-    while CONFIG["quit"] != 1:
-        if (pygame.time.get_ticks() - t0) > MIN_TIME_RESPONSE:
-            QuitEvent()
+    saved, record = False, None
+    while CONFIG[flag] != 1:
+        if (Ticks() - t0) > MIN_TIME_RESPONSE:
+            if end == "quit":
+                QuitEvent()
+            else:
+                StartEvent()
         else:
             pygame.event.clear()
-        CONFIG["SCR"].blit(TextQuit, (X, Y))
-        pygame.display.flip()
+        BlitText(TextPause, (X, Y))
+        record = FlipScreen(record, "pause", marker=True)
+        if not saved:
+            SaveBlock()
+            saved = True
         await asyncio.sleep(0.01)
+    await StopSync()
 
 async def DrawBinaryChoiceRect(stimulus, pairs):
     """Presentación async de elección binaria"""
-    textkargs = {"font": CONFIG["TitleFont"], "width": CONFIG["WIDTH"], "height": CONFIG["HEIGHT"], "color": CONFIG["BLACK"]}
-    stimkargs = {"font": CONFIG["StimFont"], "width": CONFIG["WIDTH"], "height": CONFIG["HEIGHT"], "color": CONFIG["BLACK"]}
-    markkargs = {"font": CONFIG["MarkFont"], "width": CONFIG["WIDTH"], "height": CONFIG["HEIGHT"], "color": CONFIG["BLUE"]}
-    instruckkargs = {"font": CONFIG["NavigationFont"], "width": CONFIG["WIDTH"], "height": 50, "color": CONFIG["BLUE"]}
+    textkargs = TextKargs("TitleFont", "BLACK")
+    stimkargs = TextKargs("StimFont", "BLACK")
+    markkargs = TextKargs("MarkFont", "BLUE")
+    instruckkargs = TextKargs("NavigationFont", "BLUE", 50)
     
     CENTERX, CENTERY = CONFIG["RECT"].centerx, CONFIG["RECT"].centery
     X, Y = CENTERX - (CONFIG["WIDTH"] // 2), CENTERY - (CONFIG["HEIGHT"] // 2)
@@ -624,39 +1822,37 @@ async def DrawBinaryChoiceRect(stimulus, pairs):
     STIM = CUE[0] + "   " + CUE[1]
 
     CACHE["continue"] = True
-    INIT_POSITION = random.randint(KEYLIMIT[0], KEYLIMIT[1])
+    INIT_POSITION = int(SCHEDULE["choice_init"][CACHE["row"]])
     CACHE["position"] = INIT_POSITION
 
     CONFIG["SCR"].fill(CONFIG["GRAY"])
-    TextMark = TextObject("▼", **markkargs)
-    TextStim = TextObject(STIM, **stimkargs)
-    TextFix = TextObject("+", **textkargs)
-    TextInstruct = TextObject("Gire la rueda del ratón para mover - Presione la rueda para confirmar", **instruckkargs)
+    TextMark = CachedTextObject("▼", **markkargs)
+    TextStim = CachedTextObject(STIM, **stimkargs)
+    TextFix = CachedTextObject("+", **textkargs)
+    TextInstruct = CachedTextObject(SCREEN_TEXT["choice_instruct"], **instruckkargs)
 
     POS, RPOS = [X-125, X+125], [CENTERX-185, CENTERX+60]
     
     # Enviar marcador de inicio de estímulo
     await send_trigger_unified(MARKERS['STIM_START'])
 
-    t0 = pygame.time.get_ticks()
-    MIN_TIME_RESPONSE = 300
-    while CACHE["continue"]:
-        if (pygame.time.get_ticks() - t0) > MIN_TIME_RESPONSE:
-            ScrollSliderEvent(KEYLIMIT)
-        else:
-            pygame.event.clear()
-
+    def DrawFrame():
         CONFIG["SCR"].fill(CONFIG["GRAY"])
         pygame.draw.rect(CONFIG["SCR"], CONFIG["BLUE"], [RPOS[CACHE["position"]], CENTERY-70, 130, 150], 2)
-        CONFIG["SCR"].blit(TextMark, (POS[CACHE["position"]], Y-100))
-        CONFIG["SCR"].blit(TextStim, (X, Y))
-        CONFIG["SCR"].blit(TextFix, (X, Y))
-        CONFIG["SCR"].blit(TextInstruct, (X, CONFIG["RECT"].bottom - 100))
-        pygame.display.flip()
-        await asyncio.sleep(0.001)  # Permitir procesamiento async
+        BlitText(TextMark, (POS[CACHE["position"]], Y-100))
+        BlitText(TextStim, (X, Y))
+        BlitText(TextFix, (X, Y))
+        BlitText(TextInstruct, (X, CONFIG["RECT"].bottom - 100))
+
+    def CursorRects(position):
+        return [pygame.Rect(RPOS[position], CENTERY-70, 130, 150), TextRect(TextMark, (POS[position], Y-100))]
 
-    rt = pygame.time.get_ticks() - t0
-    print(f'  Choice RT: {rt}ms')
+    t0 = Ticks()
+    record = await SliderLoop("choice", KEYLIMIT, t0, DrawFrame, CursorRects)
+
+    rt = Ticks() - t0
+    rt_raw, rt_corrected, steps = ResponseTimes(record)
+    print(f'  Choice RT: {rt_corrected:.1f}ms (raw {rt_raw:.1f}ms)')
     
     # Enviar marcador de respuesta
     await send_trigger_unified(MARKERS['STIM_RESPONSE'])
@@ -671,61 +1867,62 @@ async def DrawBinaryChoiceRect(stimulus, pairs):
     RESULTS["stimulus"].append(stimulus)
     RESULTS["responses"].append(CACHE["position"])
     RESULTS["rts"].append(rt)
+    RESULTS["rts_raw"].append(rt_raw)
+    RESULTS["rts_corrected"].append(rt_corrected)
+    RESULTS["steps"].append(steps)
 
 async def DrawConfidenceRatingRect(stimulus):
     """Escala de confianza async"""
-    textkargs = {"font": CONFIG["TitleFont"], "width": CONFIG["WIDTH"], "height": CONFIG["HEIGHT"], "color": CONFIG["BLACK"]}
-    tickskargs = {"font": CONFIG["TicksFont"], "width": CONFIG["WIDTH"], "height": CONFIG["HEIGHT"], "color": CONFIG["BLACK"]}
-    labskargs = {"font": CONFIG["LabsFont"], "width": CONFIG["WIDTH"], "height": CONFIG["HEIGHT"], "color": CONFIG["BLACK"]}
-    markkargs = {"font": CONFIG["MarkFont"], "width": CONFIG["WIDTH"], "height": CONFIG["HEIGHT"], "color": CONFIG["BLUE"]}
-    stimkargs = {"font": CONFIG["Stim2Font"], "width": CONFIG["WIDTH"], "height": CONFIG["HEIGHT"], "color": CONFIG["BLACK"]}
-    instruckkargs = {"font": CONFIG["NavigationFont"], "width": CONFIG["WIDTH"], "height": 50, "color": CONFIG["BLUE"]}
+    textkargs = TextKargs("TitleFont", "BLACK")
+    tickskargs = TextKargs("TicksFont", "BLACK")
+    labskargs = TextKargs("LabsFont", "BLACK")
+    markkargs = TextKargs("MarkFont", "BLUE")
+    stimkargs = TextKargs("Stim2Font", "BLACK")
+    instruckkargs = TextKargs("NavigationFont", "BLUE", 50)
 
     CENTERX, CENTERY = CONFIG["RECT"].centerx, CONFIG["RECT"].centery
     X, Y = CENTERX - (CONFIG["WIDTH"] // 2), CENTERY - (CONFIG["HEIGHT"] // 2)
 
     KEYLIMIT = (0, 9)
-    TITLE = "Confianza en su respuesta"
-    TICKS = "   ".join(["|", "|", "|", "|", "|", "|", "|", "|", "|", "|"])
-    LABS = "    ".join(["0", "1", "2", "3", "4", "5", "6", "7", "8", "9"])
+    TITLE = SCREEN_TEXT["confidence_title"]
+    TICKS = SCREEN_TEXT["confidence_ticks"]
+    LABS = SCREEN_TEXT["confidence_labs"]
 
     CUE = STIMULUS[stimulus][0]
     STIM = CUE[0] + "   " + CUE[1]
 
     CACHE["continue"] = True
-    CACHE["position"] = random.randint(KEYLIMIT[0], KEYLIMIT[1])
+    CACHE["position"] = int(SCHEDULE["confidence_init"][CACHE["row"]])
     POS = [X-193, X-150, X-106, X-63, X-22, X+22, X+63, X+106, X+150, X+193]
     RPOS = [CENTERX-120, CENTERX+30]
 
-    TextMark = TextObject("▼", **markkargs)
-    TextTitle = TextObject(TITLE, **textkargs)
-    TextTicks = TextObject(TICKS, **tickskargs)
-    TextLabs = TextObject(LABS, **labskargs)
-    TextStim = TextObject(STIM, **stimkargs)
-    TextInstruct = TextObject("Gire la rueda para ajustar - Presione la rueda para confirmar", **instruckkargs)
+    TextMark = CachedTextObject("▼", **markkargs)
+    TextTitle = CachedTextObject(TITLE, **textkargs)
+    TextTicks = CachedTextObject(TICKS, **tickskargs)
+    TextLabs = CachedTextObject(LABS, **labskargs)
+    TextStim = CachedTextObject(STIM, **stimkargs)
+    TextInstruct = CachedTextObject(SCREEN_TEXT["confidence_instruct"], **instruckkargs)
     
     # Enviar marcador de inicio de escala de confianza
     await send_trigger_unified(MARKERS['CONFIDENCE_START'])
     
-    t0 = pygame.time.get_ticks()
-    MIN_TIME_RESPONSE = 300
-    while CACHE["continue"]:
-        if (pygame.time.get_ticks() - t0) > MIN_TIME_RESPONSE:
-            ScrollSliderEvent(KEYLIMIT)
-        else:
-            pygame.event.clear()
-
+    def DrawFrame():
         CONFIG["SCR"].fill(CONFIG["GRAY"])
-        CONFIG["SCR"].blit(TextMark, (POS[CACHE["position"]], Y+50))
-        CONFIG["SCR"].blit(TextTitle, (X, Y-280))
-        CONFIG["SCR"].blit(TextTicks, (X, Y+100))
-        CONFIG["SCR"].blit(TextLabs, (X, Y+150))
-        CONFIG["SCR"].blit(TextStim, (X, Y-80))
-        CONFIG["SCR"].blit(TextInstruct, (X, CONFIG["RECT"].bottom - 100))
+        BlitText(TextMark, (POS[CACHE["position"]], Y+50))
+        BlitText(TextTitle, (X, Y-280))
+        BlitText(TextTicks, (X, Y+100))
+        BlitText(TextLabs, (X, Y+150))
+        BlitText(TextStim, (X, Y-80))
+        BlitText(TextInstruct, (X, CONFIG["RECT"].bottom - 100))
         pygame.draw.rect(CONFIG["SCR"], CONFIG["BLUE"], [RPOS[CACHE["choice"]], CENTERY-130, 90, 110], 2)
         pygame.draw.line(CONFIG["SCR"], CONFIG["BLACK"], (CENTERX-193, CENTERY+100), (CENTERX+193, CENTERY+100), 5)
-        pygame.display.flip()
-        await asyncio.sleep(0.001) 
+
+    def CursorRects(position):
+        return [TextRect(TextMark, (POS[position], Y+50))]
+
+    t0 = Ticks()
+    record = await SliderLoop("confidence", KEYLIMIT, t0, DrawFrame, CursorRects)
+    rt_raw, rt_corrected, steps = ResponseTimes(record)
     
     # Enviar marcador de respuesta de confianza
     confidence_value = CACHE["position"]
@@ -734,11 +1931,14 @@ async def DrawConfidenceRatingRect(stimulus):
     print(f'  Confidence response: {confidence_value}')
 
     RESULTS["confidence"].append(CACHE["position"])
+    RESULTS["conf_rts_raw"].append(rt_raw)
+    RESULTS["conf_rts_corrected"].append(rt_corrected)
+    RESULTS["conf_steps"].append(steps)
 
 async def DrawFeedback(reward):
     """Feedback async con marcadores"""
     DURATION = 0.5
-    FEEDBACK, COLOR = ("CORRECTO", CONFIG["GREEN"]) if bool(reward) else ("INCORRECTO", CONFIG["RED"])
+    FEEDBACK, COLOR = ("CORRECTO", "GREEN") if bool(reward) else ("INCORRECTO", "RED")
     
     # Enviar marcador de feedback
     if bool(reward):
@@ -746,83 +1946,96 @@ async def DrawFeedback(reward):
     else:
         await send_trigger_unified(MARKERS['FEEDBACK_INCORRECT'])
     
-    textkargs = {"font": CONFIG["FeedbackFont"], "width": CONFIG["WIDTH"], "height": CONFIG["HEIGHT"], "color": COLOR}
+    textkargs = TextKargs("FeedbackFont", COLOR)
     CENTERX, CENTERY = CONFIG["RECT"].centerx, CONFIG["RECT"].centery
     X, Y = CENTERX - (CONFIG["WIDTH"] // 2), CENTERY - (CONFIG["HEIGHT"] // 2)
 
     CONFIG["SCR"].fill(CONFIG["GRAY"])
-    TextFeedback = TextObject(FEEDBACK, **textkargs)
-
-    STARTTIME = pygame.time.get_ticks() / 1000
-    while (pygame.time.get_ticks() / 1000) - STARTTIME < DURATION:
-        CONFIG["SCR"].blit(TextFeedback, (X, Y))
-        pygame.display.flip()
-        await asyncio.sleep(0.001)
+    TextFeedback = CachedTextObject(FEEDBACK, **textkargs)
+    BlitText(TextFeedback, (X, Y))
+    await PresentScreen("feedback", Frames(DURATION), marker=True)
 
     RESULTS["reward"].append(reward)
 
-async def MainLoopTask():
-    """Loop principal async de trials"""
+async def MainLoopTask(start=0):
+    """Loop principal async de trials (desde el ensayo start del bloque)"""
     for trial, (stimulus, pairs) in enumerate(zip(CONFIG['stimulus'], CONFIG['pairs'])):
+        if trial < start:
+            continue
         CACHE['trial'] = trial
-        print(f"\nTrial {trial+1}/20 - Phase {CACHE['phase']}, Block {CACHE['block']}")
+        CACHE['row'] = SCHEDULE["rows"][trial]
+        print(f"\nTrial {trial+1}/{len(CONFIG['stimulus'])} - Phase {CACHE['phase']}, Block {CACHE['block']}")
         
-        DrawFix()
+        await DrawFix()
         await DrawBinaryChoiceRect(stimulus, pairs)
-        DrawFix()
+        await DrawFix()
         await DrawConfidenceRatingRect(stimulus)
         reward = GetFeedback(stimulus)
-        DrawFix()
+        await DrawFix()
         await DrawFeedback(reward)
-        SaveOutputs(CONFIG["FILE"], RESULTS)
+        AppendJournal(RESULTS)
+        WriteCheckpoint()
+        UpdateMetrics(len(RESULTS["reward"]) - 1)
+        PublishMetrics()
+    FlushBehavior()
 
 async def RunTask():
     """Función principal async del experimento"""
     global pupil_device
     
     await InitTask()
+    CompilePlan()
+    WarmSurfaceCache()
     StartTask()
-    DrawInstructions()
-    
-    # Enviar marcador de inicio del experimento
-    await send_trigger_unified(MARKERS['EXPERIMENT_START'])
+    if CONFIG["RESUME"] is None:
+        DrawInstructions()
+        # Enviar marcador de inicio del experimento
+        await send_trigger_unified(MARKERS['EXPERIMENT_START'])
+        status = "EXPERIMENT STARTED"
+    else:
+        await send_trigger_unified(MARKERS['EXPERIMENT_RESUME'])
+        status = "EXPERIMENT RESUMED"
+    await SyncSample("start")
     print("\n" + "="*50)
-    print("EXPERIMENT STARTED")
+    print(status)
     print("="*50)
 
-    # FASE 1 - Bloques 1 y 2
-    print("\n>>> PHASE 1 - BLOCK 1")
-    await LoadStimulus(phase=1, block=1)
-    await MainLoopTask()
-    await BreakTask()
-
-    print("\n>>> PHASE 1 - BLOCK 2")
-    await LoadStimulus(phase=1, block=2)
-    await MainLoopTask()
-    await MidBreakTask()
-
-    print("\n>>> PHASE 1 - BLOCK 3")
-    await LoadStimulus(phase=1, block=3)
-    await MainLoopTask()
-    await MidBreakTask()
-
-    # FASE 2 - Bloques 3 y 4
-    print("\n>>> PHASE 2 - BLOCK 1")
-    await LoadStimulus(phase=2, block=1)
-    await MainLoopTask()
-    await BreakTask()
-
-    print("\n>>> PHASE 2 - BLOCK 2")
-    await LoadStimulus(phase=2, block=2)
-    await MainLoopTask()
-    await BreakTask()
-    
-    print("\n>>> PHASE 2 - BLOCK 3")
-    await LoadStimulus(phase=2, block=3)
-    await MainLoopTask()
+    # Bloques de PLAN con su pantalla de cierre; al retomar se saltan los bloques
+    # ya completos y los ensayos ya presentados del bloque actual
+    for entry in PLAN:
+        if entry["rows"][-1] < CACHE["start_row"]:
+            continue
+        first = int(np.searchsorted(entry["rows"], CACHE["start_row"]))
+        print(f'\n>>> PHASE {entry["phase"]} - BLOCK {entry["block"]}')
+        await LoadStimulus(entry, marker=first == 0)
+        await MainLoopTask(first)
+        await PauseTask(entry)
 
-    await QuitTask()
     await ExitTask()
 
+def ParseArgs(argv=None):
+    """Opciones de línea de comandos: sistemas de marcadores habilitados y reporte de inicio"""
+    parser = argparse.ArgumentParser(description="Tarea de incertidumbre con marcadores EEG/ET/Shimmer")
+    parser.add_argument("--no-eeg", action="store_true", help="No crear el stream LSL (EEG)")
+    parser.add_argument("--no-eyetracker", action="store_true", help="No conectar Pupil Labs")
+    parser.add_argument("--no-shimmer", action="store_true", help="No enviar marcadores Shimmer")
+    parser.add_argument("--behavioral", action="store_true", help="Solo conductual: ningún sistema de marcadores")
+    parser.add_argument("--behavior-stream", action="store_true",
+                        help="Crear un segundo stream LSL con pantalla, cursor y ensayo en cada flip")
+    parser.add_argument("--metrics-port", type=int, default=CONFIG["METRICS_PORT"],
+                        help="Puerto UDP local para monitor.py (0: no publicar métricas)")
+    parser.add_argument("--importtime", action="store_true", help="Mostrar tiempos de importación")
+    parser.add_argument("--resume", metavar="ID", default=None, help="Retomar la última sesión de ID desde su checkpoint")
+    args = parser.parse_args(argv)
+    BACKENDS["EEG"]["enabled"] = not (args.no_eeg or args.behavioral)
+    BACKENDS["Eyetracker"]["enabled"] = not (args.no_eyetracker or args.behavioral)
+    BACKENDS["Shimmer"]["enabled"] = not (args.no_shimmer or args.behavioral)
+    CONFIG["IMPORTTIME"] = args.importtime
+    CONFIG["BEHAVIOR_STREAM"] = args.behavior_stream
+    CONFIG["METRICS_PORT"] = args.metrics_port or None
+    CONFIG["RESUME"] = args.resume
+    return args
+
 if __name__ == '__main__':
+    ParseArgs()
     asyncio.run(RunTask())
\ No newline at end of file
@@ -0,0 +1,121 @@
+"""
+Monitor del operador: muestra en la terminal las métricas que publica el script
+principal por UDP al completar cada ensayo (PublishMetrics), sin tocar la pantalla
+del participante ni su ciclo de frames.
+
+Muestra la precisión acumulada por par y fase (elección de la opción con mayor
+probabilidad de recompensa), la tendencia del RT (promedio móvil exponencial), el
+histograma de confianza y el estado de cada sistema de marcadores, con avisos cuando
+el participante parece desconectado de la tarea o un sistema falla.
+
+Uso:
+    python monitor.py --port 9871
+"""
+import argparse
+import json
+import socket
+import time
+from collections import deque
+
+SPARK = "▁▂▃▄▅▆▇█"
+STALE_S = 30.0       # Sin mensajes por más de esto: se avisa (las pausas no publican)
+MIN_RT_MS = 250      # RT promedio por debajo de esto sugiere respuestas al azar
+MAX_STREAK = 10      # Elecciones seguidas de la misma opción
+
+def Sparkline(values):
+    if not values:
+        return ""
+    low, high = min(values), max(values)
+    span = (high - low) or 1.0
+    return "".join(SPARK[int((v - low) / span * (len(SPARK) - 1))] for v in values)
+
+def Warnings(message):
+    """Avisos para el operador a partir de un mensaje de métricas"""
+    warnings = []
+    if message["rt_ewma"] is not None and message["rt_ewma"] < MIN_RT_MS:
+        warnings.append(f"fast responses: RT EWMA {message['rt_ewma']:.0f} ms")
+    if message["streak"] >= MAX_STREAK:
+        warnings.append(f"same option chosen {message['streak']} times in a row")
+    phase = str(message["phase"])
+    for key, (best, scored, trials, rewards) in message["accuracy"].items():
+        if key.split(":")[0] == phase and scored >= 10 and best / scored < 0.4:
+            warnings.append(f"{key} below chance: {best}/{scored}")
+    for sink, health in message["sinks"].items():
+        if health["errors"]:
+            warnings.append(f"{sink}: {health['errors']} errors")
+    pupil = message["pupil"]
+    if message["connected"].get("Eyetracker") and not pupil["online"]:
+        warnings.append(f"Pupil Labs offline, {pupil['buffered']} events buffered")
+    if pupil["dropped"]:
+        warnings.append(f"Pupil Labs: {pupil['dropped']} events dropped")
+    return warnings
+
+def Render(message, rts, received):
+    """Texto completo del panel para un mensaje"""
+    age = time.time() - received
+    total = f"/{message['total']}" if message["total"] else ""
+    lines = [
+        f"Participant {message['id']}  |  phase {message['phase']} block {message['block']} "
+        f"trial {message['trial'] + 1}  |  {message['trials']}{total} trials  |  update #{message['seq']} "
+        f"{age:.0f} s ago",
+        "",
+        f"{'pair':<8} {'best':>10} {'acc':>6} {'reward':>7}",
+    ]
+    for key in sorted(message["accuracy"]):
+        best, scored, trials, rewards = message["accuracy"][key]
+        accuracy = f"{best / scored:6.2f}" if scored else f"{'-':>6}"
+        lines.append(f"{key:<8} {f'{best}/{scored}':>10} {accuracy} {rewards / trials:7.2f}")
+    lines.append("")
+    if message["rt_ewma"] is not None:
+        lines.append(f"RT EWMA     {message['rt_ewma']:7.0f} ms  {Sparkline(list(rts))}")
+        lines.append(f"Conf RT     {message['conf_rt_ewma']:7.0f} ms")
+    counts = message["confidence"]
+    peak = max(counts) or 1
+    lines.append("Confidence")
+    for level, count in enumerate(counts):
+        lines.append(f"  {level} {'█' * round(20 * count / peak):<20} {count}")
+    lines.append("")
+    lines.append(f"{'sink':<12} {'conn':>5} {'sent':>7} {'errors':>7} {'queued':>7}")
+    for sink, health in message["sinks"].items():
+        connected = message["connected"].get(sink)
+        mark = "-" if connected is None else ("✓" if connected else "✗")
+        lines.append(f"{sink:<12} {mark:>5} {health['sent']:>7} {health['errors']:>7} {health['queued']:>7}")
+    warnings = Warnings(message)
+    if age > STALE_S:
+        warnings.append(f"no update for {age:.0f} s (break or task stopped)")
+    lines.append("")
+    lines += [f"⚠ {w}" for w in warnings] or ["✓ no warnings"]
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Monitor de métricas en vivo de la sesión")
+    parser.add_argument("--port", type=int, default=9871)
+    parser.add_argument("--history", type=int, default=60, help="Ensayos en la tendencia de RT")
+    args = parser.parse_args()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", args.port))
+    sock.settimeout(1.0)
+    print(f"Waiting for metrics on udp://127.0.0.1:{args.port} ...")
+
+    message, received, rts = None, None, deque(maxlen=args.history)
+    try:
+        while True:
+            try:
+                data, _ = sock.recvfrom(65536)
+            except socket.timeout:
+                data = None
+            if data is not None:
+                update = json.loads(data)
+                if message is None or update["id"] != message["id"] or update["seq"] < message["seq"]:
+                    rts.clear()   # Nueva sesión
+                if update["rt_ewma"] is not None and (message is None or update["trials"] != message["trials"]):
+                    rts.append(update["rt_ewma"])
+                message, received = update, time.time()
+            if message is not None:
+                print("\033[2J\033[H" + Render(message, rts, received), flush=True)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
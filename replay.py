@@ -0,0 +1,369 @@
+"""
+Sesión completa sin pantalla ni participante, con reloj virtual.
+
+Ejecuta RunTask del script principal tal cual, con el driver de video "dummy" de SDL
+y un loop de asyncio cuyo reloj es virtual: cada espera (asyncio.sleep, la grilla de
+frames de Flip) avanza el reloj en vez de dormir, y cada flip avanza al menos un
+periodo de refresco, como si hubiera vsync. Now, NowNs y Ticks del script leen ese
+reloj, así los tiempos de respuesta y de pantalla son los de una sesión real.
+
+Las respuestas se inyectan como eventos de pygame (rueda, clic central, teclas) antes
+de cada llamada a ScrollSliderEvent, StartEvent, InstructionNavigationEvent y
+QuitEvent. Pueden venir de un agente Q-learning simulado (como simulate.py) o de un
+CSV de una sesión real junto a su sesión compilada (_schedule_.npz). InitTask se
+reemplaza por HeadlessInit; los marcadores se registran con su tiempo virtual.
+
+Cada sesión escribe los mismos archivos que una sesión real (<id>_data_, _timing_ y
+_schedule_) más <id>_markers_<timestamp>.csv. Varias sesiones corren en paralelo,
+una por proceso.
+
+Uso:
+    python replay.py --replays 8 --workers 4 --seed 1 --datapath replays
+    python replay.py --script data/P01_data_2024-05-02-10-31-07.csv --datapath replays
+"""
+import argparse
+import asyncio
+import contextlib
+import csv
+import multiprocessing
+import os
+import selectors
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from taskdata import ImportTask, ReadSession, ToArray
+from taskschedule import CompileSchedule, LoadSchedule, SessionBlocks
+
+# Tamaños de LoadFonts, con la fuente por defecto de pygame si falta umeboshi.ttf
+DEFAULT_FONTS = {"Font": 30, "FixFont": 30, "TitleFont": 30, "FeedbackFont": 30, "MarkFont": 30,
+                 "TicksFont": 40, "LabsFont": 25, "InstructionFont": 28, "NavigationFont": 24,
+                 "StimFont": 100, "Stim2Font": 60}
+
+class VirtualClock:
+    def __init__(self):
+        self.t = 0.0
+        self.last_flip = -np.inf
+
+class VirtualSelector:
+    """
+    Selector que nunca bloquea mientras haya timers pendientes: si no hay I/O listo,
+    avanza el reloj virtual hasta el próximo timer en lugar de esperar.
+    """
+    def __init__(self, clock):
+        self.clock = clock
+        self.selector = selectors.DefaultSelector()
+
+    def select(self, timeout=None):
+        events = self.selector.select(None if timeout is None else 0)
+        if not events and timeout:
+            self.clock.t += timeout
+        return events
+
+    def __getattr__(self, name):
+        return getattr(self.selector, name)
+
+class MarkerRecorder:
+    """Reemplaza el outlet LSL: guarda (código, tiempo virtual) de cada marcador"""
+    def __init__(self):
+        self.samples = []
+
+    def push_sample(self, sample, timestamp=0.0):
+        self.samples.append((sample[0], timestamp))
+
+class BehaviorRecorder:
+    """Reemplaza el outlet LSL de conducta: guarda cada chunk con sus tiempos"""
+    def __init__(self):
+        self.chunks = []
+
+    def push_chunk(self, samples, timestamp=0.0):
+        self.chunks.append((np.array(samples), np.array(timestamp)))
+
+class AgentPolicy:
+    """Participante simulado: Q-learning con softmax, confianza y RT como en simulate.py"""
+    def __init__(self, task, alpha=0.3, beta=5.0, confidence_noise=1.0, seed=None):
+        self.task = task
+        self.alpha = alpha
+        self.beta = beta
+        self.confidence_noise = confidence_noise
+        self.rng = np.random.default_rng(seed)
+        self.Q = {}
+        self.learned = 0
+        self.p_right = 0.5
+
+    def Learn(self):
+        R = self.task.RESULTS
+        for i in range(self.learned, len(R["reward"])):
+            q = self.Q.setdefault(R["stimulus"][i], [0.5, 0.5])
+            q[R["responses"][i]] += self.alpha * (R["reward"][i] - q[R["responses"][i]])
+        self.learned = len(R["reward"])
+
+    def Target(self, screen):
+        """(posición final, tiempo de respuesta en s, tiempos de los pasos o None)"""
+        if screen == "choice":
+            self.Learn()
+            cue = self.task.CONFIG["stimulus"][self.task.CACHE["trial"]]
+            q = self.Q.setdefault(cue, [0.5, 0.5])
+            self.p_right = 1.0 / (1.0 + np.exp(-self.beta * (q[1] - q[0])))
+            position = int(self.rng.random() < self.p_right)
+        else:
+            p_chosen = self.p_right if self.task.CACHE["choice"] == 1 else 1.0 - self.p_right
+            certainty = np.clip(2.0 * p_chosen - 1.0, 0.0, 1.0)
+            position = int(np.clip(np.rint(9.0 * certainty + self.confidence_noise * self.rng.standard_normal()), 0, 9))
+        rt = 0.350 + 0.600 * (1.0 - abs(2.0 * self.p_right - 1.0)) * self.rng.lognormal(0.0, 0.3)
+        return position, rt, None
+
+class ScriptPolicy:
+    """Repite las respuestas y los RT de un CSV de sesión, ensayo por ensayo"""
+    def __init__(self, task, columns):
+        self.task = task
+        self.responses = ToArray(columns["responses"], int)
+        self.confidence = ToArray(columns["confidence"], int)
+        self.rts = self.Seconds(columns, "rts_corrected", "rts")
+        self.conf_rts = self.Seconds(columns, "conf_rts_corrected", None)
+        self.steps = columns.get("steps")
+        self.conf_steps = columns.get("conf_steps")
+
+    @staticmethod
+    def Seconds(columns, key, fallback):
+        values = ToArray(columns[key], float) if key in columns else np.full(len(columns["id"]), np.nan)
+        if fallback is not None and fallback in columns:
+            values = np.where(np.isnan(values), ToArray(columns[fallback], float), values)
+        return np.where(np.isnan(values), 1000.0, values) / 1000.0
+
+    @staticmethod
+    def Steps(column, i):
+        if column is None or not column[i]:
+            return None
+        return [float(step) / 1000.0 for step in column[i].split(",")]
+
+    def Target(self, screen):
+        R = self.task.RESULTS
+        if screen == "choice":
+            i = len(R["responses"])
+            return int(self.responses[i]), float(self.rts[i]), self.Steps(self.steps, i)
+        i = len(R["confidence"])
+        return int(self.confidence[i]), float(self.conf_rts[i]), self.Steps(self.conf_steps, i)
+
+class Responder:
+    """Inyecta los eventos de pygame que esperan las funciones de eventos del script"""
+    def __init__(self, task, policy):
+        self.task = task
+        self.policy = policy
+        self.record = None
+        self.actions = []
+        self.pages = 0
+
+    def Post(self, type, **attributes):
+        self.task.pygame.event.post(self.task.pygame.event.Event(type, attributes))
+
+    def Slider(self, KEYLIMIT):
+        """Antes de ScrollSliderEvent: planifica la pantalla nueva y envía los eventos que ya corresponden"""
+        pygame = self.task.pygame
+        record = self.task.FRAME["screens"][-1]
+        if record is not self.record:
+            self.record = record
+            target, rt, steps = self.policy.Target(record["screen"])
+            target = min(max(target, KEYLIMIT[0]), KEYLIMIT[1])
+            position = self.task.CACHE["position"]
+            n = abs(target - position)
+            button = 5 if target > position else 4
+            # Pasos de la rueda en los tiempos registrados si son coherentes con la
+            # posición final; si no, repartidos antes del clic central
+            if steps is None or len(steps) != n:
+                steps = [rt * (i + 1) / (n + 1) for i in range(n)]
+            self.actions = [(record["onset"] + step, button) for step in steps]
+            self.actions.append((record["onset"] + rt, 2))
+        now = self.task.Now()
+        while self.actions and self.actions[0][0] <= now:
+            _, button = self.actions.pop(0)
+            self.Post(pygame.MOUSEBUTTONDOWN, button=button, pos=(0, 0))
+
+    def Start(self):
+        self.Post(self.task.pygame.KEYDOWN, key=self.task.pygame.K_RETURN)
+
+    def Quit(self):
+        self.Post(self.task.pygame.KEYDOWN, key=self.task.pygame.K_q)
+
+    def Instructions(self):
+        pygame = self.task.pygame
+        self.pages += 1
+        key = pygame.K_RIGHT if self.pages < len(self.task.INSTRUCTIONS) else pygame.K_RETURN
+        self.Post(pygame.KEYDOWN, key=key)
+
+def Before(task, name, hook):
+    """Reemplaza task.<name> por una versión que llama primero a hook con los mismos argumentos"""
+    original = getattr(task, name)
+    def wrapper(*args, **kargs):
+        hook(*args, **kargs)
+        return original(*args, **kargs)
+    setattr(task, name, wrapper)
+
+def InstallClock(task, clock):
+    """Relojes del script sobre el reloj virtual; cada flip dura al menos un refresco"""
+    task.Now = lambda: clock.t
+    task.NowNs = lambda: int(round(clock.t * 1e9))
+    task.Ticks = lambda: int(clock.t * 1000)
+    original = task.TimedFlip
+    def TimedFlip(rects=None):
+        clock.t = max(clock.t, clock.last_flip + task.FRAME["period"])
+        clock.last_flip = clock.t
+        return original(rects)
+    task.TimedFlip = TimedFlip
+
+def MakeHeadlessInit(task, participant, datapath, schedule, recorder, behavior=None):
+    async def HeadlessInit():
+        """InitTask sin dispositivos ni preguntas al operador"""
+        for backend in task.BACKENDS.values():
+            backend["enabled"] = False
+        task.SHIMMER_ENABLED = False
+        task.CheckSession()
+        task.StartDispatcher()
+        task.outlet = recorder
+        task.behavior_outlet = behavior
+
+        task.CONFIG["PATH"] = os.path.abspath(os.curdir)
+        task.CONFIG["DATAPATH"] = os.path.abspath(datapath)
+        os.makedirs(task.CONFIG["DATAPATH"], exist_ok=True)
+        if schedule is None:
+            # Retomar la sesión del participante desde su checkpoint, como --resume
+            task.CONFIG["RESUME"] = participant
+            task.ResumeSession(participant)
+        else:
+            task.CheckNewSession(participant)
+            task.CACHE["id"] = participant
+            task.CONFIG["FILE"] = str(participant) + "_data_" + datetime.now().strftime('%Y-%m-%d-%H-%M-%S') + '.csv'
+            task.OpenJournal(task.CONFIG["FILE"], task.RESULTS)
+            task.SCHEDULE.update(schedule)
+            task.SaveSchedule(os.path.join(task.CONFIG["DATAPATH"], task.ScheduleFile()), task.SCHEDULE)
+            task.WriteCheckpoint()
+
+        # El reloj virtual ya modela el vsync; sin SCALED el flip del driver dummy no copia nada
+        task.CONFIG["VSYNC"] = False
+        task.pygame.font.init()
+        if not await task.StartupStep("Fonts", task.LoadFonts):
+            for key, size in DEFAULT_FONTS.items():
+                task.CONFIG[key] = task.pygame.font.Font(None, size)
+        await task.StartupStep("Display", task.InitDisplay)
+        if not task.STARTUP["Display"][0]:
+            raise RuntimeError(task.STARTUP["Display"][2])
+    return HeadlessInit
+
+def Replay(options):
+    """
+    Corre una sesión completa en este proceso. options: participant, datapath, seed,
+    script (CSV o None), schedule (.npz o None), resume, alpha, beta, confidence_noise,
+    behavior, verbose. Con resume se continúa la última sesión de participant en datapath.
+    """
+    t0 = time.perf_counter()
+    task = ImportTask()
+    if options.get("script"):
+        columns = ReadSession(options["script"])
+        schedule = None if options.get("resume") else LoadSchedule(options["schedule"])
+        policy = ScriptPolicy(task, columns)
+    else:
+        schedule = None if options.get("resume") else CompileSchedule(task.STIMULUS, task.SESSION["items"], SessionBlocks(task.SESSION), options["seed"])
+        policy = AgentPolicy(task, options["alpha"], options["beta"], options["confidence_noise"], options["seed"])
+
+    clock = VirtualClock()
+    recorder = MarkerRecorder()
+    behavior = BehaviorRecorder() if options.get("behavior") else None
+    responder = Responder(task, policy)
+    InstallClock(task, clock)
+    Before(task, "ScrollSliderEvent", responder.Slider)
+    Before(task, "StartEvent", responder.Start)
+    Before(task, "QuitEvent", responder.Quit)
+    Before(task, "InstructionNavigationEvent", responder.Instructions)
+    task.InitTask = MakeHeadlessInit(task, options["participant"], options["datapath"], schedule, recorder, behavior)
+
+    loop = asyncio.SelectorEventLoop(VirtualSelector(clock))
+    loop.time = lambda: clock.t
+    output = open(os.devnull, "w") if not options.get("verbose") else None
+    try:
+        with contextlib.redirect_stdout(output) if output else contextlib.nullcontext():
+            try:
+                loop.run_until_complete(task.RunTask())
+            except SystemExit:
+                pass   # ExitTask termina con sys.exit()
+            # Dejar terminar las tareas del despachador canceladas por StopDispatcher
+            pending = asyncio.all_tasks(loop)
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+    finally:
+        loop.close()
+        if output:
+            output.close()
+
+    filename = task.CONFIG["FILE"].replace("_data_", "_markers_")
+    with open(os.path.join(task.CONFIG["DATAPATH"], filename), "w", newline="") as file:
+        w = csv.writer(file, delimiter=';')
+        w.writerow(["seq", "code", "time"])
+        for seq, (code, timestamp) in enumerate(recorder.samples, start=1):
+            w.writerow([seq, code, round(timestamp, 6)])
+    if behavior is not None and behavior.chunks:
+        with open(os.path.join(task.CONFIG["DATAPATH"], filename.replace("_markers_", "_behavior_")), "w", newline="") as file:
+            w = csv.writer(file, delimiter=';')
+            w.writerow(task.BEHAVIOR_CHANNELS + ["time"])
+            for samples, times in behavior.chunks:
+                for sample, timestamp in zip(samples.tolist(), times.tolist()):
+                    w.writerow(sample + [round(timestamp, 6)])
+    return {
+        "participant": options["participant"],
+        "file": task.CONFIG["FILE"],
+        "trials": len(task.RESULTS["reward"]),
+        "markers": len(recorder.samples),
+        "session_s": clock.t,
+        "elapsed_s": time.perf_counter() - t0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Sesiones completas sin pantalla con reloj virtual")
+    parser.add_argument("--replays", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--datapath", default=os.path.join(os.path.abspath(os.curdir), "replays"))
+    parser.add_argument("--id", default="SIM", help="Prefijo del ID de cada sesión simulada")
+    parser.add_argument("--seed", type=int, default=None, help="Semilla base (sesión i usa seed + i)")
+    parser.add_argument("--alpha", type=float, default=0.3)
+    parser.add_argument("--beta", type=float, default=5.0)
+    parser.add_argument("--confidence-noise", type=float, default=1.0)
+    parser.add_argument("--script", default=None, help="CSV de una sesión real cuyas respuestas se repiten")
+    parser.add_argument("--schedule", default=None, help="Sesión compilada del CSV (por defecto su _schedule_.npz)")
+    parser.add_argument("--resume", metavar="ID", default=None, help="Retomar la sesión de ID en --datapath desde su checkpoint")
+    parser.add_argument("--behavior", action="store_true", help="Registrar el stream de conducta en <id>_behavior_<ts>.csv")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar la salida del script principal")
+    args = parser.parse_args()
+
+    if args.script:
+        schedule = args.schedule or args.script.replace("_data_", "_schedule_").replace(".csv", ".npz")
+        participant = ReadSession(args.script)["id"][0]
+        jobs = [{"participant": participant, "datapath": args.datapath, "script": args.script,
+                 "schedule": schedule, "resume": args.resume is not None, "behavior": args.behavior, "verbose": args.verbose}]
+    elif args.resume:
+        jobs = [{"participant": args.resume, "datapath": args.datapath, "seed": args.seed, "resume": True,
+                 "alpha": args.alpha, "beta": args.beta, "confidence_noise": args.confidence_noise,
+                 "behavior": args.behavior, "verbose": args.verbose}]
+    else:
+        jobs = [{"participant": f"{args.id}{i:03d}", "datapath": args.datapath,
+                 "seed": None if args.seed is None else args.seed + i, "alpha": args.alpha,
+                 "beta": args.beta, "confidence_noise": args.confidence_noise, "behavior": args.behavior, "verbose": args.verbose}
+                for i in range(args.replays)]
+
+    t0 = time.perf_counter()
+    if len(jobs) == 1:
+        summaries = [Replay(jobs[0])]
+    else:
+        # Un proceso nuevo por sesión: el script guarda su estado en variables globales
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=context, max_tasks_per_child=1) as pool:
+            summaries = list(pool.map(Replay, jobs))
+    for s in summaries:
+        print(f"  {s['file']}: {s['trials']} trials, {s['markers']} markers, "
+              f"{s['session_s'] / 60:.1f} min session in {s['elapsed_s']:.1f} s")
+    print(f"{len(summaries)} sessions in {time.perf_counter() - t0:.1f} s -> {args.datapath}")
+
+if __name__ == '__main__':
+    main()
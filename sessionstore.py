@@ -0,0 +1,259 @@
+"""
+Almacenamiento binario por columnas de RESULTS.
+
+Cada sesión se guarda en un único archivo <id>_data_<timestamp>.col junto al CSV:
+un encabezado JSON y, a continuación, cada columna como un arreglo de NumPy contiguo
+y alineado, de modo que los lectores pueden mapearlo en memoria sin copiar ni
+convertir texto. stimulus, pairs e id se guardan como códigos de categoría (los de
+la sesión compilada para stimulus y pairs) y steps/conf_steps como listas de largo
+variable (offsets + valores). Los valores faltantes de un ensayo incompleto son -1
+en las categorías, el máximo del tipo en los enteros y NaN en los reales.
+
+El índice del estudio (study.col) concatena todas las sesiones de un directorio en
+el mismo formato, con categorías unificadas y una columna de sesión, así un análisis
+abre todos los participantes con un solo mapeo en memoria. Se reconstruye solo si
+cambió alguna sesión.
+
+Uso:
+    python sessionstore.py --datapath data
+"""
+import argparse
+import json
+import os
+import numpy as np
+
+MAGIC = b"TASKCOL1"
+VERSION = 1
+ALIGN = 64
+STUDY_FILE = "study.col"
+
+# Tipo de cada columna de RESULTS; las columnas no listadas se guardan como categorías
+COLUMNS = {
+    "id" : "category",
+    "phase" : "u1",
+    "block" : "u1",
+    "trial" : "u2",
+    "pairs" : "category",
+    "stimulus" : "category",
+    "responses" : "u1",
+    "rts" : "i4",
+    "reward" : "u1",
+    "confidence" : "u1",
+    "rts_raw" : "f8",
+    "rts_corrected" : "f8",
+    "steps" : "ragged",
+    "conf_rts_raw" : "f8",
+    "conf_rts_corrected" : "f8",
+    "conf_steps" : "ragged",
+}
+
+def Align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+def Missing(dtype):
+    dtype = np.dtype(dtype)
+    return np.nan if dtype.kind == "f" else np.iinfo(dtype).max
+
+def EncodeColumn(key, values, rows, categories=None):
+    """Codifica una lista de RESULTS (completada hasta rows) como columna tipada"""
+    kind = COLUMNS.get(key, "category")
+    values = list(values) + [""] * (rows - len(values))
+    if kind == "category":
+        categories = [str(c) for c in categories] if categories is not None else []
+        lookup = {c: i for i, c in enumerate(categories)}
+        codes = np.empty(rows, dtype=np.int16)
+        for i, value in enumerate(values):
+            if value is None or value == "":
+                codes[i] = -1
+                continue
+            value = str(value)
+            if value not in lookup:
+                lookup[value] = len(categories)
+                categories.append(value)
+            codes[i] = lookup[value]
+        return {"name": key, "kind": kind, "categories": categories, "arrays": [codes]}
+    if kind == "ragged":
+        lists = [[float(x) for x in str(v).split(",")] if v not in (None, "") else [] for v in values]
+        offsets = np.zeros(rows + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(x) for x in lists])
+        flat = np.array([x for xs in lists for x in xs], dtype=np.float64)
+        return {"name": key, "kind": kind, "arrays": [offsets, flat]}
+    dtype = np.dtype(kind)
+    missing = Missing(dtype)
+    array = np.array([missing if v is None or v == "" else v for v in values], dtype=np.float64 if dtype.kind == "f" else np.int64)
+    return {"name": key, "kind": kind, "arrays": [array.astype(dtype)]}
+
+def WriteColumns(path, columns, rows, meta=None):
+    """Escribe columnas ya codificadas: MAGIC, largo del encabezado, encabezado JSON y bloques alineados"""
+    header = {"version": VERSION, "rows": rows, "meta": meta or {}, "columns": []}
+    offset = 0
+    for column in columns:
+        blocks = []
+        for array in column["arrays"]:
+            array = np.ascontiguousarray(array)
+            blocks.append({"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset})
+            offset = Align(offset + array.nbytes)
+        entry = {"name": column["name"], "kind": column["kind"], "blocks": blocks}
+        if "categories" in column:
+            entry["categories"] = column["categories"]
+        header["columns"].append(entry)
+    encoded = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    start = Align(len(MAGIC) + 8 + len(encoded))
+
+    with open(path + ".tmp", "wb") as file:
+        file.write(MAGIC)
+        file.write(np.uint64(len(encoded)).tobytes())
+        file.write(encoded)
+        for column, entry in zip(columns, header["columns"]):
+            for array, block in zip(column["arrays"], entry["blocks"]):
+                file.seek(start + block["offset"])
+                file.write(np.ascontiguousarray(array).tobytes())
+    os.replace(path + ".tmp", path)
+
+def SaveSession(path, resultsdict, categories=None, meta=None):
+    """
+    Guarda RESULTS por columnas. categories: {"stimulus": [...], "pairs": [...]} fija
+    los códigos (p. ej. los de SCHEDULE); las categorías nuevas se agregan al final.
+    """
+    categories = categories or {}
+    rows = max((len(values) for values in resultsdict.values()), default=0)
+    columns = [EncodeColumn(key, values, rows, categories.get(key)) for key, values in resultsdict.items()]
+    WriteColumns(path, columns, rows, meta)
+
+def ReadHeader(path):
+    """Encabezado JSON de un archivo .col y posición de inicio de los datos"""
+    with open(path, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a session column file")
+        length = int(np.frombuffer(file.read(8), dtype=np.uint64)[0])
+        header = json.loads(file.read(length).decode("utf-8"))
+    return header, Align(len(MAGIC) + 8 + length)
+
+def OpenSession(path):
+    """
+    Mapea en memoria un archivo .col. Devuelve (columns, header): columns[name] es un
+    arreglo de solo lectura (códigos para las categorías) o (offsets, valores) para
+    las columnas de largo variable. No copia datos.
+    """
+    header, start = ReadHeader(path)
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    columns = {}
+    for entry in header["columns"]:
+        arrays = []
+        for block in entry["blocks"]:
+            dtype = np.dtype(block["dtype"])
+            count = int(np.prod(block["shape"], dtype=np.int64))
+            begin = start + block["offset"]
+            arrays.append(data[begin:begin + count * dtype.itemsize].view(dtype).reshape(block["shape"]))
+        columns[entry["name"]] = tuple(arrays) if entry["kind"] == "ragged" else arrays[0]
+    return columns, header
+
+def Categories(header, name):
+    """Lista de categorías de una columna codificada"""
+    for entry in header["columns"]:
+        if entry["name"] == name:
+            return entry.get("categories", [])
+    raise KeyError(name)
+
+def Decode(columns, header, name):
+    """Valores de una columna de categorías como arreglo de strings ("" si falta)"""
+    labels = np.array(Categories(header, name) + [""])
+    return labels[columns[name]]
+
+def Ragged(columns, name, row):
+    """Lista de valores de una columna de largo variable para una fila"""
+    offsets, values = columns[name]
+    return values[offsets[row]:offsets[row + 1]]
+
+def FindColumnFiles(datapath):
+    if not os.path.isdir(datapath):
+        return []
+    return sorted(os.path.join(datapath, name) for name in os.listdir(datapath)
+                  if "_data_" in name and name.endswith(".col"))
+
+def BuildStudy(datapath, out=None, force=False):
+    """
+    Concatena todas las sesiones .col de datapath en study.col (una sola copia, al
+    construir). Las categorías se unifican entre sesiones y se agrega la columna
+    "session" con el archivo de origen; el encabezado lista cada sesión con su rango
+    de filas. Si ninguna sesión cambió (tamaño y mtime) no se reescribe.
+    """
+    out = out or os.path.join(datapath, STUDY_FILE)
+    files = FindColumnFiles(datapath)
+    stats = [{"file": os.path.basename(f), "size": os.path.getsize(f), "mtime": os.path.getmtime(f)} for f in files]
+    if not files:
+        return None, False
+    if not force and os.path.exists(out):
+        header, _ = ReadHeader(out)
+        known = [{k: s[k] for k in ("file", "size", "mtime")} for s in header["meta"].get("sessions", [])]
+        if known == stats:
+            return out, False
+
+    parts, sessions, total = {}, [], 0
+    kinds, categories = {}, {}
+    for path, stat in zip(files, stats):
+        columns, header = OpenSession(path)
+        if kinds and list(columns) != list(kinds):
+            raise ValueError(f"{path}: columns do not match {files[0]}")
+        rows = header["rows"]
+        sessions.append(dict(stat, id=header["meta"].get("id", ""), rows=rows, start=total))
+        total += rows
+        for entry in header["columns"]:
+            name, kind = entry["name"], entry["kind"]
+            kinds.setdefault(name, kind)
+            if kinds[name] != kind:
+                raise ValueError(f"{path}: column {name} is {kind}, expected {kinds[name]}")
+            if kind == "category":
+                # Recodificar a la lista unificada de categorías
+                merged = categories.setdefault(name, [])
+                remap = np.empty(len(entry["categories"]) + 1, dtype=np.int16)
+                for i, label in enumerate(entry["categories"]):
+                    if label not in merged:
+                        merged.append(label)
+                    remap[i] = merged.index(label)
+                remap[-1] = -1
+                parts.setdefault(name, []).append(remap[columns[name]])
+            else:
+                parts.setdefault(name, []).append(columns[name])
+
+    merged = []
+    for name, kind in kinds.items():
+        if kind == "ragged":
+            offsets = [np.zeros(1, dtype=np.int64)]
+            base = 0
+            for part_offsets, part_values in parts[name]:
+                offsets.append(part_offsets[1:] + base)
+                base += int(part_offsets[-1])
+            values = np.concatenate([part[1] for part in parts[name]]) if parts[name] else np.zeros(0)
+            merged.append({"name": name, "kind": kind, "arrays": [np.concatenate(offsets), values]})
+        elif kind == "category":
+            merged.append({"name": name, "kind": kind, "categories": categories[name],
+                           "arrays": [np.concatenate(parts[name])]})
+        else:
+            merged.append({"name": name, "kind": kind, "arrays": [np.concatenate(parts[name])]})
+    session = np.repeat(np.arange(len(sessions), dtype=np.int16), [s["rows"] for s in sessions])
+    merged.append({"name": "session", "kind": "category", "categories": [s["file"] for s in sessions],
+                   "arrays": [session]})
+    WriteColumns(out, merged, total, {"sessions": sessions})
+    return out, True
+
+def OpenStudy(datapath):
+    """Mapea en memoria el índice del estudio (todas las sesiones concatenadas)"""
+    return OpenSession(os.path.join(datapath, STUDY_FILE))
+
+def main():
+    parser = argparse.ArgumentParser(description="Índice binario por columnas de todas las sesiones")
+    parser.add_argument("--datapath", default=os.path.join(os.path.abspath(os.curdir), "data"))
+    parser.add_argument("--force", action="store_true", help="Reconstruir aunque ninguna sesión haya cambiado")
+    args = parser.parse_args()
+
+    path, built = BuildStudy(args.datapath, force=args.force)
+    if path is None:
+        print(f"No session column files in {args.datapath}")
+        return
+    header, _ = ReadHeader(path)
+    sessions = header["meta"]["sessions"]
+    print(f"{'Built' if built else 'Up to date'}: {path} ({len(sessions)} sessions, {header['rows']} trials)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Simulación de participantes sintéticos para la tarea de incertidumbre.
+
+Usa la misma estructura de bloques (SESSION) y las mismas
+probabilidades de recompensa (STIMULUS) que el script principal, leídas directamente
+de él. Cada agente aprende con Q-learning y elige con softmax; la confianza se lee de
+la probabilidad de la opción elegida. Todos los agentes avanzan en paralelo en
+arreglos de NumPy, un ensayo a la vez.
+
+Uso:
+    python simulate.py --agents 10000 --alpha 0.3 --beta 5 --seed 1 --out sim.npz
+"""
+import argparse
+import time
+import numpy as np
+
+from taskdata import LoadDefinitions
+from taskschedule import BlockDesign, SessionBlocks
+
+def SimulateSchedules(design, blocks, n_agents, rng):
+    """Órdenes de bloque de todos los agentes (mismo barajado por pares que LoadStimulus)"""
+    item_cues, item_pairs = design["item_cues"], design["item_pairs"]
+    m = len(item_cues)
+    stim, pairs, phase, block, trial = [], [], [], [], []
+    for block_phase, block_number in blocks:
+        order = rng.permuted(np.tile(np.arange(m), (n_agents, 1)), axis=1)
+        stim.append(item_cues[order].reshape(n_agents, 2 * m))
+        pairs.append(np.repeat(item_pairs[order], 2, axis=1))
+        phase.append(np.full(2 * m, block_phase, dtype=np.uint8))
+        block.append(np.full(2 * m, block_number, dtype=np.uint8))
+        trial.append(np.arange(2 * m, dtype=np.uint16))
+    return {
+        "stimulus" : np.concatenate(stim, axis=1),
+        "pairs" : np.concatenate(pairs, axis=1),
+        "phase" : np.concatenate(phase),
+        "block" : np.concatenate(block),
+        "trial" : np.concatenate(trial),
+    }
+
+def SimulateSessions(definitions, n_agents, alpha=0.3, alpha_sd=0.1, beta=5.0, beta_sd=1.0,
+                     confidence_noise=1.0, seed=None):
+    """
+    Simula n_agents sesiones completas. Devuelve (results, params): results tiene las
+    columnas principales de RESULTS como arreglos planos (agente x ensayo) y params los
+    parámetros verdaderos de cada agente.
+    """
+    rng = np.random.default_rng(seed)
+    design = BlockDesign(definitions["STIMULUS"], definitions["SESSION"]["items"])
+    schedule = SimulateSchedules(design, SessionBlocks(definitions["SESSION"]), n_agents, rng)
+    n_trials = schedule["phase"].size
+    n_cues = len(design["cues"])
+
+    params = {
+        "alpha" : np.clip(rng.normal(alpha, alpha_sd, n_agents), 0.01, 1.0),
+        "beta" : np.clip(rng.normal(beta, beta_sd, n_agents), 0.0, None),
+    }
+    # Recompensas pre-sorteadas para ambas opciones, como en CompileSchedule
+    reward_prob = design["probs"][schedule["stimulus"], schedule["phase"][None, :] - 1]
+    rewards = (rng.random((n_agents, n_trials, 2)) < reward_prob).astype(np.uint8)
+
+    Q = np.full((n_agents, n_cues, 2), 0.5)
+    agents = np.arange(n_agents)
+    responses = np.empty((n_agents, n_trials), dtype=np.uint8)
+    reward = np.empty((n_agents, n_trials), dtype=np.uint8)
+    confidence = np.empty((n_agents, n_trials), dtype=np.uint8)
+    rts = np.empty((n_agents, n_trials), dtype=np.int32)
+
+    for t in range(n_trials):
+        cue = schedule["stimulus"][:, t]
+        q = Q[agents, cue]
+        p_right = 1.0 / (1.0 + np.exp(-params["beta"] * (q[:, 1] - q[:, 0])))
+        choice = (rng.random(n_agents) < p_right).astype(np.intp)
+        r = rewards[agents, t, choice]
+        Q[agents, cue, choice] += params["alpha"] * (r - Q[agents, cue, choice])
+
+        # Confianza: certeza de la opción elegida en la escala 0-9
+        p_chosen = np.where(choice == 1, p_right, 1.0 - p_right)
+        certainty = 2.0 * p_chosen - 1.0
+        conf = np.rint(9.0 * np.clip(certainty, 0.0, 1.0) + confidence_noise * rng.standard_normal(n_agents))
+        responses[:, t] = choice
+        reward[:, t] = r
+        confidence[:, t] = np.clip(conf, 0, 9)
+        rts[:, t] = 350 + 600 * (1.0 - np.abs(2.0 * p_right - 1.0)) * rng.lognormal(0.0, 0.3, n_agents)
+
+    cues = np.array(design["cues"])
+    pair_names = np.array(design["pair_names"])
+    results = {
+        "id" : np.repeat(np.arange(n_agents), n_trials),
+        "phase" : np.tile(schedule["phase"], n_agents),
+        "block" : np.tile(schedule["block"], n_agents),
+        "trial" : np.tile(schedule["trial"], n_agents),
+        "pairs" : pair_names[schedule["pairs"]].ravel(),
+        "stimulus" : cues[schedule["stimulus"]].ravel(),
+        "responses" : responses.ravel(),
+        "rts" : rts.ravel(),
+        "reward" : reward.ravel(),
+        "confidence" : confidence.ravel(),
+    }
+    return results, params
+
+def Summary(definitions, results, n_agents):
+    """Exactitud (elegir la opción más probable) por fase y estímulo, entre agentes"""
+    design = BlockDesign(definitions["STIMULUS"], definitions["SESSION"]["items"])
+    cues = design["cues"]
+    stim = np.searchsorted(cues, results["stimulus"]).reshape(n_agents, -1)
+    phase = results["phase"].reshape(n_agents, -1)
+    responses = results["responses"].reshape(n_agents, -1)
+    confidence = results["confidence"].reshape(n_agents, -1)
+
+    rows = []
+    for p in sorted(set(phase[0].tolist())):
+        for c, cue in enumerate(cues):
+            probs = design["probs"][c, p - 1]
+            mask = (stim == c) & (phase == p)
+            if not mask.any():
+                continue
+            n = mask.sum(axis=1)
+            conf = (confidence * mask).sum(axis=1) / n
+            if probs[0] == probs[1]:
+                accuracy = np.full(n_agents, np.nan)
+            else:
+                best = int(np.argmax(probs))
+                accuracy = ((responses == best) & mask).sum(axis=1) / n
+            rows.append((p, cue, accuracy, conf))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulación vectorizada de participantes sintéticos")
+    parser.add_argument("--agents", type=int, default=10000)
+    parser.add_argument("--alpha", type=float, default=0.3)
+    parser.add_argument("--alpha-sd", type=float, default=0.1)
+    parser.add_argument("--beta", type=float, default=5.0)
+    parser.add_argument("--beta-sd", type=float, default=1.0)
+    parser.add_argument("--confidence-noise", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--out", default=None, help="Archivo .npz con las columnas de RESULTS simuladas")
+    args = parser.parse_args()
+
+    definitions = LoadDefinitions()
+    t0 = time.perf_counter()
+    results, params = SimulateSessions(definitions, args.agents, args.alpha, args.alpha_sd,
+                                       args.beta, args.beta_sd, args.confidence_noise, args.seed)
+    elapsed = time.perf_counter() - t0
+    print(f"Simulated {results['trial'].size:,} trials ({args.agents:,} agents) in {elapsed:.2f} s")
+
+    rows = Summary(definitions, results, args.agents)
+    print(f"\n{'phase':>5} {'stim':>5} {'accuracy':>10} {'sd':>7} {'confidence':>11}")
+    accuracy = {}
+    for p, cue, acc, conf in rows:
+        accuracy[(p, cue)] = acc
+        mean = f"{np.nanmean(acc):.3f}" if not np.isnan(acc).all() else "-"
+        sd = f"{np.nanstd(acc):.3f}" if not np.isnan(acc).all() else "-"
+        print(f"{p:>5} {cue:>5} {mean:>10} {sd:>7} {conf.mean():>11.2f}")
+
+    # Efecto de la reversión entre fases por estímulo (d de Cohen intra-sujeto)
+    print()
+    for cue in sorted({cue for _, cue in accuracy}):
+        if (1, cue) in accuracy and (2, cue) in accuracy:
+            diff = accuracy[(2, cue)] - accuracy[(1, cue)]
+            if np.isnan(diff).all():
+                continue
+            d = np.nanmean(diff) / np.nanstd(diff) if np.nanstd(diff) > 0 else np.inf
+            print(f"{cue}: phase 2 - phase 1 accuracy = {np.nanmean(diff):+.3f} (d = {d:.2f})")
+
+    if args.out:
+        np.savez_compressed(args.out, **results, **{"param_" + k: v for k, v in params.items()})
+        print(f"\nSaved {args.out}")
+
+if __name__ == '__main__':
+    main()
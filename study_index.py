@@ -0,0 +1,184 @@
+"""
+Índice incremental del estudio: una base SQLite (study_index.sqlite) en el directorio
+de datos con una tabla agregada por sesión, fase, bloque y estímulo, para responder
+preguntas sobre todas las sesiones sin volver a leer cada CSV.
+
+Cada ejecución compara tamaño y mtime de los <id>_data_<timestamp>.csv con los
+registrados y solo lee los archivos nuevos o modificados; los borrados salen del
+índice. Las tablas guardan sumas (no promedios) para que cualquier agregación sea
+exacta:
+
+    files   file, size, mtime, id, trials, complete
+    cues    file, id, phase, block, stimulus, trials, scored, best, rewards,
+            rt_sum, rt_n, conf_sum, conf_n
+    blocks  vista de cues sumada por file, id, phase y block
+
+"best" cuenta las elecciones de la opción con mayor probabilidad de recompensa en
+la fase; "scored" los ensayos en que esa opción existe (no en AB ni CD).
+rt_sum y conf_sum suman rts_corrected y conf_rts_corrected (ms desde el flip de
+onset); en los CSV anteriores, que no las tienen, rts (y sin RT de confianza).
+
+Uso:
+    python study_index.py --datapath data
+    python study_index.py --accuracy --phase 2
+    python study_index.py --query "SELECT id, SUM(best) * 1.0 / SUM(scored) FROM cues WHERE phase = 2 AND stimulus = 'EF' GROUP BY id"
+"""
+import argparse
+import os
+import sqlite3
+import time
+
+from taskdata import LoadDefinitions, FindSessions, ReadSession
+
+INDEX_FILE = "study_index.sqlite"
+SCHEMA_VERSION = 2   # Cambiar si se modifica lo que se agrega para reconstruir el índice
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (
+    file TEXT PRIMARY KEY, size INTEGER, mtime REAL, id TEXT, trials INTEGER, complete INTEGER);
+CREATE TABLE IF NOT EXISTS cues (
+    file TEXT, id TEXT, phase INTEGER, block INTEGER, stimulus TEXT,
+    trials INTEGER, scored INTEGER, best INTEGER, rewards INTEGER,
+    rt_sum REAL, rt_n INTEGER, conf_sum REAL, conf_n INTEGER,
+    PRIMARY KEY (file, phase, block, stimulus));
+CREATE INDEX IF NOT EXISTS cues_id ON cues (id, phase, block);
+CREATE VIEW IF NOT EXISTS blocks AS
+    SELECT file, id, phase, block, SUM(trials) AS trials, SUM(scored) AS scored, SUM(best) AS best,
+           SUM(rewards) AS rewards, SUM(rt_sum) AS rt_sum, SUM(rt_n) AS rt_n,
+           SUM(conf_sum) AS conf_sum, SUM(conf_n) AS conf_n
+    FROM cues GROUP BY file, id, phase, block;
+"""
+
+def SessionTrials(definitions):
+    """Ensayos de una sesión completa según SESSION (composición y número de bloques)"""
+    session = definitions["SESSION"]
+    return 2 * sum(count for count, pair in session["items"]) * len(session["blocks"])
+
+def Number(value):
+    return float(value) if value != "" else None
+
+def TimingColumn(columns, *names):
+    """Primera columna presente entre names (los CSV anteriores no tienen las corregidas)"""
+    for name in names:
+        if name in columns:
+            return columns[name]
+    return [""] * len(columns.get("reward", []))
+
+def AggregateSession(path, stimulus):
+    """
+    Lee un CSV de sesión y devuelve (id, ensayos completos, filas de cues): una fila por
+    fase, bloque y estímulo con las sumas de la tabla cues.
+    """
+    columns = ReadSession(path)
+    participant = columns["id"][0] if columns.get("id") else ""
+    # RT desde el flip de onset en ambos; en los CSV anteriores, el RT original de la
+    # elección y ninguno de confianza (nunca se guardó)
+    timing = {4: TimingColumn(columns, "rts_corrected", "rts"),
+              6: TimingColumn(columns, "conf_rts_corrected")}
+    groups, trials = {}, 0
+    for i in range(len(columns.get("reward", []))):
+        if columns["reward"][i] == "" or columns["responses"][i] == "":
+            break   # Los ensayos completos son un prefijo del archivo
+        trials += 1
+        phase, block, cue = int(columns["phase"][i]), int(columns["block"][i]), columns["stimulus"][i]
+        probs = stimulus[cue][phase]
+        best = None if probs[0] == probs[1] else int(probs[1] > probs[0])
+        row = groups.setdefault((phase, block, cue), [0, 0, 0, 0, 0.0, 0, 0.0, 0])
+        row[0] += 1
+        row[1] += best is not None
+        row[2] += best is not None and int(columns["responses"][i]) == best
+        row[3] += int(columns["reward"][i])
+        for offset, values in timing.items():
+            value = Number(values[i])
+            if value is not None:
+                row[offset] += value
+                row[offset + 1] += 1
+    rows = [(phase, block, cue, *values) for (phase, block, cue), values in sorted(groups.items())]
+    return participant, trials, rows
+
+def OpenIndex(path):
+    """Abre (o crea) el índice; si cambió SCHEMA_VERSION se vacía para reconstruirlo"""
+    db = sqlite3.connect(path)
+    db.executescript(SCHEMA)
+    version = db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+    if version is None or int(version[0]) != SCHEMA_VERSION:
+        db.execute("DELETE FROM files")
+        db.execute("DELETE FROM cues")
+        db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(SCHEMA_VERSION),))
+        db.commit()
+    return db
+
+def UpdateIndex(datapath, path=None, definitions=None):
+    """
+    Sincroniza el índice con los CSV de datapath. Devuelve (db, actualizados, borrados,
+    sin cambios); solo se leen los archivos cuyo tamaño o mtime cambió.
+    """
+    db = OpenIndex(path or os.path.join(datapath, INDEX_FILE))
+    known = {file: (size, mtime) for file, size, mtime in db.execute("SELECT file, size, mtime FROM files")}
+    files = {os.path.basename(f): f for f in FindSessions(datapath)}
+
+    removed = [file for file in known if file not in files]
+    updated, unchanged = [], 0
+    with db:
+        for file in removed:
+            db.execute("DELETE FROM files WHERE file = ?", (file,))
+            db.execute("DELETE FROM cues WHERE file = ?", (file,))
+        for file, full in files.items():
+            stat = os.stat(full)
+            if known.get(file) == (stat.st_size, stat.st_mtime):
+                unchanged += 1
+                continue
+            if definitions is None:
+                definitions = LoadDefinitions()   # Solo si hay algo que leer
+            participant, trials, rows = AggregateSession(full, definitions["STIMULUS"])
+            db.execute("DELETE FROM cues WHERE file = ?", (file,))
+            db.executemany("INSERT INTO cues VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                           [(file, participant) + row for row in rows])
+            complete = int(trials >= SessionTrials(definitions))
+            db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                       (file, stat.st_size, stat.st_mtime, participant, trials, complete))
+            updated.append(file)
+    return db, updated, removed, unchanged
+
+def PrintRows(cursor):
+    names = [d[0] for d in cursor.description]
+    print(";".join(names))
+    for row in cursor:
+        print(";".join("" if v is None else f"{v:.4f}" if isinstance(v, float) else str(v) for v in row))
+
+def main():
+    parser = argparse.ArgumentParser(description="Índice incremental y agregación de todas las sesiones")
+    parser.add_argument("--datapath", default=os.path.join(os.path.abspath(os.curdir), "data"))
+    parser.add_argument("--accuracy", action="store_true", help="Precisión y RT medios por fase y estímulo (sesiones completas)")
+    parser.add_argument("--phase", type=int, default=None, help="Limitar --accuracy a una fase")
+    parser.add_argument("--query", default=None, help="Consulta SQL sobre files, cues y blocks")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    db, updated, removed, unchanged = UpdateIndex(args.datapath)
+    sessions, complete, participants = db.execute(
+        "SELECT COUNT(*), COALESCE(SUM(complete), 0), COUNT(DISTINCT id) FROM files").fetchone()
+    print(f"{sessions} sessions ({complete} complete, {participants} participants): "
+          f"{len(updated)} parsed, {len(removed)} removed, {unchanged} unchanged "
+          f"in {(time.perf_counter() - t0) * 1e3:.0f} ms")
+
+    if args.accuracy:
+        t0 = time.perf_counter()
+        cursor = db.execute("""
+            SELECT phase, stimulus, COUNT(DISTINCT cues.file) AS sessions, SUM(cues.trials) AS trials,
+                   SUM(best) * 1.0 / NULLIF(SUM(scored), 0) AS accuracy,
+                   SUM(rewards) * 1.0 / SUM(cues.trials) AS reward_rate,
+                   SUM(rt_sum) / NULLIF(SUM(rt_n), 0) AS mean_rt,
+                   SUM(conf_sum) / NULLIF(SUM(conf_n), 0) AS mean_conf_rt
+            FROM cues JOIN files USING (file)
+            WHERE files.complete = 1 AND (? IS NULL OR phase = ?)
+            GROUP BY phase, stimulus ORDER BY phase, stimulus""", (args.phase, args.phase))
+        PrintRows(cursor)
+        print(f"({(time.perf_counter() - t0) * 1e3:.1f} ms)")
+    if args.query:
+        PrintRows(db.execute(args.query))
+    db.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Utilidades compartidas por los scripts de análisis: lectura de las definiciones de
+la tarea (STIMULUS, SESSION, ...) directamente desde el script principal, sin
+importarlo (no requiere pygame ni los dispositivos), importación del script para
+las herramientas que ejecutan sus funciones, lectura de los CSV de sesión y de la
+tabla de sincronización de relojes.
+"""
+import ast
+import csv
+import importlib.util
+import os
+import sys
+from collections import OrderedDict
+import numpy as np
+
+TASK_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main v3 EEG ET SH.py")
+
+def LoadDefinitions(path=TASK_SCRIPT):
+    """
+    Devuelve las asignaciones de nivel superior del script que son literales
+    (dict, list, ...) y los OrderedDict construidos a partir de literales.
+    """
+    with open(path, encoding="utf-8") as file:
+        tree = ast.parse(file.read(), filename=path)
+    definitions = {}
+    for node in tree.body:
+        if not isinstance(node, ast.Assign) or len(node.targets) != 1:
+            continue
+        target = node.targets[0]
+        if not isinstance(target, ast.Name):
+            continue
+        value = node.value
+        try:
+            if isinstance(value, ast.Call) and getattr(value.func, "id", None) == "OrderedDict":
+                definitions[target.id] = OrderedDict(ast.literal_eval(value.args[0]) if value.args else [])
+            else:
+                definitions[target.id] = ast.literal_eval(value)
+        except ValueError:
+            continue
+    return definitions
+
+def ImportTask(path=TASK_SCRIPT, name="task"):
+    """
+    Importa el script principal como módulo (su nombre tiene espacios). Requiere
+    pygame; los módulos de EEG, Pupil Labs y Shimmer solo se importan al habilitarlos.
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    if folder not in sys.path:
+        sys.path.insert(0, folder)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+def FindSessions(datapath):
+    """Archivos de sesión <id>_data_<timestamp>.csv escritos por SaveOutputs"""
+    if not os.path.isdir(datapath):
+        return []
+    return sorted(os.path.join(datapath, name) for name in os.listdir(datapath)
+                  if "_data_" in name and name.endswith(".csv"))
+
+def ReadSession(path):
+    """
+    Lee un CSV de sesión (separado por ';', encabezado = claves de RESULTS).
+    Devuelve un OrderedDict columna -> lista de strings; los campos vacíos que deja
+    zip_longest en columnas incompletas quedan como "".
+    """
+    # Misma codificación por defecto con la que escribe SaveOutputs
+    with open(path, newline="") as file:
+        reader = csv.reader(file, delimiter=';')
+        header = next(reader, [])
+        columns = OrderedDict((key, []) for key in header)
+        for row in reader:
+            row = row + [""] * (len(header) - len(row))
+            for key, value in zip(header, row):
+                columns[key].append(value)
+    return columns
+
+def ToArray(values, dtype=float):
+    """Convierte una columna de strings a arreglo numérico; "" pasa a NaN (o -1 en enteros)"""
+    missing = np.nan if np.dtype(dtype).kind == "f" else -1
+    return np.array([float(v) if v != "" else missing for v in values]).astype(dtype)
+
+SYNC_CLOCKS = ("now", "unix", "pupil")
+
+def FitClockDrift(path):
+    """
+    Ajuste lineal offset = offset_ms + drift * (t - t0) de cada reloj respecto al
+    reloj LSL, desde la tabla <id>_sync_<timestamp>.csv. Devuelve reloj -> ajuste
+    (solo los relojes con al menos una estimación).
+    """
+    columns = ReadSession(path)
+    t = ToArray(columns["lsl_time"])
+    fits = {}
+    for clock in SYNC_CLOCKS:
+        offset = ToArray(columns[f"{clock}_offset_ms"])
+        valid = ~np.isnan(offset)
+        if not valid.any():
+            continue
+        t0 = float(t[valid][0])
+        x, y = t[valid] - t0, offset[valid]
+        slope = np.polyfit(x, y, 1)[0] if np.ptp(x) > 0 else 0.0
+        intercept = float(np.mean(y - slope * x))
+        residual = y - (intercept + slope * x)
+        fits[clock] = {"t0": t0, "offset_ms": intercept, "drift_ppm": float(slope) * 1000,
+                       "residual_ms": float(np.sqrt(np.mean(residual ** 2))), "n": int(valid.sum())}
+    return fits
+
+def MapTime(lsl_time, fit):
+    """Tiempo LSL (s, escalar o arreglo) al reloj de un ajuste de FitClockDrift (s)"""
+    lsl_time = np.asarray(lsl_time, dtype=np.float64)
+    offset_ms = fit["offset_ms"] + fit["drift_ppm"] / 1000 * (lsl_time - fit["t0"])
+    return lsl_time + offset_ms / 1000
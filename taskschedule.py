@@ -0,0 +1,134 @@
+"""
+Compilación de la sesión completa antes del primer ensayo: orden de los pares en
+cada bloque, posiciones iniciales del cursor y recompensas pre-sorteadas para ambas
+opciones, todo desde un único np.random.Generator con semilla. También valida la
+definición declarativa de la sesión (SESSION del script principal).
+"""
+import numpy as np
+
+# Pantallas posibles al terminar un bloque
+BLOCK_ENDS = ("break", "midbreak", "quit")
+BLOCK_KEYS = ("phase", "block", "end", "start_marker", "start_shimmer", "end_marker", "end_shimmer")
+
+def SessionBlocks(session):
+    """(fase, bloque) de cada bloque de SESSION, en el orden de la sesión"""
+    return [(spec["phase"], spec["block"]) for spec in session["blocks"]]
+
+def ValidateSession(session, stimulus, markers, shimmer_positions):
+    """
+    Revisa la definición de la sesión: pares de estímulos existentes, fases con
+    probabilidades en STIMULUS, bloques únicos, pantallas de cierre conocidas (solo el
+    último con "quit"), marcadores de MARKERS y casillas de SHIMMER_POSITIONS.
+    Devuelve la lista de errores (vacía si es válida).
+    """
+    errors = []
+    items = session.get("items") or []
+    if not items:
+        errors.append("items: no pairs")
+    for i, item in enumerate(items):
+        count, pair = item
+        if not isinstance(count, int) or count < 1:
+            errors.append(f"items[{i}]: repetitions must be a positive integer, got {count!r}")
+        if len(pair) != 2 or any(cue not in stimulus for cue in pair):
+            errors.append(f"items[{i}]: {pair!r} is not a pair of STIMULUS keys")
+
+    phases = min(len(values) for values in stimulus.values()) - 1
+    blocks = session.get("blocks") or []
+    if not blocks:
+        errors.append("blocks: no blocks")
+    seen = set()
+    for i, spec in enumerate(blocks):
+        missing = [key for key in BLOCK_KEYS if key not in spec]
+        if missing:
+            errors.append(f"blocks[{i}]: missing {', '.join(missing)}")
+            continue
+        key = (spec["phase"], spec["block"])
+        if not 1 <= spec["phase"] <= phases:
+            errors.append(f"blocks[{i}]: phase {spec['phase']} has no reward probabilities in STIMULUS")
+        if key in seen:
+            errors.append(f"blocks[{i}]: block {key} appears twice")
+        seen.add(key)
+        if spec["end"] not in BLOCK_ENDS:
+            errors.append(f"blocks[{i}]: end must be one of {', '.join(BLOCK_ENDS)}")
+        elif (spec["end"] == "quit") != (i == len(blocks) - 1):
+            errors.append(f"blocks[{i}]: only the last block ends with quit")
+        for marker in ("start_marker", "end_marker"):
+            if spec[marker] not in markers:
+                errors.append(f"blocks[{i}]: {marker} {spec[marker]!r} is not in MARKERS")
+        for shimmer in ("start_shimmer", "end_shimmer"):
+            if spec[shimmer] is not None and spec[shimmer] not in shimmer_positions:
+                errors.append(f"blocks[{i}]: {shimmer} {spec[shimmer]!r} is not in SHIMMER_POSITIONS")
+    return errors
+
+def BlockDesign(stimulus, block_items):
+    """
+    Codifica la composición de un bloque: códigos de estímulo de cada par, código del
+    par y tabla de probabilidades de recompensa [cue, fase - 1, opción].
+    """
+    cues = sorted(stimulus)
+    items = [pair for count, pair in block_items for _ in range(count)]
+    pair_names = sorted({''.join(pair) for pair in items})
+    return {
+        "cues" : cues,
+        "pair_names" : pair_names,
+        "item_cues" : np.array([[cues.index(c) for c in pair] for pair in items], dtype=np.uint8),
+        "item_pairs" : np.array([pair_names.index(''.join(pair)) for pair in items], dtype=np.uint8),
+        "probs" : np.array([[stimulus[c][1], stimulus[c][2]] for c in cues], dtype=np.float64),
+    }
+
+def CompileSchedule(stimulus, block_items, blocks, seed=None):
+    """
+    stimulus: diccionario STIMULUS (símbolos y probabilidades por fase)
+    block_items: [(repeticiones, [cue, cue]), ...] que forman un bloque
+    blocks: [(phase, block), ...] en el orden de la sesión
+    Devuelve un diccionario de arreglos con una fila por ensayo.
+    """
+    seq = np.random.SeedSequence(seed)
+    rng = np.random.Generator(np.random.PCG64(seq))
+
+    design = BlockDesign(stimulus, block_items)
+    item_cues, item_pairs = design["item_cues"], design["item_pairs"]
+
+    phase, block, trial, stim, pairs = [], [], [], [], []
+    for block_phase, block_number in blocks:
+        # Igual que LoadStimulus: se baraja la lista de pares y luego se aplana
+        order = rng.permutation(len(item_cues))
+        stim.append(item_cues[order].ravel())
+        pairs.append(np.repeat(item_pairs[order], 2))
+        n = 2 * len(item_cues)
+        phase.append(np.full(n, block_phase, dtype=np.uint8))
+        block.append(np.full(n, block_number, dtype=np.uint8))
+        trial.append(np.arange(n, dtype=np.uint16))
+
+    schedule = {
+        "phase" : np.concatenate(phase),
+        "block" : np.concatenate(block),
+        "trial" : np.concatenate(trial),
+        "stimulus" : np.concatenate(stim),
+        "pairs" : np.concatenate(pairs),
+    }
+    n = schedule["stimulus"].size
+    schedule["choice_init"] = rng.integers(0, 2, size=n, dtype=np.uint8)
+    schedule["confidence_init"] = rng.integers(0, 10, size=n, dtype=np.uint8)
+
+    # Probabilidad de recompensa de cada opción según el par y la fase del ensayo
+    reward_prob = design["probs"][schedule["stimulus"], schedule["phase"] - 1]
+    schedule["rewards"] = (rng.random((n, 2)) < reward_prob).astype(np.uint8)
+
+    schedule["cues"] = np.array(design["cues"])
+    schedule["pair_names"] = np.array(design["pair_names"])
+    schedule["seed"] = np.array(str(seq.entropy))
+    return schedule
+
+def SaveSchedule(path, schedule):
+    """Guarda la sesión compilada como un archivo .npz comprimido"""
+    np.savez_compressed(path, **schedule)
+
+def LoadSchedule(path):
+    """Carga una sesión compilada guardada con SaveSchedule"""
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+def BlockRows(schedule, phase, block):
+    """Índices globales de los ensayos de un bloque, en orden de presentación"""
+    return np.flatnonzero((schedule["phase"] == phase) & (schedule["block"] == block))
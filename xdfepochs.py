@@ -0,0 +1,519 @@
+"""
+Épocas de EEG alrededor de los marcadores de la tarea, leídas de grabaciones XDF
+(LabRecorder) sin cargar el archivo en memoria.
+
+1. Índice: una pasada secuencial por los chunks del XDF lee los encabezados de cada
+   stream, los marcadores completos (TriggerStream) y, de los streams numéricos, solo
+   el tiempo de cada muestra y la posición de sus valores en el archivo. Se guarda en
+   <archivo>.index.npz y se reutiliza mientras el XDF no cambie (tamaño y mtime).
+2. Épocas: para los códigos pedidos se calcula la ventana de muestras de cada
+   marcador y se copian solo esas muestras, mapeando el XDF en memoria, a un arreglo
+   preasignado en disco (<out>.npy, épocas x muestras x canales, float32). Las
+   ventanas que salen de la grabación o cruzan un corte del stream quedan en NaN.
+3. Unión con RESULTS: los marcadores se agrupan por ensayo (de STIM_START al
+   feedback) y cada ensayo se ubica en la sesión contando BLOCK_START (bloques de
+   SESSION) y STIM_START (ensayos del bloque); se une a la fila del CSV con el mismo
+   phase/block/trial. Al retomar la tarea sigue tras el último ensayo con feedback
+   (el interrumpido no tiene fila); una grabación que empieza al retomar se cuenta
+   hacia atrás desde la última fila del CSV. El feedback y la confianza solo se
+   comparan con la fila. <out>.csv tiene una fila por época con el marcador y las
+   columnas de RESULTS; <out>.json los canales, la ventana y los streams usados.
+
+Los tiempos de cada stream se corrigen con sus ClockOffset (ajuste lineal), como
+hace pyxdf por defecto.
+
+Uso:
+    python xdfepochs.py sub-P01.xdf --data data/P01_data_2024-05-02-10-31-07.csv --codes 100 130 131 --tmin -0.2 --tmax 0.8 --out P01_feedback
+"""
+import argparse
+import csv
+import json
+import os
+import struct
+import time
+import xml.etree.ElementTree as ET
+import numpy as np
+
+from taskdata import LoadDefinitions, ReadSession
+from taskschedule import BlockDesign
+
+MAGIC = b"XDF:"
+INDEX_VERSION = 1   # Cambiar si se modifica el contenido del índice para reconstruirlo
+FORMATS = {"float32": "<f4", "double64": "<f8", "int8": "<i1", "int16": "<i2", "int32": "<i4", "int64": "<i8"}
+MARKER_STREAM = "TriggerStream"
+EPOCH_BATCH = 64    # Épocas copiadas por vez (acota la memoria de los índices de bytes)
+
+def ReadVarLen(file):
+    """Entero de largo variable de XDF: 1 byte con el número de bytes (1, 4 u 8) y el valor"""
+    size = file.read(1)
+    if not size:
+        raise EOFError
+    return int.from_bytes(file.read(size[0]), "little")
+
+def ParseHeader(xml):
+    root = ET.fromstring(xml)
+    labels = [c.findtext("label") or "" for c in root.iter("channel")]
+    count = int(root.findtext("channel_count") or 0)
+    return {
+        "name": root.findtext("name") or "",
+        "type": root.findtext("type") or "",
+        "channel_count": count,
+        "srate": float(root.findtext("nominal_srate") or 0),
+        "format": root.findtext("channel_format") or "",
+        "labels": labels if len(labels) == count else [f"ch{i + 1}" for i in range(count)],
+    }
+
+def SampleLayout(buf, n, width):
+    """
+    Tiempos (NaN si se omiten) y posición de los valores de n muestras numéricas de
+    width bytes dentro del contenido de un chunk. Casos usuales vectorizados: todas
+    con tiempo, o solo la primera (el resto se deduce de la frecuencia).
+    """
+    raw = np.frombuffer(buf, dtype=np.uint8)
+    explicit = 9 + width
+    if len(buf) == n * explicit and np.all(raw[0::explicit] == 8):
+        starts = np.arange(n, dtype=np.int64) * explicit
+        times = raw.reshape(n, explicit)[:, 1:9].copy().view("<f8").ravel()
+        return times, starts + 9
+    implicit = 1 + width
+    if n > 0 and len(buf) == explicit + (n - 1) * implicit and raw[0] == 8 and np.all(raw[explicit::implicit] == 0):
+        times = np.full(n, np.nan)
+        times[0] = struct.unpack_from("<d", buf, 1)[0]
+        offsets = np.empty(n, dtype=np.int64)
+        offsets[0] = 9
+        offsets[1:] = explicit + np.arange(n - 1, dtype=np.int64) * implicit + 1
+        return times, offsets
+    times, offsets, pos = np.full(n, np.nan), np.empty(n, dtype=np.int64), 0
+    for i in range(n):
+        if buf[pos] == 8:
+            times[i] = struct.unpack_from("<d", buf, pos + 1)[0]
+            pos += 9
+        else:
+            pos += 1
+        offsets[i] = pos
+        pos += width
+    return times, offsets
+
+def StringSamples(buf, n, channels):
+    """Tiempos y valores (primer canal) de n muestras de un stream de texto"""
+    times, values, pos = np.full(n, np.nan), [], 0
+    for i in range(n):
+        if buf[pos] == 8:
+            times[i] = struct.unpack_from("<d", buf, pos + 1)[0]
+            pos += 9
+        else:
+            pos += 1
+        for c in range(channels):
+            size = buf[pos]
+            length = int.from_bytes(buf[pos + 1:pos + 1 + size], "little")
+            pos += 1 + size
+            if c == 0:
+                values.append(buf[pos:pos + length].decode("utf-8"))
+            pos += length
+    return times, values
+
+def FillTimes(times, last, srate):
+    """Completa los tiempos omitidos con el anterior + 1/srate (last: último del chunk previo)"""
+    missing = np.isnan(times)
+    if not missing.any():
+        return times
+    step = 1.0 / srate if srate > 0 else 0.0
+    known = np.where(missing, -1, np.arange(times.size))
+    anchor = np.maximum.accumulate(known)
+    base = np.where(anchor >= 0, times[np.maximum(anchor, 0)], last)
+    steps = np.arange(times.size) - anchor
+    return np.where(missing, base + steps * step, times)
+
+def ScanXDF(path):
+    """
+    Pasada secuencial por el XDF. Devuelve {stream_id: stream}; cada stream tiene su
+    encabezado, los tiempos de sus muestras, los ClockOffset y, si es numérico, tramos
+    (primera muestra, posición en el archivo, paso en bytes) para ubicar sus valores;
+    el stream de marcadores guarda además los valores.
+    """
+    streams, pending = {}, {}
+    with open(path, "rb") as file:
+        if file.read(4) != MAGIC:
+            raise ValueError(f"{path} is not an XDF file")
+        while True:
+            try:
+                length = ReadVarLen(file)
+            except EOFError:
+                break
+            start = file.tell()
+            tag = int.from_bytes(file.read(2), "little")
+            if tag in (2, 3, 4, 6):
+                sid = int.from_bytes(file.read(4), "little")
+            if tag == 2:
+                header = ParseHeader(file.read(start + length - file.tell()))
+                header["width"] = np.dtype(FORMATS[header["format"]]).itemsize * header["channel_count"] \
+                    if header["format"] in FORMATS else 0
+                streams[sid] = dict(header, offsets=[])
+                pending[sid] = {"times": [], "runs": [], "values": [], "samples": 0, "last": np.nan}
+            elif tag == 3 and sid in streams:
+                stream, acc = streams[sid], pending[sid]
+                n = ReadVarLen(file)
+                base = file.tell()
+                buf = file.read(start + length - base)
+                if stream["width"]:
+                    times, offsets = SampleLayout(buf, n, stream["width"])
+                    # Tramos de paso constante: uno solo en los casos usuales
+                    steps = np.diff(offsets)
+                    for i in np.concatenate([[0], np.flatnonzero(steps[1:] != steps[:-1]) + 1]) if n else []:
+                        step = int(steps[i]) if i < steps.size else 0
+                        acc["runs"].append((acc["samples"] + int(i), base + int(offsets[i]), step))
+                    if stream["name"] == MARKER_STREAM or stream["type"] == "Markers":
+                        values = np.frombuffer(buf, dtype=np.uint8)[offsets[:, None] + np.arange(stream["width"])]
+                        acc["values"].append(values.copy().view(FORMATS[stream["format"]])[:, 0].astype(np.float64))
+                else:
+                    times, values = StringSamples(buf, n, stream["channel_count"])
+                    acc["values"].append(np.array([float(v) if v.strip().lstrip("-").isdigit() else np.nan
+                                                   for v in values]))
+                times = FillTimes(times, acc["last"], stream["srate"])
+                if n:
+                    acc["last"] = times[-1]
+                acc["times"].append(times)
+                acc["samples"] += n
+            elif tag == 4 and sid in streams:
+                streams[sid]["offsets"].append(struct.unpack("<dd", file.read(16)))
+            file.seek(start + length)
+
+    for sid, stream in streams.items():
+        acc = pending[sid]
+        stream["times"] = np.concatenate(acc["times"]) if acc["times"] else np.zeros(0)
+        stream["runs"] = np.array(acc["runs"], dtype=np.int64).reshape(-1, 3)
+        stream["values"] = np.concatenate(acc["values"]) if acc["values"] else np.zeros(0)
+        stream["offsets"] = np.array(stream["offsets"], dtype=np.float64).reshape(-1, 2)
+    return streams
+
+def IndexPath(path):
+    return path + ".index.npz"
+
+def SaveIndex(path, streams, stat):
+    arrays = {"meta": np.array(json.dumps({
+        "version": INDEX_VERSION, "size": stat.st_size, "mtime": stat.st_mtime,
+        "streams": {str(sid): {k: v for k, v in s.items() if not isinstance(v, np.ndarray)}
+                    for sid, s in streams.items()}}))}
+    for sid, stream in streams.items():
+        for key in ("times", "runs", "values", "offsets"):
+            arrays[f"{sid}_{key}"] = stream[key]
+    with open(IndexPath(path) + ".tmp", "wb") as file:
+        np.savez(file, **arrays)
+    os.replace(IndexPath(path) + ".tmp", IndexPath(path))
+
+def LoadIndex(path, force=False):
+    """Índice del XDF: el guardado si el archivo no cambió, o una pasada nueva. Devuelve (streams, reutilizado)"""
+    stat = os.stat(path)
+    if not force and os.path.exists(IndexPath(path)):
+        with np.load(IndexPath(path)) as data:
+            meta = json.loads(str(data["meta"]))
+            if (meta["version"], meta["size"], meta["mtime"]) == (INDEX_VERSION, stat.st_size, stat.st_mtime):
+                streams = {}
+                for sid, header in meta["streams"].items():
+                    streams[int(sid)] = dict(header, **{key: data[f"{sid}_{key}"]
+                                                        for key in ("times", "runs", "values", "offsets")})
+                return streams, True
+    streams = ScanXDF(path)
+    SaveIndex(path, streams, stat)
+    return streams, False
+
+def SyncedTimes(stream):
+    """Tiempos del stream en el reloj de la grabación: ajuste lineal de sus ClockOffset"""
+    offsets, times = stream["offsets"], stream["times"]
+    if offsets.shape[0] == 0:
+        return times
+    if offsets.shape[0] == 1 or np.ptp(offsets[:, 0]) == 0:
+        return times + offsets[:, 1].mean()
+    slope, intercept = np.polyfit(offsets[:, 0], offsets[:, 1], 1)
+    return times + intercept + slope * times
+
+def FindStream(streams, name=None, kind=None):
+    for sid, stream in streams.items():
+        if (name is None or stream["name"] == name) and (kind is None or stream["type"] == kind):
+            return sid
+    raise KeyError(f"no stream with name={name!r} type={kind!r}")
+
+def TaskCodes(markers, blocks):
+    """Códigos de MARKERS que usa el conteo de ensayos, con los de inicio y fin de cada bloque de SESSION"""
+    return {
+        "stim": markers["STIM_START"],
+        "feedback": {markers["FEEDBACK_CORRECT"]: 1, markers["FEEDBACK_INCORRECT"]: 0},
+        "confidence": {markers[f"CONFIDENCE_{k}"]: k for k in range(10)},
+        "starts": [markers[spec["start_marker"]] for spec in blocks],
+        "ends": [markers[spec["end_marker"]] for spec in blocks],
+        "start": markers["EXPERIMENT_START"],
+        "resume": markers["EXPERIMENT_RESUME"],
+        "end": markers["EXPERIMENT_END"],
+    }
+
+def RunTrials(codes, lo, hi, task):
+    """
+    Ensayos del tramo [lo, hi) de la grabación: [índice de STIM_START, índices de sus
+    marcadores, feedback, confianza], de STIM_START al feedback (feedback None si el
+    ensayo se interrumpió). Los marcadores de bloque cierran el ensayo en curso.
+    """
+    trials, current = [], None
+    boundaries = set(task["starts"]) | set(task["ends"]) | {task["start"], task["resume"], task["end"]}
+    for i in range(lo, hi):
+        code = codes[i]
+        if code == task["stim"]:
+            current = [i, [i], None, None]
+            trials.append(current)
+        elif code in boundaries:
+            current = None
+        elif current is not None and current[2] is None:
+            current[1].append(i)
+            if code in task["confidence"]:
+                current[3] = task["confidence"][code]
+            elif code in task["feedback"]:
+                current[2] = task["feedback"][code]
+    return trials
+
+def CountForward(codes, lo, hi, state, task, length):
+    """
+    (bloque de SESSION, ensayo) de cada STIM_START del tramo contando hacia adelante
+    desde state (bloque actual, ensayo siguiente): BLOCK_START pasa al bloque
+    siguiente y STIM_START al ensayo siguiente. Devuelve también los marcadores de
+    bloque que no siguen a SESSION.
+    """
+    (block, trial), labels, stray = state, {}, 0
+    starts, ends = task["starts"], task["ends"]
+    for i in range(lo, hi):
+        code = codes[i]
+        if code in starts:
+            block, trial = block + 1, 0
+            stray += block >= len(starts) or code != starts[block]
+        elif code in ends:
+            stray += not 0 <= block < len(ends) or code != ends[block]
+        elif code == task["stim"]:
+            if 0 <= block < len(starts) and trial < length:
+                labels[i] = (block, trial)
+            trial += 1
+    return labels, stray
+
+def CountBackward(codes, lo, last, anchor, task, length):
+    """
+    Como CountForward, pero hacia atrás desde el STIM_START last, que es el ensayo
+    anchor (bloque, ensayo): un BLOCK_END vuelve al último ensayo del bloque anterior.
+    """
+    block, trial = anchor[0], anchor[1] + 1
+    labels, stray = {}, 0
+    starts, ends = task["starts"], task["ends"]
+    for i in range(last, lo - 1, -1):
+        code = codes[i]
+        if code in ends:
+            block, trial = block - 1, length
+            stray += block < 0 or code != ends[block]
+        elif code in starts:
+            stray += not 0 <= block < len(starts) or code != starts[block]
+        elif code == task["stim"]:
+            trial -= 1
+            if block >= 0 and trial >= 0:
+                labels[i] = (block, trial)
+    return labels, stray
+
+def Previous(position, length):
+    """Ensayo anterior a (bloque, ensayo) en el orden de la sesión"""
+    block, trial = position
+    return (block, trial - 1) if trial > 0 else (block - 1, length - 1)
+
+def MarkerRows(codes, markers, columns, blocks, length):
+    """
+    Fila de RESULTS de cada marcador (-1 si no pertenece a un ensayo completo).
+
+    Cada ensayo con feedback se ubica en la sesión contando marcadores: BLOCK_START
+    pasa al bloque siguiente de SESSION["blocks"] y STIM_START al ensayo siguiente del
+    bloque (length ensayos por bloque); la fila es la de (phase, block, trial) en el
+    CSV. Los tramos de la grabación empiezan en EXPERIMENT_START (antes del primer
+    bloque) o EXPERIMENT_RESUME, donde la tarea sigue tras el último ensayo con
+    feedback del tramo anterior (sin BLOCK_START si queda a mitad de bloque). Un tramo
+    sin ese punto de partida en la grabación (empieza al retomar) se cuenta hacia
+    atrás: desde la última fila completa del CSV si el tramo llega a EXPERIMENT_END, o
+    desde el primer ensayo del tramo siguiente. El feedback y la confianza de los
+    marcadores solo se comparan con la fila. Los marcadores de inicio de bloque toman
+    el ensayo siguiente; los de fin, el anterior.
+
+    Devuelve (filas, ensayos asignados, filas completas, claves de los ensayos que no
+    coinciden con su fila, ensayos con feedback sin ubicar, marcadores de bloque que
+    no siguen a SESSION).
+    """
+    complete = 0
+    while complete < len(columns.get("reward", [])) and columns["reward"][complete] != "":
+        complete += 1
+    keys = [(int(columns["phase"][i]), int(columns["block"][i]), int(columns["trial"][i])) for i in range(complete)]
+    lookup = {key: i for i, key in enumerate(keys)}
+    index = {(spec["phase"], spec["block"]): b for b, spec in enumerate(blocks)}
+    task = TaskCodes(markers, blocks)
+
+    restarts = (task["start"], task["resume"])
+    bounds = [0] + [i for i, code in enumerate(codes) if code in restarts and i > 0] + [len(codes)]
+    runs = [(lo, hi, RunTrials(codes, lo, hi, task)) for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+    # Hacia adelante: tramos con su punto de partida en la grabación
+    labels, stray, state = [None] * len(runs), 0, None
+    for r, (lo, hi, trials) in enumerate(runs):
+        first = codes[lo] if hi > lo else None
+        if first == task["start"]:
+            state = (-1, length)
+        elif first != task["resume"]:
+            state = None
+        if state is None:
+            continue
+        labels[r], count = CountForward(codes, lo, hi, state, task, length)
+        stray += count
+        done = [labels[r][t[0]] for t in trials if t[2] is not None and t[0] in labels[r]]
+        if done:
+            state = (done[-1][0], done[-1][1] + 1)
+    # Hacia atrás: el último tramo desde el fin del CSV y cada anterior desde el siguiente
+    anchor = None
+    if complete and keys[-1][:2] in index and runs and task["end"] in codes[runs[-1][0]:runs[-1][1]]:
+        anchor = (index[keys[-1][:2]], keys[-1][2])
+    for r in range(len(runs) - 1, -1, -1):
+        lo, hi, trials = runs[r]
+        done = [t for t in trials if t[2] is not None]
+        if labels[r] is None and done and anchor is not None:
+            labels[r], count = CountBackward(codes, lo, done[-1][0], anchor, task, length)
+            stray += count
+        first = min(labels[r]) if labels[r] else None
+        anchor = Previous(labels[r][first], length) if first is not None else None
+
+    rows = np.full(len(codes), -1, dtype=np.int64)
+    assigned, mismatches, unplaced = 0, [], 0
+    for r, (lo, hi, trials) in enumerate(runs):
+        for stim, members, feedback, level in trials:
+            if feedback is None:
+                continue   # Interrumpido: sin fila
+            position = labels[r].get(stim) if labels[r] else None
+            if position is None:
+                unplaced += 1
+                continue
+            spec = blocks[position[0]]
+            row = lookup.get((spec["phase"], spec["block"], position[1]))
+            if row is None:
+                unplaced += 1
+                continue
+            rows[members] = row
+            assigned += 1
+            if (str(feedback), str(level if level is not None else "")) != (columns["reward"][row], columns["confidence"][row]):
+                mismatches.append(keys[row])
+    # Marcadores de bloque: el ensayo siguiente (inicio) o el anterior (fin)
+    trials = np.flatnonzero(rows >= 0)
+    for i, code in enumerate(codes):
+        if code in task["starts"]:
+            after = trials[trials > i]
+            rows[i] = rows[after[0]] if after.size else -1
+        elif code in task["ends"]:
+            before = trials[trials < i]
+            rows[i] = rows[before[-1]] if before.size else -1
+    return rows, assigned, complete, mismatches, unplaced, stray
+
+def SampleOffsets(runs, samples):
+    """Posición en el archivo de los valores de cada muestra (índices de muestra de cualquier forma)"""
+    run = np.searchsorted(runs[:, 0], samples, side="right") - 1
+    return runs[run, 1] + (samples - runs[run, 0]) * runs[run, 2]
+
+def ExtractEpochs(path, stream, times, onsets, tmin, tmax, out):
+    """
+    Copia las ventanas [onset + tmin, onset + tmax) a un arreglo preasignado en disco
+    (épocas x muestras x canales, float32) leyendo solo esas muestras del XDF mapeado.
+    Devuelve (epochs, válidas).
+    """
+    srate, channels, width = stream["srate"], stream["channel_count"], stream["width"]
+    n = int(round((tmax - tmin) * srate))
+    epochs = np.lib.format.open_memmap(out, mode="w+", dtype=np.float32, shape=(len(onsets), n, channels))
+    first = np.searchsorted(times, onsets + tmin)
+    samples = first[:, None] + np.arange(n)
+    inside = (n > 0) & (first + n <= times.size) & (onsets + tmin >= times[0] if times.size else False)
+    # Ventanas sin cortes: empiezan a menos de un periodo del inicio pedido y su
+    # duración real no supera la nominal en más de un periodo
+    late, span = np.full(len(onsets), np.inf), np.full(len(onsets), np.inf)
+    late[inside] = times[first[inside]] - (onsets[inside] + tmin)
+    span[inside] = times[samples[inside, -1]] - times[first[inside]]
+    valid = inside & (late <= 1.0 / srate) & (span <= n / srate)
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    dtype = np.dtype(FORMATS[stream["format"]])
+    bytes_ = np.arange(width)
+    for start in range(0, len(onsets), EPOCH_BATCH):
+        batch = slice(start, start + EPOCH_BATCH)
+        ok = valid[batch]
+        block = np.full((ok.size, n, channels), np.nan, dtype=np.float32)
+        if ok.any():
+            offsets = SampleOffsets(stream["runs"], samples[batch][ok])
+            raw = data[offsets[..., None] + bytes_]
+            block[ok] = raw.view(dtype).reshape(-1, n, channels)
+        epochs[batch] = block
+    epochs.flush()
+    return epochs, valid
+
+def main():
+    parser = argparse.ArgumentParser(description="Épocas de EEG por marcador desde grabaciones XDF, unidas a RESULTS")
+    parser.add_argument("xdf")
+    parser.add_argument("--data", default=None, help="CSV de la sesión (<id>_data_<timestamp>.csv) para unir RESULTS")
+    parser.add_argument("--codes", type=int, nargs="+", default=None, help="Códigos de MARKERS (por defecto STIM_START)")
+    parser.add_argument("--tmin", type=float, default=-0.2)
+    parser.add_argument("--tmax", type=float, default=0.8)
+    parser.add_argument("--eeg-stream", default=None, help="Nombre del stream de EEG (por defecto el primero de tipo EEG)")
+    parser.add_argument("--no-sync", action="store_true", help="No aplicar los ClockOffset")
+    parser.add_argument("--reindex", action="store_true", help="Reconstruir el índice aunque el XDF no haya cambiado")
+    parser.add_argument("--out", default=None, help="Prefijo de salida (por defecto el del XDF + _epochs)")
+    args = parser.parse_args()
+
+    definitions = LoadDefinitions()
+    markers = definitions["MARKERS"]
+    names = {code: name for name, code in markers.items()}
+    codes = args.codes or [markers["STIM_START"]]
+    out = args.out or os.path.splitext(args.xdf)[0] + "_epochs"
+
+    t0 = time.perf_counter()
+    streams, reused = LoadIndex(args.xdf, force=args.reindex)
+    print(f"{'Loaded' if reused else 'Built'} index of {os.path.basename(args.xdf)} "
+          f"({os.path.getsize(args.xdf) / 1e6:.0f} MB, {len(streams)} streams) in {time.perf_counter() - t0:.2f} s")
+    marker_sid = FindStream(streams, name=MARKER_STREAM)
+    eeg_sid = FindStream(streams, name=args.eeg_stream) if args.eeg_stream else FindStream(streams, kind="EEG")
+    marker, eeg = streams[marker_sid], streams[eeg_sid]
+    if not eeg["width"] or eeg["srate"] <= 0:
+        raise ValueError(f"stream {eeg['name']} is not a regular numeric stream")
+    sync = (lambda s: s["times"]) if args.no_sync else SyncedTimes
+    marker_times, eeg_times = sync(marker), sync(eeg)
+    all_codes = marker["values"].astype(np.int64)
+    print(f"  {MARKER_STREAM}: {all_codes.size} markers; {eeg['name']}: {eeg['times'].size} samples, "
+          f"{eeg['channel_count']} channels at {eeg['srate']:g} Hz")
+
+    columns, rows = {}, np.full(all_codes.size, -1, dtype=np.int64)
+    if args.data:
+        columns = ReadSession(args.data)
+        session = definitions["SESSION"]
+        length = BlockDesign(definitions["STIMULUS"], session["items"])["item_cues"].size
+        rows, matched, complete, mismatches, unplaced, stray = MarkerRows(all_codes, markers, columns,
+                                                                          session["blocks"], length)
+        print(f"  {matched} of {complete} complete trials matched to markers by phase/block/trial")
+        if mismatches:
+            print(f"  ✗ {len(mismatches)} with feedback/confidence not matching RESULTS: " +
+                  ", ".join("{}.{}.{}".format(*key) for key in mismatches[:5]) + (" ..." if len(mismatches) > 5 else ""))
+        if unplaced:
+            print(f"  ✗ {unplaced} trials with feedback could not be placed in the session")
+        if stray:
+            print(f"  ✗ {stray} block markers do not follow SESSION")
+
+    selected = np.flatnonzero(np.isin(all_codes, codes))
+    t0 = time.perf_counter()
+    epochs, valid = ExtractEpochs(args.xdf, eeg, eeg_times, marker_times[selected], args.tmin, args.tmax, out + ".npy")
+    print(f"✓ {len(selected)} epochs ({int(valid.sum())} valid) of {epochs.shape[1]} samples "
+          f"in {time.perf_counter() - t0:.2f} s -> {out}.npy")
+
+    with open(out + ".csv", "w", newline="") as file:
+        w = csv.writer(file, delimiter=';')
+        w.writerow(["epoch", "code", "marker", "lsl_time", "valid", "row"] + list(columns))
+        for epoch, i in enumerate(selected):
+            row = int(rows[i])
+            w.writerow([epoch, all_codes[i], names.get(int(all_codes[i]), ""), f"{marker_times[i]:.6f}", int(valid[epoch]),
+                        row if row >= 0 else ""] + [values[row] if row >= 0 else "" for values in columns.values()])
+    with open(out + ".json", "w") as file:
+        json.dump({"xdf": os.path.basename(args.xdf), "data": args.data and os.path.basename(args.data),
+                   "eeg_stream": eeg["name"], "channels": list(eeg["labels"]), "srate": eeg["srate"],
+                   "tmin": args.tmin, "tmax": args.tmax, "samples": epochs.shape[1], "codes": codes,
+                   "synced": not args.no_sync}, file, indent=1)
+    print(f"✓ Saved {out}.csv and {out}.json")
+
+if __name__ == '__main__':
+    main()